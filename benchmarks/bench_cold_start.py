@@ -0,0 +1,52 @@
+"""
+Cold start of the live predictor: a fresh interpreter that imports
+live_predictor, loads the family detectors and builds one feature vector.
+Each run is a separate process so nothing is cached between them.
+
+    cd src && python ../benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUP = """
+import time
+t0 = time.perf_counter()
+import live_predictor
+t1 = time.perf_counter()
+model = live_predictor.load_model({model!r})
+t2 = time.perf_counter()
+from feature_extraction import FlowFeatureAccumulator
+FlowFeatureAccumulator().features()
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="family_detectors.pkl")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    stages = {"import": [], "load_model": [], "first_vector": [], "total": []}
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP.format(model=args.model)],
+                             capture_output=True, text=True, check=True)
+        total = time.perf_counter() - start
+        imp, load, first = map(float, out.stdout.split()[-3:])
+        stages["import"].append(imp)
+        stages["load_model"].append(load)
+        stages["first_vector"].append(first)
+        stages["total"].append(total)
+
+    for name, secs in stages.items():
+        print(f"{name:13s} median {statistics.median(secs) * 1000:9.1f} ms   "
+              f"min {min(secs) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Payload-entropy micro-benchmark on a payload-heavy synthetic capture.
+
+Compares the old pyshark-era path (hex string -> bytes.fromhex -> list of
+ints -> np.array), a np.bincount per packet, the buffered
+FlowFeatureAccumulator and grouped_payload_entropy (per-flow entropy for
+the whole batch in one bincount).
+
+    python benchmarks/bench_entropy.py --packets 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from feature_extraction import (FlowFeatureAccumulator, entropy_from_counts,  # noqa: E402
+                                grouped_payload_entropy, shannon_entropy)
+from pcap_reader import PacketInfo  # noqa: E402
+
+
+def make_packets(n, flows, min_size=200, max_size=1400, seed=0):
+    """TCP packets with random payloads spread over `flows` flows."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(min_size, max_size, size=n)
+    blob = rng.integers(0, 256, size=int(sizes.sum()), dtype=np.uint8).tobytes()
+    packets, off = [], 0
+    for i, size in enumerate(sizes):
+        payload = blob[off:off + size]
+        off += size
+        packets.append(PacketInfo(1.7e9 + i * 1e-3, int(size) + 54, int(size) + 40, "TCP",
+                                  "·······AP···", payload, b"\x0a\x00\x00\x01",
+                                  b"\x0a\x00\x00\x02", 6, 40000 + i % flows, 502))
+    return packets
+
+
+def old_path(hex_payloads):
+    payload_bytes = []
+    for raw in hex_payloads:
+        payload_bytes.extend(bytes.fromhex(raw.replace(':', '')))
+    return shannon_entropy(np.array(payload_bytes, dtype=np.uint8))
+
+
+def per_packet_bincount(packets):
+    counts = np.zeros(256, dtype=np.int64)
+    for pkt in packets:
+        counts += np.bincount(np.frombuffer(pkt.payload, dtype=np.uint8), minlength=256)
+    return entropy_from_counts(counts)
+
+
+def accumulator(packets):
+    acc = FlowFeatureAccumulator()
+    for pkt in packets:
+        acc.add(pkt)
+    return acc.features()[8]
+
+
+def per_flow_accumulators(packets):
+    accs = {}
+    for pkt in packets:
+        acc = accs.get(pkt.sport)
+        if acc is None:
+            acc = accs[pkt.sport] = FlowFeatureAccumulator()
+        acc.add(pkt)
+    return {k: acc.features()[8] for k, acc in accs.items()}
+
+
+def grouped(packets):
+    return grouped_payload_entropy([p.payload for p in packets], [p.sport for p in packets])
+
+
+def timed(fn, arg, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--min-size", type=int, default=200, help="smallest payload (bytes)")
+    parser.add_argument("--max-size", type=int, default=1400, help="largest payload (bytes)")
+    args = parser.parse_args()
+
+    packets = make_packets(args.packets, args.flows, args.min_size, args.max_size)
+    hex_payloads = [p.payload.hex(":") for p in packets]
+    mb = sum(len(p.payload) for p in packets) / 1e6
+    print(f"{len(packets)} packets, {mb:.1f} MB of payload, {args.flows} flows")
+
+    ref, secs = timed(old_path, hex_payloads)
+    print(f"old hex/list path      {mb / secs:8.1f} MB/s   entropy {ref:.6f}")
+    for name, fn in (("bincount per packet", per_packet_bincount), ("buffered accumulator", accumulator)):
+        value, secs = timed(fn, packets)
+        print(f"{name:22s} {mb / secs:8.1f} MB/s   |Δ| {abs(value - ref):.1e}")
+
+    ref_flows, secs = timed(per_flow_accumulators, packets)
+    print(f"per-flow accumulators  {mb / secs:8.1f} MB/s")
+    flows, secs = timed(grouped, packets)
+    diff = max(abs(flows[k] - ref_flows[k]) for k in ref_flows)
+    print(f"grouped (one pass)     {mb / secs:8.1f} MB/s   max |Δ| vs accumulators {diff:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+IoC matching micro-benchmark on the synthetic IIoT capture.
+
+Writes random feeds (CIDR blocks of mixed prefix lengths, address:port
+pairs and payload signatures, plus a few that hit the synthetic traffic),
+then reports the feed build time, the address match cost per packet (warm
+and cold cache), the signature scan over the payload bytes in the 4 KB
+batches FlowFeatureAccumulator hands it, and what the engine adds to the
+feature loop.
+
+    python benchmarks/bench_ioc.py --packets 200000 --networks 100000 --signatures 2000
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+import ioc_engine  # noqa: E402
+from feature_extraction import PAYLOAD_FLUSH_BYTES, FlowFeatureAccumulator  # noqa: E402
+from pcap_reader import read_packets  # noqa: E402
+from run_suite import synthetic_capture  # noqa: E402
+from synth_pcap import DEFAULT_MIX  # noqa: E402
+
+# Prefix lengths of the random blocks, weighted like public blocklists (mostly hosts and /24s)
+PREFIX_WEIGHTS = {32: 60, 24: 25, 22: 5, 20: 4, 16: 4, 12: 2}
+
+
+def write_feeds(feeds_dir, networks, endpoints, signatures, seed=0):
+    """Random feeds in ioc/c2/exfil files; returns the number of indicators written."""
+    rng = random.Random(seed)
+    lengths = rng.choices(list(PREFIX_WEIGHTS), list(PREFIX_WEIGHTS.values()), k=networks)
+
+    def rand_ip():
+        # Stay clear of 10/8, where the synthetic devices live
+        return socket.inet_ntoa(bytes((rng.randint(11, 223), *rng.randbytes(3))))
+
+    with open(os.path.join(feeds_dir, "ioc_blocklist.txt"), "w") as f:
+        f.write("# synthetic blocklist\n10.0.0.7\n")
+        for plen in lengths:
+            f.write(f"{rand_ip()}/{plen}\n")
+    with open(os.path.join(feeds_dir, "c2_endpoints.txt"), "w") as f:
+        f.write("10.0.0.2:1883\n")     # the synthetic MQTT broker
+        for _ in range(endpoints):
+            f.write(f"{rand_ip()}:{rng.randint(1, 65535)}\n")
+    with open(os.path.join(feeds_dir, "exfil_signatures.txt"), "w") as f:
+        f.write("str:plant/boiler/state\n")
+        for _ in range(signatures):
+            f.write(f"hex:{rng.randbytes(rng.randint(6, 16)).hex()}\n")
+    return networks + endpoints + signatures + 3
+
+
+def best_of(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def match_all(engine, packets):
+    hits = 0
+    match = engine.match
+    for pkt in packets:
+        if match(pkt):
+            hits += 1
+    return hits
+
+
+def accumulate(packets):
+    acc = FlowFeatureAccumulator()
+    for pkt in packets:
+        acc.add(pkt)
+    return acc.ioc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=200_000)
+    parser.add_argument("--networks", type=int, default=100_000, help="random CIDR blocks")
+    parser.add_argument("--endpoints", type=int, default=20_000, help="random address:port pairs")
+    parser.add_argument("--signatures", type=int, default=2_000, help="random payload signatures")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    packets = list(read_packets(synthetic_capture(args.packets, args.seed, DEFAULT_MIX)))
+    payloads = [p.payload for p in packets if p.payload]
+    print(f"{len(packets)} packets ({len(payloads)} with TCP or UDP payload)")
+
+    with tempfile.TemporaryDirectory() as feeds_dir:
+        n = write_feeds(feeds_dir, args.networks, args.endpoints, args.signatures, args.seed)
+        engine, secs = best_of(lambda: ioc_engine.load_feeds(feeds_dir), 1)
+    print(f"build       {n:,} indicators in {secs:.2f}s  {engine.stats()}")
+
+    hits, secs = best_of(lambda: match_all(engine, packets), args.repeat)
+    print(f"match       {secs / len(packets) * 1e9:7.0f} ns/pkt  {len(packets) / secs / 1e6:5.2f} M pkt/s"
+          f"  ({hits} packets hit)")
+
+    def cold():
+        engine.addr_cache.clear()
+        return match_all(engine, packets)
+
+    _, secs = best_of(cold, args.repeat)
+    print(f"cold cache  {secs / len(packets) * 1e9:7.0f} ns/pkt  {len(packets) / secs / 1e6:5.2f} M pkt/s"
+          f"  ({len(engine.addr_cache)} distinct addresses)")
+
+    rng = random.Random(args.seed)
+    addrs = [rng.randbytes(4) for _ in range(len(packets))]
+
+    def uncached():
+        lookup = engine.lookup_address
+        engine.addr_cache.clear()
+        for addr in addrs:
+            lookup(addr)
+
+    _, secs = best_of(uncached, args.repeat)
+    print(f"addr miss   {secs / len(addrs) * 1e9:7.0f} ns/lookup over "
+          f"{len(engine.networks[4])} prefix lengths (every address new)")
+
+    if engine.signatures and payloads:
+        data = b"".join(payloads)
+        step = PAYLOAD_FLUSH_BYTES
+        chunks = [bytearray(data[i:i + step]) for i in range(0, len(data), step)]
+        _, secs = best_of(lambda: [engine.match_payload(c) for c in chunks], args.repeat)
+        print(f"signatures  {secs / len(payloads) * 1e9:7.0f} ns/payload  {len(data) / secs / 1e6:7.1f} MB/s")
+
+    ioc_engine.ENGINE = None
+    _, base = best_of(lambda: accumulate(packets), args.repeat)
+    ioc_engine.ENGINE = engine
+    bits, secs = best_of(lambda: accumulate(packets), args.repeat)
+    print(f"features    {len(packets) / base / 1e3:7.0f} k pkt/s without feeds, "
+          f"{len(packets) / secs / 1e3:.0f} k pkt/s with feeds "
+          f"(+{(secs - base) / len(packets) * 1e9:.0f} ns/pkt, bits {bits:03b})")
+
+
+if __name__ == "__main__":
+    main()
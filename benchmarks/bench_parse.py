@@ -0,0 +1,64 @@
+"""
+Compare the pyshark and native capture backends of extract_features_full.
+
+For every pcap given on the command line this checks that both backends
+produce the same feature vector and reports packets/second for each.
+
+    python benchmarks/bench_parse.py capture1.pcap capture2.pcapng
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from feature_extraction import extract_features_full, iter_packets  # noqa: E402
+
+BACKENDS = ("pyshark", "native")
+
+
+def time_backend(pcap_file, backend):
+    """Return (packets, parse_seconds, feature_vector) for one backend."""
+    start = time.perf_counter()
+    n = sum(1 for _ in iter_packets(pcap_file, backend))
+    parse_s = time.perf_counter() - start
+    feats = extract_features_full(pcap_file, backend=backend)
+    return n, parse_s, feats
+
+
+def vectors_match(a, b, rel_tol=1e-9, abs_tol=1e-9):
+    return len(a) == len(b) and all(
+        math.isclose(x, y, rel_tol=rel_tol, abs_tol=abs_tol) for x, y in zip(a, b)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pcaps", nargs="+")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    mismatches = 0
+    for pcap in args.pcaps:
+        results = {}
+        for backend in args.backends:
+            n, secs, feats = time_backend(pcap, backend)
+            results[backend] = feats
+            pps = n / secs if secs > 0 else float("inf")
+            print(f"{pcap}  {backend:8s} {n:10d} pkts  {secs:8.3f}s  {pps:12.0f} pkts/s")
+        if len(results) == 2:
+            if vectors_match(results["pyshark"], results["native"]):
+                print(f"{pcap}  feature vectors match")
+            else:
+                mismatches += 1
+                print(f"[!] {pcap}  feature vectors differ:")
+                for i, (x, y) in enumerate(zip(results["pyshark"], results["native"])):
+                    if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9):
+                        print(f"    [{i}] pyshark={x!r} native={y!r}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Rows/second of the family detectors: the old one-row-at-a-time predict()
+loop against FamilyDetectors.predict_batch and the fused predictor.
+
+    python benchmarks/bench_predict.py --model src/family_detectors.pkl --rows 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from family_model import FamilyDetectors, fuse  # noqa: E402
+
+
+def loop_predict(X, model_dict):
+    """The pre-batching predict(): reshape one row, predict_proba per family."""
+    out = []
+    for row in X:
+        arr = np.array(row).reshape(1, -1)
+        probs = {}
+        for family, clf in model_dict.items():
+            p = clf.predict_proba(arr)[0]
+            pos_idx = list(clf.classes_).index(1)
+            probs[family] = float(p[pos_idx])
+        out.append([probs[f] for f in model_dict])
+    return np.array(out)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="family_detectors.pkl")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--loop-rows", type=int, default=200,
+                        help="rows for the slow per-row loop (extrapolated)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model_dict = joblib.load(args.model)
+    if isinstance(model_dict, FamilyDetectors):
+        model_dict = model_dict.models
+    n_features = next(iter(model_dict.values())).n_features_in_
+    X = np.random.default_rng(args.seed).normal(size=(args.rows, n_features))
+
+    ref, loop_s = timed(loop_predict, X[:args.loop_rows], model_dict)
+    print(f"loop      {args.loop_rows / loop_s:12.0f} rows/s")
+
+    for name, detectors in (("batch", FamilyDetectors(model_dict)), ("fused", fuse(model_dict))):
+        (_, probs), secs = timed(detectors.predict_batch, X)
+        diff = float(np.max(np.abs(probs[:args.loop_rows] - ref)))
+        print(f"{name:8s}  {args.rows / secs:12.0f} rows/s   max |Δp| vs loop = {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
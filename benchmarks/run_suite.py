@@ -0,0 +1,273 @@
+"""
+End-to-end benchmark suite with a regression gate.
+
+Generates (and caches) a deterministic synthetic capture, then times each
+stage of the pipeline:
+
+    parse      native pcap decoding                  pkt/s
+    features   extract_features_full                 pkt/s
+    flows      extract_flow_features                 pkt/s
+    predict    fused predict_batch on flow rows      rows/s   (needs --model)
+    mongo      BatchedMongoWriter put + flush        docs/s   (local stand-in)
+    api        /api/latest, /api/anomalies           req/s, p50/p95 ms per endpoint
+
+The capture stages keep the best of --repeat runs.
+Results are written as JSON. With --baseline, any stage whose throughput
+fell by more than --max-regression percent fails the run (exit code 1).
+
+    python benchmarks/run_suite.py --packets 100000 --model src/family_detectors.pkl --out bench.json
+    python benchmarks/run_suite.py --packets 100000 --baseline bench.json --max-regression 10
+
+The Mongo and API stages run against mongomock unless --mongo-uri points
+at a local mongod; both are skipped when neither is available.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from feature_extraction import extract_features_full  # noqa: E402
+from flow_table import extract_flow_features  # noqa: E402
+from pcap_reader import read_packets  # noqa: E402
+from synth_pcap import DEFAULT_MIX, parse_mix, write_synthetic_pcap  # noqa: E402
+
+DATA_DIR = os.path.join(HERE, "data")
+STAGES = ("parse", "features", "flows", "predict", "mongo", "api")
+API_ENDPOINTS = {"api_latest": "/api/latest", "api_anomalies": "/api/anomalies?limit=50"}
+
+
+def synthetic_capture(packets, seed, mix):
+    """Path of the cached synthetic capture for these parameters, generating it if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tag = "_".join(f"{k}{v:g}" for k, v in sorted(mix.items()))
+    path = os.path.join(DATA_DIR, f"synth_{packets}_{seed}_{tag}.pcap")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        write_synthetic_pcap(path + ".tmp", packets, seed, mix)
+        os.replace(path + ".tmp", path)
+        print(f"[+] Generated {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def result(count, seconds, unit, **extra):
+    return {"count": count, "seconds": round(seconds, 4),
+            "throughput": round(count / seconds, 1) if seconds else None, "unit": unit, **extra}
+
+
+def best_of(repeat, fn, *args):
+    """(result of the last call, fastest wall time) over `repeat` calls."""
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def bench_parse(pcap, repeat):
+    n, secs = best_of(repeat, lambda: sum(1 for _ in read_packets(pcap)))
+    return result(n, secs, "pkt/s")
+
+
+def bench_features(pcap, packets, repeat):
+    _, secs = best_of(repeat, extract_features_full, pcap)
+    return result(packets, secs, "pkt/s")
+
+
+def bench_flows(pcap, packets, repeat):
+    (keys, rows), secs = best_of(repeat, extract_flow_features, pcap)
+    return result(packets, secs, "pkt/s", flows=len(keys)), rows
+
+
+def bench_predict(model_path, rows, n_rows, repeat):
+    from family_model import load_detectors
+
+    start = time.perf_counter()
+    detectors = load_detectors(model_path)
+    load_s = time.perf_counter() - start
+    X = [rows[i % len(rows)] for i in range(n_rows)]
+    detectors.predict_batch(X[:10])     # warm-up
+    _, secs = best_of(repeat, detectors.predict_batch, X)
+    return result(n_rows, secs, "rows/s", load_seconds=round(load_s, 4))
+
+
+def sample_record(i, families=("Benign", "Botnet", "Worm")):
+    probs = {f: (i * 7 + j * 13) % 100 / 100 for j, f in enumerate(families)}
+    label = max(probs, key=probs.get)
+    return {"timestamp": datetime.fromtimestamp(1.7e9 + i, timezone.utc), "interface": "bench",
+            "label": label, "probability": probs[label], "probabilities": probs}
+
+
+def mongo_collection(uri, name):
+    """A collection on the local stand-in: a real mongod at `uri`, else mongomock."""
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri)["wids_bench"][name]
+    import mongomock
+    return mongomock.MongoClient()["wids_bench"][name]
+
+
+def bench_mongo(uri, n_docs):
+    from mongo_writer import BatchedMongoWriter
+
+    collection = mongo_collection(uri, "predictions")
+    collection.delete_many({})
+    writer = BatchedMongoWriter(collection, max_queue=n_docs + 1, log_interval=1e9)
+    start = time.perf_counter()
+    for i in range(n_docs):
+        writer.put(sample_record(i))
+    writer.close()
+    secs = time.perf_counter() - start
+    stats = writer.stats()
+    return result(stats["inserted"], secs, "docs/s", flushes=stats["flushes"],
+                  avg_flush_ms=round((stats["avg_flush_latency"] or 0) * 1000, 2))
+
+
+def bench_api(n_requests, n_anomalies):
+    """
+    Latency of the read endpoints through Flask's test client, with app.py's
+    collections on mongomock (so absolute numbers include mongomock's own
+    overhead; compare runs against each other).
+    """
+    import mongomock
+
+    latest_file = os.path.join(tempfile.mkdtemp(), "latest.json")
+    os.environ.update({"LATEST_FILE": latest_file, "MONGO_URI": "mongodb://localhost:27017",
+                       "DB_NAME": "wids_bench", "COLLECTION": "predictions"})
+    import latest_channel
+    latest_channel.publish(sample_record(0), latest_file)
+    with mongomock.patch(servers=(("localhost", 27017),)):
+        import app as api
+
+        api.latest_channels.get().refresh()
+        api.col_anomalies.delete_many({})
+        api.col_anomalies.insert_many(
+            [{**sample_record(i), "anomaly_families": ["Worm"], "anomaly_probs": {"Worm": 0.9}}
+             for i in range(n_anomalies)])
+        client = api.app.test_client()
+        stages = {}
+        for stage, path in API_ENDPOINTS.items():
+            times = []
+            for _ in range(n_requests):
+                start = time.perf_counter()
+                resp = client.get(path)
+                times.append(time.perf_counter() - start)
+                assert resp.status_code == 200, (path, resp.status_code)
+            times.sort()
+            stages[stage] = result(n_requests, sum(times), "req/s", path=path,
+                                   p50_ms=round(statistics.median(times) * 1000, 3),
+                                   p95_ms=round(times[int(n_requests * 0.95) - 1] * 1000, 3))
+    return stages
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check_regressions(current, baseline, max_regression):
+    """Return a message for every stage whose throughput fell by more than max_regression %."""
+    failures = []
+    for stage, res in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("throughput") or not res.get("throughput"):
+            continue
+        change = (res["throughput"] - old["throughput"]) / old["throughput"] * 100
+        res["change_pct"] = round(change, 1)
+        if change < -max_regression:
+            failures.append(f"{stage}: {old['throughput']:,.0f} → {res['throughput']:,.0f} "
+                            f"{res['unit']} ({change:+.1f}%)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=100_000, help="synthetic capture size (10k-10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--pcap", help="benchmark this capture instead of a synthetic one")
+    parser.add_argument("--model", default=None, help="family_detectors.pkl for the predict stage")
+    parser.add_argument("--predict-rows", type=int, default=50_000)
+    parser.add_argument("--mongo-uri", default=None, help="local mongod (default: mongomock)")
+    parser.add_argument("--mongo-docs", type=int, default=20_000)
+    parser.add_argument("--api-requests", type=int, default=200)
+    parser.add_argument("--anomalies", type=int, default=1_000, help="anomaly docs behind the API stage")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per capture/predict stage (best kept)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0,
+                        help="fail if a stage's throughput drops by more than this percent")
+    args = parser.parse_args()
+
+    pcap = args.pcap or synthetic_capture(args.packets, args.seed, args.mix)
+    report = {
+        "meta": {"when": datetime.now(timezone.utc).isoformat(), "commit": git_commit(),
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "pcap": os.path.basename(pcap),
+                 "packets": args.packets, "seed": args.seed, "mix": args.mix},
+        "stages": {},
+    }
+    stages = report["stages"]
+
+    if "parse" in args.stages:
+        stages["parse"] = bench_parse(pcap, args.repeat)
+        packets = stages["parse"]["count"]
+    else:
+        packets = sum(1 for _ in read_packets(pcap))
+    if "features" in args.stages:
+        stages["features"] = bench_features(pcap, packets, args.repeat)
+    rows = None
+    if "flows" in args.stages or "predict" in args.stages:
+        flows, rows = bench_flows(pcap, packets, args.repeat)
+        if "flows" in args.stages:
+            stages["flows"] = flows
+    if "predict" in args.stages:
+        if args.model and os.path.exists(args.model) and rows:
+            stages["predict"] = bench_predict(args.model, rows, args.predict_rows, args.repeat)
+        else:
+            print("[!] predict: skipped (pass --model family_detectors.pkl)")
+    for stage, run in (("mongo", lambda: {"mongo": bench_mongo(args.mongo_uri, args.mongo_docs)}),
+                       ("api", lambda: bench_api(args.api_requests, args.anomalies))):
+        if stage not in args.stages:
+            continue
+        try:
+            stages.update(run())
+        except ImportError as e:
+            print(f"[!] {stage}: skipped ({e})")
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = check_regressions(report, json.load(f), args.max_regression)
+
+    for stage, res in stages.items():
+        change = f"  {res['change_pct']:+.1f}%" if "change_pct" in res else ""
+        print(f"{stage:14s} {res['throughput']:14,.1f} {res['unit']:7s}{change}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Results → {args.out}")
+    if failures:
+        print(f"[!] Throughput regressions beyond {args.max_regression}%:")
+        for line in failures:
+            print(f"    {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
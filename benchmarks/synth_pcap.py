@@ -0,0 +1,144 @@
+"""
+Deterministic synthetic IIoT captures for the benchmarks.
+
+Writes a libpcap file of Ethernet/IPv4 traffic between a few dozen field
+devices and their controllers: Modbus/TCP polling (requests, responses,
+bare ACKs), MQTT publishes, UDP telemetry/CoAP and ICMP echo. The same
+(packets, seed, mix) always produces byte-identical output.
+
+    python benchmarks/synth_pcap.py out.pcap --packets 1000000 --mix modbus=0.6,mqtt=0.25,udp=0.1,icmp=0.05
+"""
+import argparse
+import random
+import struct
+
+DEFAULT_MIX = {"modbus": 0.55, "mqtt": 0.25, "udp": 0.15, "icmp": 0.05}
+DEVICES = 40
+START_TS = 1_700_000_000.0
+MEAN_GAP = 0.0005             # mean inter-arrival time (s)
+
+_ETH = b"\x02\x00\x00\x00\x00\x01" + b"\x02\x00\x00\x00\x00\x02" + b"\x08\x00"
+_IP = struct.Struct("!BBHHHBBH4s4s")
+_TCP = struct.Struct("!HHIIBBHHH")
+_UDP = struct.Struct("!HHHH")
+_REC = struct.Struct("<IIII")
+
+PSH_ACK, ACK = 0x18, 0x10
+MQTT_TOPICS = [b"plant/line1/temp", b"plant/line1/pressure", b"plant/line2/vibration",
+               b"plant/boiler/state", b"plant/meter/kwh"]
+
+
+def parse_mix(text):
+    """'modbus=0.6,mqtt=0.4' -> {'modbus': 0.6, 'mqtt': 0.4}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"unknown traffic type {name!r}; choose from {tuple(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def _host(i):
+    return bytes((10, 0, i // 250, i % 250 + 1))
+
+
+def _ip(proto, src, dst, body, ident):
+    return _IP.pack(0x45, 0, 20 + len(body), ident & 0xFFFF, 0, 64, proto, 0, src, dst) + body
+
+
+def _tcp(sport, dport, seq, flags, payload=b""):
+    return _TCP.pack(sport, dport, seq, 0, 5 << 4, flags, 8192, 0, 0) + payload
+
+
+def _udp(sport, dport, payload):
+    return _UDP.pack(sport, dport, 8 + len(payload), 0) + payload
+
+
+class _Generator:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.ident = 0
+        self.hmi = _host(0)
+        self.broker = _host(1)
+        self.devices = [_host(i) for i in range(2, DEVICES + 2)]
+
+    def modbus(self):
+        rng = self.rng
+        dev = rng.randrange(len(self.devices))
+        plc, sport = self.devices[dev], 40000 + dev
+        kind = rng.random()
+        if kind < 0.4:      # read holding registers request
+            pdu = struct.pack("!BHH", 3, rng.randrange(100), rng.randint(1, 16))
+            mbap = struct.pack("!HHHB", self.ident & 0xFFFF, 0, len(pdu) + 1, 1)
+            return _ip(6, self.hmi, plc, _tcp(sport, 502, self.ident, PSH_ACK, mbap + pdu), self.ident)
+        if kind < 0.8:      # response with register values
+            count = rng.randint(1, 16)
+            pdu = struct.pack("!BB", 3, 2 * count) + bytes(rng.getrandbits(8) for _ in range(2 * count))
+            mbap = struct.pack("!HHHB", self.ident & 0xFFFF, 0, len(pdu) + 1, 1)
+            return _ip(6, plc, self.hmi, _tcp(502, sport, self.ident, PSH_ACK, mbap + pdu), self.ident)
+        return _ip(6, self.hmi, plc, _tcp(sport, 502, self.ident, ACK), self.ident)
+
+    def mqtt(self):
+        rng = self.rng
+        dev = rng.randrange(len(self.devices))
+        topic = MQTT_TOPICS[dev % len(MQTT_TOPICS)]
+        value = f"{{\"v\":{rng.uniform(0, 500):.2f},\"seq\":{self.ident}}}".encode()
+        body = struct.pack("!H", len(topic)) + topic + value
+        payload = bytes((0x30, len(body))) + body
+        return _ip(6, self.devices[dev], self.broker, _tcp(50000 + dev, 1883, self.ident, PSH_ACK, payload),
+                   self.ident)
+
+    def udp(self):
+        rng = self.rng
+        dev = rng.randrange(len(self.devices))
+        if rng.random() < 0.5:  # CoAP GET
+            payload = bytes((0x40, 0x01)) + struct.pack("!H", self.ident & 0xFFFF) + b"\xb4temp"
+            return _ip(17, self.hmi, self.devices[dev], _udp(45000 + dev, 5683, payload), self.ident)
+        payload = bytes(rng.getrandbits(8) for _ in range(rng.randint(16, 96)))
+        return _ip(17, self.devices[dev], self.hmi, _udp(47808, 47808, payload), self.ident)
+
+    def icmp(self):
+        dev = self.rng.randrange(len(self.devices))
+        body = struct.pack("!BBHHH", 8, 0, 0, 1, self.ident & 0xFFFF) + b"\x00" * 32
+        return _ip(1, self.hmi, self.devices[dev], body, self.ident)
+
+
+def write_synthetic_pcap(path, packets=10_000, seed=0, mix=None):
+    """Write `packets` synthetic frames to `path`; returns the bytes written."""
+    mix = mix or DEFAULT_MIX
+    gen = _Generator(seed)
+    kinds = [getattr(gen, name) for name in mix]
+    weights = list(mix.values())
+    rng = gen.rng
+    ts = START_TS
+    written = 24
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for make in rng.choices(kinds, weights, k=packets):
+            gen.ident += 1
+            ts += rng.expovariate(1 / MEAN_GAP)
+            frame = _ETH + make()
+            if len(frame) < 60:
+                frame += b"\x00" * (60 - len(frame))
+            sec = int(ts)
+            f.write(_REC.pack(sec, int((ts - sec) * 1e6), len(frame), len(frame)))
+            f.write(frame)
+            written += 16 + len(frame)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out")
+    parser.add_argument("--packets", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="traffic weights, e.g. modbus=0.6,mqtt=0.25,udp=0.1,icmp=0.05")
+    args = parser.parse_args()
+    size = write_synthetic_pcap(args.out, args.packets, args.seed, args.mix)
+    print(f"[+] {args.packets} packets, {size / 1e6:.1f} MB → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Parallel hyperparameter search with asynchronous successive halving (ASHA).
+
+Trials run in a process pool. Every configuration starts at the smallest
+budget (epochs); whenever a worker frees up, the best 1/eta of the
+configurations finished at a rung are promoted to the next budget and the
+rest are never trained further. Results are checkpointed to a JSON file
+after every finished job, so an interrupted search resumes where it
+stopped (jobs that were running are simply rerun).
+
+The objective is a module-level function (workers are spawned, so it must
+be importable) returning a loss to minimize:
+
+    def objective(params, budget, prev_budget, trial_dir): ...
+
+`trial_dir` persists across the rungs of one configuration, so an
+objective may save its model there and continue from `prev_budget`
+instead of retraining from scratch.
+
+    space = {"n_hidden": ("quniform", 64, 512, 16), "lr": ("loguniform", 1e-4, 1e-2)}
+    best = asha_search(objective, space, "search.json", max_trials=30, workers=4)
+"""
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+
+CHECKPOINT_VERSION = 1
+
+
+def sample(space, rng):
+    """One configuration from {name: (kind, *args)}; kinds mirror hyperopt's hp.*."""
+    params = {}
+    for name, (kind, *args) in space.items():
+        if kind == "uniform":
+            params[name] = rng.uniform(*args)
+        elif kind == "loguniform":
+            lo, hi = args
+            params[name] = math.exp(rng.uniform(math.log(lo), math.log(hi)))
+        elif kind == "quniform":
+            lo, hi, q = args
+            params[name] = round(rng.uniform(lo, hi) / q) * q
+        elif kind == "choice":
+            params[name] = rng.choice(args[0])
+        else:
+            raise ValueError(f"{name}: unknown distribution {kind!r}")
+    return params
+
+
+def rung_budgets(min_budget, max_budget, eta):
+    budgets = [min_budget]
+    while budgets[-1] * eta <= max_budget:
+        budgets.append(budgets[-1] * eta)
+    return budgets
+
+
+THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+               "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
+
+
+@contextmanager
+def _limit_threads(n):
+    """
+    Keep the math libraries of processes started inside the block to `n`
+    threads. Spawned workers import numpy & co. while unpickling their
+    first task, before any pool initializer runs, and those libraries read
+    the variables only once at load, so they must already be in the
+    environment the workers inherit. The parent's values are restored on exit.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_VARS}
+    os.environ.update({var: str(n) for var in THREAD_VARS})
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _run_job(objective, params, budget, prev_budget, trial_dir):
+    start = time.perf_counter()
+    os.makedirs(trial_dir, exist_ok=True)
+    loss = float(objective(params, budget, prev_budget, trial_dir))
+    return loss, time.perf_counter() - start
+
+
+class ASHA:
+    """Search state: trials, their per-rung losses and the promotion rule."""
+
+    def __init__(self, space, budgets, eta, max_trials, seed, checkpoint):
+        self.space = space
+        self.budgets = budgets
+        self.eta = eta
+        self.max_trials = max_trials
+        self.seed = seed
+        self.checkpoint = checkpoint
+        self.trials = []            # {"id", "params", "losses": {budget: loss}, "seconds"}
+        self.running = set()        # (trial id, rung)
+
+    # ── checkpoint ───────────────────────────────────────────────────
+    def config(self):
+        return {"space": self.space, "budgets": self.budgets, "eta": self.eta,
+                "max_trials": self.max_trials, "seed": self.seed}
+
+    def save(self):
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CHECKPOINT_VERSION, "config": self.config(),
+                       "trials": self.trials}, f, indent=1)
+        os.replace(tmp, self.checkpoint)
+
+    def resume(self):
+        if not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{self.checkpoint}: checkpoint v{saved.get('version')}, "
+                             f"expected v{CHECKPOINT_VERSION}")
+        # JSON turns tuples into lists; compare in that form
+        if saved["config"] != json.loads(json.dumps(self.config())):
+            raise ValueError(f"{self.checkpoint} was written by a different search; "
+                             f"use another path or delete it")
+        self.trials = saved["trials"]
+        return sum(len(t["losses"]) for t in self.trials)
+
+    # ── scheduling ───────────────────────────────────────────────────
+    def _loss(self, trial, rung):
+        return trial["losses"].get(str(self.budgets[rung]))
+
+    def next_job(self):
+        """(trial, rung) to run next: a promotion if one is due, else a new trial, else None."""
+        for rung in range(len(self.budgets) - 2, -1, -1):
+            done = [t for t in self.trials if self._loss(t, rung) is not None]
+            n_promote = len(done) // self.eta
+            if not n_promote:
+                continue
+            top = sorted(done, key=lambda t: self._loss(t, rung))[:n_promote]
+            for t in top:
+                if (self._loss(t, rung + 1) is None and (t["id"], rung + 1) not in self.running
+                        and math.isfinite(self._loss(t, rung))):
+                    return t, rung + 1
+        # Resume trials whose first rung never finished, then sample new ones
+        for t in self.trials:
+            if not t["losses"] and (t["id"], 0) not in self.running:
+                return t, 0
+        if len(self.trials) < self.max_trials:
+            tid = len(self.trials)
+            # Seeded per trial id, so a resumed search samples the same configurations
+            trial = {"id": tid, "params": sample(self.space, random.Random(f"{self.seed}-{tid}")),
+                     "losses": {}, "seconds": 0.0}
+            self.trials.append(trial)
+            return trial, 0
+        return None
+
+    def record(self, trial, rung, loss, seconds):
+        trial["losses"][str(self.budgets[rung])] = loss
+        trial["seconds"] += seconds
+        self.save()
+
+    def best(self):
+        """Best trial at the highest rung any trial reached."""
+        for rung in range(len(self.budgets) - 1, -1, -1):
+            done = [t for t in self.trials if self._loss(t, rung) is not None
+                    and math.isfinite(self._loss(t, rung))]
+            if done:
+                t = min(done, key=lambda t: self._loss(t, rung))
+                return {"id": t["id"], "params": t["params"], "loss": self._loss(t, rung),
+                        "budget": self.budgets[rung]}
+        return None
+
+
+def asha_search(objective, space, checkpoint, max_trials=30, min_budget=1, max_budget=9, eta=3,
+                workers=None, threads_per_worker=1, seed=0, trial_root=None):
+    """
+    Run (or resume) an ASHA search and return the best
+    {"id", "params", "loss", "budget"}. `workers` defaults to the CPU count.
+    """
+    workers = workers or os.cpu_count() or 1
+    trial_root = trial_root or os.path.splitext(checkpoint)[0] + "_trials"
+    state = ASHA(space, rung_budgets(min_budget, max_budget, eta), eta, max_trials, seed, checkpoint)
+    resumed = state.resume()
+    if resumed:
+        print(f"[+] Resuming {checkpoint}: {len(state.trials)} trials, {resumed} rung results")
+    print(f"[+] ASHA: up to {max_trials} trials, budgets {state.budgets}, eta {eta}, {workers} workers")
+
+    start = time.perf_counter()
+    pending = {}
+    # workers are started lazily on submit, so the limit stays set for the whole search
+    with _limit_threads(threads_per_worker), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        while True:
+            while len(pending) < workers:
+                job = state.next_job()
+                if job is None:
+                    break
+                trial, rung = job
+                prev = state.budgets[rung - 1] if rung else 0
+                trial_dir = os.path.join(trial_root, f"trial_{trial['id']:04d}")
+                fut = pool.submit(_run_job, objective, trial["params"], state.budgets[rung], prev, trial_dir)
+                pending[fut] = (trial, rung)
+                state.running.add((trial["id"], rung))
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                trial, rung = pending.pop(fut)
+                state.running.discard((trial["id"], rung))
+                try:
+                    loss, secs = fut.result()
+                except Exception as e:
+                    print(f"[!] trial {trial['id']} budget {state.budgets[rung]} failed: {e}")
+                    loss, secs = float("inf"), 0.0
+                state.record(trial, rung, loss, secs)
+                print(f"[+] trial {trial['id']:3d} budget {state.budgets[rung]:3g}  loss {loss:.4f}  "
+                      f"{secs:6.1f}s  {trial['params']}")
+
+    best = state.best()
+    total = sum(t["seconds"] for t in state.trials)
+    print(f"[+] Search done in {time.perf_counter() - start:.1f}s wall ({total:.1f}s of training); "
+          f"best {best}")
+    return best
@@ -0,0 +1,61 @@
+"""
+Keras model and search objective shared by the WIDS notebook scripts.
+
+objective() is what hp_search runs in its worker processes: it loads the
+preprocessed arrays from the data_prep cache (memory-mapped, so every
+worker starts in well under a second), trains the dense network up to
+`budget` epochs and returns the last validation loss. The model is saved
+in the trial directory, so a promoted configuration continues from the
+epochs it already has instead of starting over.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from data_prep import prepare  # noqa: E402
+
+
+def make_model(input_dim, num_classes, hp, loss=None):
+    """Dense -> dropout -> softmax; focal loss with hp['gamma'] unless `loss` is given."""
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    if loss is None:
+        from focal_loss import SparseCategoricalFocalLoss
+        loss = SparseCategoricalFocalLoss(gamma=float(hp['gamma']))
+    model = keras.Sequential()
+    model.add(layers.Input(shape=(input_dim,)))
+    model.add(layers.Dense(int(hp['n_hidden']), activation='relu'))
+    model.add(layers.Dropout(float(hp['dropout'])))
+    model.add(layers.Dense(num_classes, activation='softmax'))
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=float(hp['lr'])),
+        loss=loss,
+        metrics=['accuracy']
+    )
+    return model
+
+
+def objective(params, budget, prev_budget, trial_dir, csv_path, seed=42):
+    """Validation loss after `budget` epochs (cross-entropy, as in the original search)."""
+    from tensorflow import keras
+
+    data = prepare(csv_path, seed=seed)
+    path = os.path.join(trial_dir, "model.keras")
+    if prev_budget and os.path.exists(path):
+        model = keras.models.load_model(path)
+    else:
+        model = make_model(data.X_train.shape[1], len(data.classes), params,
+                           loss='sparse_categorical_crossentropy')
+        prev_budget = 0
+    history = model.fit(
+        data.X_train, data.y_train,
+        epochs=int(budget),
+        initial_epoch=int(prev_budget),
+        batch_size=int(params['batch_size']),
+        verbose=0,
+        validation_split=0.2
+    )
+    model.save(path)
+    return history.history['val_loss'][-1]
@@ -0,0 +1,277 @@
+"""
+Incrementally maintained anomaly rollups for the analytics page.
+
+Every stored anomaly bumps one document per (minute, family) in the
+`anomaly_rollups` collection: a count plus a 100-bin histogram of that
+family's probability, and once the (minute, "_all") document that counts
+anomaly records (a record can beat Benign for several families).
+/api/anomalies/summary aggregates these small documents instead of
+scanning the anomalies themselves, so its cost and payload do not grow
+with the stored history.
+
+Retries and spill replays must not count a batch twice. Each batch gets
+an id, kept with its documents until they are stored; a rollup document
+takes a batch's $inc only if that id is not among the last BATCH_HISTORY
+batches it has applied.
+
+    python anomaly_rollups.py --rebuild     # backfill from existing anomalies
+"""
+import argparse
+import os
+from collections import defaultdict
+from datetime import timezone
+
+from dotenv import load_dotenv
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from mongo_writer import BatchedMongoWriter, only_duplicates, mongo_client
+
+ROLLUP_COLLECTION = "anomaly_rollups"
+PROB_BINS = 100                       # probability resolution of the percentiles
+ALL = "_all"                          # family of the per-minute anomaly record count
+BATCH_FIELD = "_rollup_batch"         # batch id, carried through retries and the spill file
+BATCH_HISTORY = 256                   # applied batch ids remembered per rollup document
+# Bucket keys are ISO-8601 strings, so they sort chronologically
+BUCKET_FORMATS = {
+    "minute": "%Y-%m-%dT%H:%M:00Z",
+    "hour":   "%Y-%m-%dT%H:00:00Z",
+    "day":    "%Y-%m-%dT00:00:00Z",
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def minute_of(ts):
+    """Truncate a timestamp to its minute (UTC)."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.replace(second=0, microsecond=0)
+
+
+def prob_bin(p):
+    return min(int(p * PROB_BINS), PROB_BINS - 1)
+
+
+def rollup_incs(anomalies):
+    """
+    Coalesce anomaly records into one $inc per (minute, family).
+    Each record needs `timestamp` (datetime) and `anomaly_probs`.
+    """
+    incs = defaultdict(lambda: defaultdict(int))
+    for doc in anomalies:
+        minute = minute_of(doc["timestamp"])
+        incs[(minute, ALL)]["count"] += 1
+        for family, p in doc["anomaly_probs"].items():
+            inc = incs[(minute, family)]
+            inc["count"] += 1
+            inc[f"bins.{prob_bin(p)}"] += 1
+    return {key: dict(inc) for key, inc in incs.items()}
+
+
+def rollup_op(minute, family, inc, batch=None):
+    """
+    $inc upsert for one rollup document. With a `batch` id it only applies
+    if the document has not taken that batch yet; a repeat then fails the
+    upsert with a duplicate key instead.
+    """
+    if batch is None:
+        return UpdateOne({"minute": minute, "family": family}, {"$inc": inc}, upsert=True)
+    return UpdateOne({"minute": minute, "family": family, "batches": {"$ne": batch}},
+                     {"$inc": inc, "$push": {"batches": {"$each": [batch], "$slice": -BATCH_HISTORY}}},
+                     upsert=True)
+
+
+def rollup_ops(anomalies):
+    return [rollup_op(minute, family, inc) for (minute, family), inc in rollup_incs(anomalies).items()]
+
+
+def apply_batch(rollups, anomalies, batch):
+    """
+    Apply the rollup of one batch of anomaly records once per rollup
+    document. A duplicate key means the document already has the batch,
+    or another writer created it at the same time; only the latter is
+    tried again (the document exists now, so the update matches).
+    """
+    pending = list(rollup_incs(anomalies).items())
+    for _ in range(3):
+        try:
+            rollups.bulk_write([rollup_op(m, f, inc, batch) for (m, f), inc in pending], ordered=False)
+            return
+        except BulkWriteError as e:
+            if not only_duplicates(e):
+                raise
+            failed = [pending[err["index"]] for err in e.details["writeErrors"]]
+        applied = {(d["minute"], d["family"]) for d in rollups.find(
+            {"$or": [{"minute": m, "family": f} for (m, f), _ in failed], "batches": batch},
+            {"minute": 1, "family": 1})}
+        pending = [(key, inc) for key, inc in failed if key not in applied]
+        if not pending:
+            return
+    raise PyMongoError(f"rollup of batch {batch} kept hitting concurrent upserts")
+
+
+class AnomalyWriter(BatchedMongoWriter):
+    """
+    BatchedMongoWriter for the anomalies collection that applies the matching
+    rollup increments right after each insert_many, once per batch however
+    often the batch is retried or replayed.
+    """
+
+    def __init__(self, collection, rollups, **kwargs):
+        self.rollups = rollups
+        # apply_batch relies on the unique (minute, family) index: without it a
+        # repeated batch upserts a second document instead of failing
+        self.indexed = False
+        try:
+            ensure_indexes(rollups)
+            self.indexed = True
+        except PyMongoError as e:
+            print(f"[!] {ROLLUP_COLLECTION} index not created yet, retrying on first write: {e}")
+        super().__init__(collection, **kwargs)
+
+    def write(self, batch):
+        if not self.indexed:
+            ensure_indexes(self.rollups)
+            self.indexed = True
+        # Set on the queued dicts, so retries and the spill file keep the id
+        new_batch = ObjectId()
+        for doc in batch:
+            doc.setdefault(BATCH_FIELD, new_batch)
+        try:
+            self.collection.insert_many([{k: v for k, v in doc.items() if k != BATCH_FIELD}
+                                         for doc in batch], ordered=False)
+        except BulkWriteError as e:
+            # Documents stored by an earlier attempt; their rollup may or may not have landed
+            if not only_duplicates(e):
+                raise
+        by_batch = defaultdict(list)
+        for doc in batch:
+            by_batch[doc[BATCH_FIELD]].append(doc)
+        for batch_id, docs in by_batch.items():
+            apply_batch(self.rollups, docs, batch_id)
+
+    def replay_chunks(self, docs):
+        """Replay spilled documents without splitting a batch: its id stands for all of it."""
+        start = 0
+        for i in range(1, len(docs) + 1):
+            end = i == len(docs)
+            batch = None if end else docs[i].get(BATCH_FIELD)
+            boundary = end or batch is None or batch != docs[i - 1].get(BATCH_FIELD)
+            if boundary and (end or i - start >= self.batch_size):
+                yield start, docs[start:i]
+                start = i
+
+
+def ensure_indexes(rollups):
+    rollups.create_index([("minute", ASCENDING), ("family", ASCENDING)], unique=True)
+
+
+def summary(rollups, start=None, end=None, families=None, unit="hour"):
+    """
+    Per-family counts, time-bucketed counts and probability percentiles for
+    the anomalies between `start` and `end`, from the rollup collection.
+    `total` counts the anomaly records in the range (of every family, even
+    with `families`); a record hits counts[] once per family it flags.
+    """
+    if unit not in BUCKET_FORMATS:
+        raise ValueError(f"unit must be one of {tuple(BUCKET_FORMATS)}")
+    match = {}
+    if start or end:
+        match["minute"] = {}
+        if start:
+            match["minute"]["$gte"] = minute_of(start)
+        if end:
+            match["minute"]["$lt"] = end
+    if families:
+        match["family"] = {"$in": list(families) + [ALL]}
+
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "counts": [
+                {"$group": {"_id": "$family", "count": {"$sum": "$count"}}},
+            ],
+            "buckets": [
+                {"$group": {"_id": {"t": {"$dateToString": {"date": "$minute",
+                                                              "format": BUCKET_FORMATS[unit]}},
+                                    "family": "$family"},
+                            "count": {"$sum": "$count"}}},
+                {"$sort": {"_id.t": 1}},
+            ],
+            "bins": [
+                {"$project": {"family": 1, "bins": {"$objectToArray": "$bins"}}},
+                {"$unwind": "$bins"},
+                {"$group": {"_id": {"family": "$family", "bin": "$bins.k"},
+                            "count": {"$sum": "$bins.v"}}},
+            ],
+        }},
+    ]
+    facets = next(rollups.aggregate(pipeline), {"counts": [], "buckets": [], "bins": []})
+
+    counts = {d["_id"]: d["count"] for d in facets["counts"]}
+    total = counts.pop(ALL, 0)
+
+    buckets = {}
+    for d in facets["buckets"]:
+        if d["_id"]["family"] != ALL:
+            buckets.setdefault(d["_id"]["t"], {})[d["_id"]["family"]] = d["count"]
+
+    hists = defaultdict(lambda: [0] * PROB_BINS)
+    for d in facets["bins"]:
+        hists[d["_id"]["family"]][int(d["_id"]["bin"])] += d["count"]
+
+    return {
+        "total": total,
+        "counts": counts,
+        "unit": unit,
+        "buckets": [{"t": t, "counts": c} for t, c in sorted(buckets.items())],
+        "percentiles": {family: percentiles(h) for family, h in hists.items()},
+    }
+
+
+def percentiles(hist):
+    """Percentiles of a probability histogram, as the upper edge of the bin reached."""
+    total = sum(hist)
+    out = {}
+    if not total:
+        return out
+    for q in PERCENTILES:
+        target, seen = total * q / 100, 0
+        for i, c in enumerate(hist):
+            seen += c
+            if seen >= target:
+                out[f"p{q}"] = (i + 1) / PROB_BINS
+                break
+    return out
+
+
+def rebuild(anomalies, rollups, batch_size=1000):
+    """Recompute the rollups from scratch out of the stored anomalies."""
+    rollups.delete_many({})
+    ensure_indexes(rollups)
+    batch, done = [], 0
+    cursor = anomalies.find({"timestamp": {"$type": "date"}},
+                            {"timestamp": 1, "anomaly_probs": 1, "_id": 0})
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            rollups.bulk_write(rollup_ops(batch), ordered=False)
+            done += len(batch)
+            batch = []
+    if batch:
+        rollups.bulk_write(rollup_ops(batch), ordered=False)
+        done += len(batch)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain anomaly rollups")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute rollups from the anomalies collection")
+    args = parser.parse_args()
+    load_dotenv()
+    db = mongo_client(os.getenv("MONGO_URI"))[os.getenv("DB_NAME")]
+    if args.rebuild:
+        n = rebuild(db["anomalies"], db[ROLLUP_COLLECTION])
+        print(f"[+] Rolled up {n} anomalies into {ROLLUP_COLLECTION}")
@@ -1,9 +1,17 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
-import subprocess, os, signal
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import PyMongoError
+from bson import json_util
+from datetime import datetime, timezone
+import base64, json
+import subprocess, os, time
+import urllib.error, urllib.request
 import certifi
 from dotenv import load_dotenv
+from latest_channel import LatestChannels, LATEST_FIELDS, json_default
+import anomaly_rollups
+import metrics
 
 app = Flask(__name__)
 CORS(app)
@@ -11,52 +19,269 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME= os.getenv('DB_NAME')
 COL_PRED = os.getenv('COLLECTION')
-SCRIPT     = os.path.abspath("live_predictor.py")
+SUPERVISOR = os.path.abspath("supervisor.py")
+# Capture workers run under supervisor.py; /api/start|stop|status talk to its control API
+SUPERVISOR_URL = os.getenv("SUPERVISOR_URL", "http://127.0.0.1:9107")
+SUPERVISOR_BOOT_TIMEOUT = 30  # model load before the control API answers
 
 client = MongoClient(MONGO_URI,tls = True, tlsCAFile=certifi.where())
 col    = client[DB_NAME][COL_PRED]
 col_anomalies = client[DB_NAME]['anomalies']
+col_rollups = client[DB_NAME][anomaly_rollups.ROLLUP_COLLECTION]
 
-proc = None
+ANOMALY_PAGE_SIZE = 50
+ANOMALY_PAGE_MAX  = 500
+
+REQUEST_SECONDS = metrics.Histogram("wids_http_request_seconds", "Flask handler latency",
+                                    ["route", "method"])
+REQUESTS = metrics.Counter("wids_http_requests_total", "HTTP requests", ["route", "method", "status"])
+STREAM_CLIENTS = metrics.Gauge("wids_stream_clients", "Open /api/stream connections")
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if route != "/metrics":
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route=route, method=request.method)
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def ensure_indexes():
+    """Indexes backing /api/latest and the /api/anomalies filters and cursor."""
+    try:
+        col.create_index([('timestamp', DESCENDING)])
+        col_anomalies.create_index([('timestamp', DESCENDING), ('_id', DESCENDING)])
+        col_anomalies.create_index([('anomaly_families', ASCENDING), ('timestamp', DESCENDING)])
+        anomaly_rollups.ensure_indexes(col_rollups)
+    except PyMongoError as e:
+        print(f"[!] Could not create indexes: {e}")
+
+ensure_indexes()
+
+supervisor_proc = None
+
+# Latest prediction is pushed by each live_predictor worker through a local file and served from memory
+latest_channels = LatestChannels()
+
+def supervisor_call(method, path):
+    """(status code, JSON body) from the supervisor's control API; raises URLError if it is down."""
+    req = urllib.request.Request(SUPERVISOR_URL + path, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.load(resp)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+def launch_supervisor():
+    """Start supervisor.py with every worker stopped and wait for its control API."""
+    global supervisor_proc
+    if supervisor_proc is None or supervisor_proc.poll() is not None:
+        supervisor_proc = subprocess.Popen(['python', SUPERVISOR, '--idle'])
+    deadline = time.monotonic() + SUPERVISOR_BOOT_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            return supervisor_call('GET', '/status')
+        except urllib.error.URLError:
+            if supervisor_proc.poll() is not None:
+                break
+            time.sleep(0.5)
+    raise urllib.error.URLError('supervisor did not come up')
+
+def worker_path(action):
+    """/start, /stop or /status, narrowed to ?worker= (or {"worker": ...}) when given."""
+    body = request.get_json(silent=True) or {}
+    worker = request.args.get('worker') or body.get('worker')
+    return f"/{action}/{urllib.request.quote(worker, safe='')}" if worker else f"/{action}"
 
 @app.route('/api/start', methods=['POST'])
 def start():
-    global proc
-    if proc is None or proc.poll() is not None:
-        proc = subprocess.Popen(['python', SCRIPT])
-        return jsonify({'status':'started'})
-    return jsonify({'error':'already running'}), 400
+    """Start one capture worker (?worker=name) or all of them."""
+    path = worker_path('start')
+    try:
+        code, body = supervisor_call('POST', path)
+    except urllib.error.URLError:
+        try:
+            launch_supervisor()
+            code, body = supervisor_call('POST', path)
+        except urllib.error.URLError as e:
+            return jsonify({'error': f'supervisor unavailable: {e.reason}'}), 503
+    return jsonify(body), code
 
 @app.route('/api/stop', methods=['POST'])
 def stop():
-    global proc
-    if proc and proc.poll() is None:
-        proc.send_signal(signal.SIGTERM)
-        proc.wait(timeout=5)
-        proc = None
-        return jsonify({'status':'stopped'})
-    return jsonify({'error':'not running'}), 400
+    """Stop one capture worker (?worker=name) or all of them."""
+    try:
+        code, body = supervisor_call('POST', worker_path('stop'))
+    except urllib.error.URLError:
+        return jsonify({'error':'not running'}), 400
+    return jsonify(body), code
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """State, pid, uptime and restart count of each capture worker (or ?worker=name)."""
+    try:
+        code, body = supervisor_call('GET', worker_path('status'))
+    except urllib.error.URLError:
+        return jsonify({'supervisor': 'not running', 'workers': []})
+    return jsonify({'supervisor': 'running', **body}), code
+
+@app.route('/api/model/<action>', methods=['POST'])
+def model_action(action):
+    """
+    reload: load the newest model in the model directory (or ?path=<file>) in
+    every worker (or ?worker=name) without stopping capture; rollback: return
+    to the previous model. /api/status shows the version each worker runs.
+    """
+    if action not in ('reload', 'rollback'):
+        return jsonify({'error': 'not found'}), 404
+    path = worker_path(action)
+    body = request.get_json(silent=True) or {}
+    model = request.args.get('path') or body.get('path')
+    if model and action == 'reload':
+        path += '?path=' + urllib.request.quote(model, safe='')
+    try:
+        code, body = supervisor_call('POST', path)
+    except urllib.error.URLError:
+        return jsonify({'error':'not running'}), 400
+    return jsonify(body), code
+
+def latest_cache():
+    """LatestCache of ?worker= (default: see LatestChannels.get); None if it has no channel."""
+    return latest_channels.get(request.args.get('worker') or None)
 
 @app.route('/api/latest', methods=['GET'])
 def latest():
-    doc = col.find_one(sort=[('timestamp', -1)])
-    if not doc:
+    """Newest prediction of one worker (?worker=name)."""
+    try:
+        cache = latest_cache()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if cache is None:
+        return jsonify({'error':'no data'}), 404
+    doc, body, etag = cache.get()
+    if doc is None:
+        # Nothing published on this host yet: seed the cache from Mongo once
+        doc = col.find_one(sort=[('timestamp', -1)])
+        if not doc:
+            return jsonify({'error':'no data'}), 404
+        cache.set({k: doc[k] for k in LATEST_FIELDS})
+        doc, body, etag = cache.get()
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events: push every new prediction of one worker (?worker=name) as it is published."""
+    try:
+        cache = latest_cache()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if cache is None:
         return jsonify({'error':'no data'}), 404
-    return jsonify({
-      'timestamp':   doc['timestamp'],
-      'label':       doc['label'],
-      'probability': doc['probability'],
-      'probabilities': doc['probabilities']
-    })
+
+    def events():
+        STREAM_CLIENTS.inc()
+        try:
+            seq = 0
+            while True:
+                item = cache.wait(seq, timeout=15)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                seq, body = item
+                yield f"id: {seq}\ndata: {body}\n\n"
+        finally:
+            STREAM_CLIENTS.dec()
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_time(value):
+    """ISO-8601 query parameter → datetime (naive values are taken as UTC)."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def encode_cursor(doc):
+    raw = json_util.dumps({'t': doc['timestamp'], 'id': doc['_id']})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    c = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    return c['t'], c['id']
+
+def to_json(doc):
+    """Mongo document → JSON-safe dict (string _id, ISO timestamps)."""
+    doc['_id'] = str(doc['_id'])
+    return json.loads(json.dumps(doc, default=json_default))
 
 @app.route('/api/anomalies', methods=['GET']) 
 def anomalies():
-    print("[DEBUG] /api/anomalies called")
-    docs = list(col_anomalies.find().sort('timestamp', -1))
-    print(f"[DEBUG] found {len(docs)} anomaly docs")
-    for d in docs:
-        d['_id'] = str(d['_id'])
-    return jsonify(docs) 
+    """
+    Newest-first page of anomalies.
+      limit     page size (default 50, max 500)
+      before    cursor from the previous page's "next"
+      from, to  ISO-8601 time range on timestamp
+      family    anomaly family filter (repeat or comma-separate)
+      fields    "features" to include the feature vectors
+    Returns {"items": [...], "next": cursor or null}.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', ANOMALY_PAGE_SIZE)), 1), ANOMALY_PAGE_MAX)
+        start, end = parse_time(request.args.get('from')), parse_time(request.args.get('to'))
+        before = request.args.get('before')
+        before = decode_cursor(before) if before else None
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': f'bad query: {e}'}), 400
+
+    query = {}
+    if start or end:
+        query['timestamp'] = {}
+        if start:
+            query['timestamp']['$gte'] = start
+        if end:
+            query['timestamp']['$lt'] = end
+    families = [f for arg in request.args.getlist('family') for f in arg.split(',') if f]
+    if families:
+        query['anomaly_families'] = {'$in': families}
+    if before:
+        ts, oid = before
+        query = {'$and': [query, {'$or': [{'timestamp': {'$lt': ts}},
+                                          {'timestamp': ts, '_id': {'$lt': oid}}]}]}
+
+    fields = set(request.args.get('fields', '').split(','))
+    projection = None if 'features' in fields else {'features': 0}
+
+    docs = list(col_anomalies.find(query, projection)
+                .sort([('timestamp', DESCENDING), ('_id', DESCENDING)])
+                .limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return jsonify({'items': [to_json(d) for d in docs[:limit]], 'next': next_cursor})
+
+@app.route('/api/anomalies/summary', methods=['GET'])
+def anomalies_summary():
+    """
+    Per-family counts, time-bucketed histogram (unit=minute|hour|day) and
+    probability percentiles, from the rollups kept by the predictor.
+    Accepts the same from/to/family filters as /api/anomalies.
+    """
+    try:
+        start, end = parse_time(request.args.get('from')), parse_time(request.args.get('to'))
+        families = [f for arg in request.args.getlist('family') for f in arg.split(',') if f]
+        result = anomaly_rollups.summary(col_rollups, start, end, families,
+                                         unit=request.args.get('unit', 'hour'))
+    except ValueError as e:
+        return jsonify({'error': f'bad query: {e}'}), 400
+    return Response(json.dumps(result, default=json_default), mimetype='application/json')
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True) #Run the app locally on the port 5000
+    metrics.install_profile_signal("profile-api")
+    app.run(port=5000, debug=True, threaded=True) #Run the app locally on the port 5000
@@ -0,0 +1,249 @@
+"""
+Offline batch scoring of archived captures (incident retros).
+
+Every capture in a directory or glob is read by a process pool; large
+libpcap files are split into byte-range shards read in parallel. Each shard
+returns one FlowFeatureAccumulator per time window (or one for the whole
+capture), the shards of a file are merged in order, and all rows are scored
+in vectorized batches with the family detectors. With --sketches every
+window also gets a TrafficSketch, merged across shards the same way, whose
+distinct-count / fan-out / top-talker columns are written next to the scores.
+
+    python batch_score.py "archive/2024-05-*.pcap" --window 60 --out retro.parquet
+    python batch_score.py archive/ --mongo --collection retro_scores
+"""
+import argparse
+import glob
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import ioc_engine
+from feature_extraction import FlowFeatureAccumulator
+from pcap_reader import pcap_shards, read_packets_range
+from sketches import TrafficSketch
+
+MODEL_FILE   = "family_detectors.pkl"
+CAPTURE_EXTS = (".pcap", ".pcapng", ".cap")
+SHARD_BYTES  = 64 << 20       # split libpcap files larger than this
+SCORE_BATCH  = 50_000         # rows per predict_batch call
+
+
+def find_captures(patterns):
+    """Expand directories and globs into a sorted list of capture files."""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files.update(os.path.join(root, n) for n in names
+                             if n.lower().endswith(CAPTURE_EXTS))
+        else:
+            files.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(files)
+
+
+def extract_shard(path, start, end, window, sketches=False):
+    """
+    Worker: accumulate one byte range of a capture.
+    Returns ({window index: accumulator}, {window index: TrafficSketch},
+    packets, bytes read); the index is always 0 when window is None (whole
+    capture) and the sketch dict is empty without sketches.
+    """
+    accs, sks = {}, {}
+    n = 0
+    for pkt in read_packets_range(path, start, end):
+        idx = int(pkt.timestamp // window) if window else 0
+        acc = accs.get(idx)
+        if acc is None:
+            acc = accs[idx] = FlowFeatureAccumulator()
+            if sketches:
+                sks[idx] = TrafficSketch()
+        acc.add(pkt)
+        if sketches:
+            sks[idx].add(pkt)
+        n += 1
+    for sk in sks.values():
+        sk.flush()
+    size = (end if end is not None else os.path.getsize(path)) - start
+    return accs, sks, n, size
+
+
+def merge_shards(parts):
+    """Merge per-shard window accumulators or sketches (given in file order) into one dict."""
+    merged = {}
+    for accs in parts:
+        for idx, acc in accs.items():
+            if idx in merged:
+                merged[idx].merge(acc)
+            else:
+                merged[idx] = acc
+    return merged
+
+
+def rows_for(path, merged, window, sketches=None):
+    """Turn merged accumulators (and sketches, if any) into (metadata, feature row) pairs."""
+    out = []
+    for idx in sorted(merged):
+        acc = merged[idx]
+        if window:
+            start, end = idx * window, (idx + 1) * window
+        else:
+            start, end = acc.min_ts, acc.max_ts
+        meta = {
+            "file": path,
+            "window_start": datetime.fromtimestamp(start, timezone.utc),
+            "window_end":   datetime.fromtimestamp(end, timezone.utc),
+            "packets": acc.n,
+        }
+        if sketches:
+            meta["traffic"] = sketches[idx].summary()
+        out.append((meta, acc.features()))
+    return out
+
+
+class ResultSink:
+    """Collects scored rows and writes them to a CSV/Parquet file or Mongo."""
+
+    def __init__(self, out=None, collection=None):
+        self.out = out
+        self.collection = collection
+        self.records = []
+        self.count = 0
+
+    def add(self, metas, labels, prob_matrix, families):
+        for meta, label, p in zip(metas, labels, prob_matrix):
+            probs = {family: float(v) for family, v in zip(families, p)}
+            record = {**meta, "label": label, "probability": probs[label],
+                      "probabilities": probs}
+            if self.collection is not None:
+                self.collection.put(record)
+            else:
+                self.records.append(record)
+            self.count += 1
+
+    def close(self):
+        if self.collection is not None:
+            self.collection.close()
+            return
+        import pandas as pd
+
+        df = pd.json_normalize(self.records, sep=".")
+        if self.out.endswith(".parquet"):
+            df.to_parquet(self.out, index=False)
+        else:
+            df.to_csv(self.out, index=False)
+
+
+def score_pending(pending, detectors, sink):
+    if not pending:
+        return
+    metas, rows = zip(*pending)
+    labels, prob_matrix = detectors.predict_batch(rows)
+    sink.add(metas, labels, prob_matrix, detectors.families)
+    pending.clear()
+
+
+def run(files, detectors, sink, window=None, workers=None, shard_bytes=SHARD_BYTES,
+        score_batch=SCORE_BATCH, ioc_feeds=None, sketches=False):
+    """Extract, merge and score every capture; returns (rows, packets, bytes)."""
+    shards = {path: pcap_shards(path, shard_bytes) for path in files}
+    n_shards = sum(len(s) for s in shards.values())
+    print(f"[+] {len(files)} captures, {n_shards} shards, {workers or os.cpu_count()} workers")
+
+    parts = defaultdict(dict)       # path -> {shard no: accumulators}
+    pending = []
+    packets = nbytes = done = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=ioc_engine.watch,
+                             initargs=(ioc_feeds,)) as pool:
+        futures = {pool.submit(extract_shard, path, start, end, window, sketches): (path, i)
+                   for path, ranges in shards.items()
+                   for i, (start, end) in enumerate(ranges)}
+        for fut in as_completed(futures):
+            path, i = futures[fut]
+            accs, sks, n, size = fut.result()
+            packets += n
+            nbytes += size
+            done += 1
+            parts[path][i] = (accs, sks)
+            if len(parts[path]) == len(shards[path]):
+                by_shard = parts.pop(path)
+                by_shard = [by_shard[k] for k in sorted(by_shard)]
+                merged = merge_shards(accs for accs, _ in by_shard)
+                merged_sks = merge_shards(sks for _, sks in by_shard)
+                pending.extend(rows_for(path, merged, window, merged_sks))
+                if len(pending) >= score_batch:
+                    score_pending(pending, detectors, sink)
+            elapsed = time.perf_counter() - t0
+            print(f"[+] {done}/{n_shards} shards  {packets / elapsed:,.0f} pkt/s  "
+                  f"{nbytes / elapsed / 1e6:,.1f} MB/s", end="\r", flush=True)
+    print()
+    score_pending(pending, detectors, sink)
+    return sink.count, packets, nbytes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score archived captures in parallel")
+    parser.add_argument("inputs", nargs="+", help="capture files, directories or globs")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--window", type=float, default=None,
+                        help="score fixed windows of this many seconds (default: one row per capture)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--shard-mb", type=int, default=SHARD_BYTES >> 20,
+                        help="split libpcap files larger than this many MB")
+    parser.add_argument("--out", default="batch_scores.csv", help=".csv or .parquet output")
+    parser.add_argument("--mongo", action="store_true", help="write to Mongo instead of --out")
+    parser.add_argument("--collection", default="batch_scores")
+    parser.add_argument("--ioc-feeds", default=ioc_engine.FEEDS_DIR,
+                        help="directory of IoC feed files (ioc*/c2*/exfil*.txt)")
+    parser.add_argument("--sketches", action="store_true",
+                        help="add distinct-host/port counts, fan-out and top talkers per row")
+    parser.add_argument("--cascade", default=None, metavar="FILTER_JSON",
+                        help="benign_filter.json from cascade.py: only uncertain rows reach the detectors")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = find_captures(args.inputs)
+    if not files:
+        print("[!] No captures matched.")
+        return
+
+    from family_model import load_detectors
+    detectors = load_detectors(args.model)
+    if args.cascade:
+        from cascade import CascadeDetectors, load_filter
+        detectors = CascadeDetectors(detectors, load_filter(args.cascade))
+
+    if args.mongo:
+        from dotenv import load_dotenv
+        from mongo_writer import BatchedMongoWriter, mongo_client
+
+        load_dotenv()
+        client = mongo_client(os.getenv("MONGO_URI"))
+        sink = ResultSink(collection=BatchedMongoWriter(
+            client[os.getenv("DB_NAME")][args.collection], batch_size=5000))
+    else:
+        sink = ResultSink(out=args.out)
+
+    ioc_engine.watch(args.ioc_feeds)
+    t0 = time.perf_counter()
+    try:
+        rows, packets, nbytes = run(files, detectors, sink, window=args.window,
+                                    workers=args.workers, shard_bytes=args.shard_mb << 20,
+                                    ioc_feeds=args.ioc_feeds, sketches=args.sketches)
+    finally:
+        sink.close()
+    elapsed = time.perf_counter() - t0
+    where = args.collection if args.mongo else args.out
+    print(f"[+] {rows} rows from {packets:,} packets ({nbytes / 1e6:,.1f} MB) in {elapsed:.1f}s "
+          f"— {packets / elapsed:,.0f} pkt/s, {rows / elapsed:,.0f} rows/s → {where}")
+    if args.cascade:
+        print(f"[+] Cascade: {detectors.stats()}")
+
+
+if __name__ == "__main__":
+    main()
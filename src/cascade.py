@@ -0,0 +1,279 @@
+"""
+Two-stage scoring: a cheap benign pre-filter in front of the family detectors.
+
+Nearly every window and flow is benign, yet each one runs every family
+detector. BenignFilter is a logistic regression over the 15 numerical
+features (signed log1p, standardized) that scores P(not benign) with one
+dot product per row. Rows below its threshold are answered as Benign
+(probability 1 - score, every other family 0.0); only the rest go to
+the full ensemble. The threshold is calibrated on a slice of the training
+split so that `target_recall` of the malicious rows still reach stage two.
+
+    filt = load_filter("benign_filter.json")
+    detectors = CascadeDetectors(load_detectors("family_detectors.pkl"), filt)
+    labels, probs = detectors.predict_batch(rows)
+    detectors.stats()    # {'rows': ..., 'skipped': ..., 'skip_share': ...}
+
+`train` fits the filter on the training CSV's split (same test size and
+seed as data_prep.prepare) and reports, on the hold-out part and for a
+range of target recalls, the share of rows that skip stage two and the
+recall lost against the full ensemble:
+
+    python cascade.py train --csv IIoT_Malware_Timeseries_CLEAN.csv \\
+        --model family_detectors.pkl --recall 0.999 --out benign_filter.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import metrics
+from feature_schema import CSV_PATH, NUMERICAL_FEATURES, flags_categories, protocol_categories
+
+FILTER_VERSION = 1
+FILTER_FILE = "benign_filter.json"
+BENIGN = "Benign"
+DEFAULT_RECALL = 0.999
+CALIBRATION_SHARE = 0.25          # of the training split, held back to set the threshold
+REPORT_RECALLS = (0.99, 0.995, 0.999, 0.9995, 0.9999)
+
+CASCADE_ROWS = metrics.Counter("wids_cascade_rows_total", "Rows scored by each cascade stage", ["stage"])
+
+
+def signed_log(X):
+    """log1p on magnitudes: counts, bytes and rates span orders of magnitude."""
+    X = np.nan_to_num(np.asarray(X, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    return np.sign(X) * np.log1p(np.abs(X))
+
+
+class BenignFilter:
+    """Stage one: logistic P(not benign) over the numerical features, plus its threshold."""
+
+    def __init__(self, mean, scale, coef, intercept, threshold, target_recall=DEFAULT_RECALL,
+                 n_features=len(NUMERICAL_FEATURES)):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.threshold = float(threshold)
+        self.target_recall = float(target_recall)
+        self.n_features = n_features
+
+    def score(self, X):
+        """P(not benign) per row of live-layout feature rows X[n, d]."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))[:, :self.n_features]
+        z = ((signed_log(X) - self.mean) / self.scale) @ self.coef + self.intercept
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def clears(self, X):
+        """Boolean mask of the rows stage one answers as Benign."""
+        return self.score(X) < self.threshold
+
+    def to_dict(self):
+        return {"version": FILTER_VERSION, "features": NUMERICAL_FEATURES[:self.n_features],
+                "mean": self.mean.tolist(), "scale": self.scale.tolist(),
+                "coef": self.coef.tolist(), "intercept": self.intercept,
+                "threshold": self.threshold, "target_recall": self.target_recall}
+
+    def save(self, path=FILTER_FILE):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def load_filter(path=FILTER_FILE):
+    with open(path, encoding="utf-8") as f:
+        d = json.load(f)
+    if d.get("version") != FILTER_VERSION:
+        raise ValueError(f"{path}: benign filter v{d.get('version')}, expected v{FILTER_VERSION}")
+    return BenignFilter(d["mean"], d["scale"], d["coef"], d["intercept"], d["threshold"],
+                        d["target_recall"], len(d["features"]))
+
+
+class CascadeDetectors:
+    """Detectors wrapper that runs the full ensemble only on rows the BenignFilter does not clear."""
+
+    def __init__(self, detectors, benign_filter):
+        if BENIGN not in detectors.families:
+            raise ValueError(f"cascade needs a {BENIGN!r} detector")
+        self.detectors = detectors
+        self.filter = benign_filter
+        self.families = detectors.families
+        self.benign_idx = self.families.index(BENIGN)
+        self.rows = 0
+        self.skipped = 0
+
+    def __iter__(self):
+        return iter(self.families)
+
+    def __len__(self):
+        return len(self.families)
+
+    def labels_for(self, probs):
+        return self.detectors.labels_for(probs)
+
+    def predict_batch(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        score = self.filter.score(X)
+        uncertain = np.flatnonzero(score >= self.filter.threshold)
+        probs = np.zeros((len(X), len(self.families)))
+        probs[:, self.benign_idx] = 1.0 - score
+        labels = [BENIGN] * len(X)
+        if len(uncertain):
+            full_labels, probs[uncertain] = self.detectors.predict_batch(X[uncertain])
+            for i, label in zip(uncertain, full_labels):
+                labels[i] = label
+
+        skipped = len(X) - len(uncertain)
+        self.rows += len(X)
+        self.skipped += skipped
+        CASCADE_ROWS.inc(skipped, stage="filter")
+        CASCADE_ROWS.inc(len(uncertain), stage="full")
+        return labels, probs
+
+    def stats(self):
+        return {"rows": self.rows, "skipped": self.skipped,
+                "skip_share": self.skipped / self.rows if self.rows else 0.0}
+
+
+# ── training and report ──────────────────────────────────────────────
+
+def csv_rows(csv_path=CSV_PATH):
+    """The training CSV as (rows in the live feature layout, labels)."""
+    # Training only: the predictor imports this module for BenignFilter
+    import pandas as pd
+    from data_prep import LABEL_COLUMN, load_frame, normalize_name
+
+    df = load_frame(csv_path)
+    by_name = {normalize_name(c): c for c in df.columns}
+    X = [np.column_stack([pd.to_numeric(df[by_name[normalize_name(c)]], errors="coerce")
+                          for c in NUMERICAL_FEATURES])]
+    for column, cats in (("Protocol Type", protocol_categories()), ("Flags", flags_categories())):
+        values = df[by_name[normalize_name(column)]].astype(str).to_numpy()
+        X.append((values[:, None] == np.array(cats, dtype=object)[None, :]).astype(np.float64))
+    return np.hstack(X), df[by_name[LABEL_COLUMN]].astype(str).to_numpy()
+
+
+def calibrate_threshold(scores, target_recall):
+    """Largest threshold that keeps at least `target_recall` of `scores` (malicious rows) at or above it."""
+    scores = np.sort(scores)
+    k = int(np.floor((1.0 - target_recall) * len(scores)))
+    return float(scores[min(k, len(scores) - 1)]) if len(scores) else 0.5
+
+
+def fit_filter(X, malicious, target_recall=DEFAULT_RECALL, calibration_share=CALIBRATION_SHARE,
+               seed=42):
+    """
+    Fit the logistic filter on live-layout rows and set its threshold on a
+    held-back slice. Returns (filter, calibration scores of its malicious rows).
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+
+    X_fit, X_cal, m_fit, m_cal = train_test_split(
+        X, malicious, test_size=calibration_share, stratify=malicious, random_state=seed)
+    Z = signed_log(X_fit[:, :len(NUMERICAL_FEATURES)])
+    mean = Z.mean(axis=0)
+    std = Z.std(axis=0)
+    scale = np.where(std == 0, 1.0, std)
+    lr = LogisticRegression(class_weight="balanced", max_iter=2000)
+    lr.fit((Z - mean) / scale, m_fit)
+    filt = BenignFilter(mean, scale, lr.coef_[0], lr.intercept_[0], 0.5, target_recall)
+    cal_scores = filt.score(X_cal)[m_cal]
+    filt.threshold = calibrate_threshold(cal_scores, target_recall)
+    return filt, cal_scores
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def report(filt, X, labels, detectors=None, calibration_scores=None, recalls=REPORT_RECALLS):
+    """
+    Skip share and recall cost on hold-out rows for each target recall
+    (thresholds from `calibration_scores`; only the filter's own without).
+    Recall counts malicious rows the full ensemble flags (label != Benign)
+    or, without detectors, all malicious rows; the cost is what the
+    cascade loses of it.
+    """
+    malicious = labels != BENIGN
+    score = filt.score(X)
+    if detectors is not None:
+        full_labels, full_s = _timed(lambda: detectors.predict_batch(X)[0])
+        flagged = np.array([label != BENIGN for label in full_labels]) & malicious
+    else:
+        flagged = malicious
+    n_mal = max(int(malicious.sum()), 1)
+    base_recall = flagged.sum() / n_mal
+    if calibration_scores is not None and len(calibration_scores) * (1 - max(recalls)) < 1:
+        print(f"[!] Only {len(calibration_scores)} malicious calibration rows: recalls above "
+              f"{1 - 1 / max(len(calibration_scores), 1):.4f} all get the lowest threshold")
+
+    rows = []
+    targets = recalls if calibration_scores is not None else ()
+    for target in sorted(set(targets) | {filt.target_recall}):
+        threshold = filt.threshold if target == filt.target_recall else \
+            calibrate_threshold(calibration_scores, target)
+        cleared = score < threshold
+        recall = (flagged & ~cleared).sum() / n_mal
+        rows.append({"target_recall": target, "threshold": threshold,
+                     "skip_share": float(cleared.mean()),
+                     "recall": float(recall), "recall_cost": float(base_recall - recall),
+                     "chosen": target == filt.target_recall})
+
+    print(f"[+] Hold-out: {len(X)} rows, {int(malicious.sum())} malicious; "
+          f"{'full ensemble' if detectors is not None else 'ground-truth'} recall {base_recall:.4f}")
+    print("    target   threshold   skip stage 2   recall   recall cost")
+    for r in rows:
+        mark = "  <-" if r["chosen"] else ""
+        print(f"    {r['target_recall']:<8} {r['threshold']:10.4f}   {r['skip_share']:12.1%}   "
+              f"{r['recall']:.4f}   {r['recall_cost']:11.4f}{mark}")
+
+    if detectors is not None:
+        cascade = CascadeDetectors(detectors, filt)
+        _, cascade_s = _timed(cascade.predict_batch, X)
+        print(f"[+] Scoring {len(X)} rows: full ensemble {full_s:.3f}s, cascade {cascade_s:.3f}s "
+              f"({full_s / cascade_s:.1f}x)")
+    return rows
+
+
+def train(csv_path=CSV_PATH, model_path=None, target_recall=DEFAULT_RECALL, out=FILTER_FILE,
+          test_size=0.2, seed=42):
+    from sklearn.model_selection import train_test_split
+
+    X, labels = csv_rows(csv_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, labels, test_size=test_size, stratify=labels, random_state=seed)
+    filt, cal_scores = fit_filter(X_train, y_train != BENIGN, target_recall, seed=seed)
+    detectors = None
+    if model_path:
+        from family_model import load_detectors
+        detectors = load_detectors(model_path)
+    report(filt, X_test, y_test, detectors, cal_scores)
+    filt.save(out)
+    print(f"[+] Benign filter (threshold {filt.threshold:.4f} for recall {target_recall}) → {out}")
+    return filt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benign pre-filter for cascade scoring")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--model", default=None,
+                        help="family_detectors.pkl (or .npz), to measure the recall cost against it")
+    parser.add_argument("--recall", type=float, default=DEFAULT_RECALL,
+                        help="share of malicious rows the filter must pass to stage two")
+    parser.add_argument("--out", default=FILTER_FILE)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    train(args.csv, args.model, args.recall, args.out, args.test_size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Columnar copy of the training CSV and cached preprocessing for training runs.
+
+convert() parses IIoT_Malware_Timeseries_CLEAN.csv once into a directory
+of typed .npy columns (strings as int32 codes plus their categories) that
+load_frame() memory-maps back into a DataFrame. The bundle remembers the
+CSV's size, mtime and SHA-1 and is rebuilt when the CSV changes.
+
+prepare() runs the notebooks' preprocessing (label-encode categorical
+features, inf -> NaN, median imputation, stratified split, SMOTE on the
+training part, standard scaling, label-encode the target) and caches the
+resulting arrays plus the fitted Preprocessor under PREP_CACHE/<key>,
+where the key hashes the data SHA-1 and every parameter. Repeated runs
+with the same data and parameters just memory-map the arrays.
+
+The Preprocessor is plain JSON (no pickle, no sklearn), so the predictor
+can apply exactly the transform the model was trained with:
+
+    pre = load_preprocessor("preprocessor.json")
+    X = pre.transform_record(features_as_record(feats))
+
+    python data_prep.py convert --csv IIoT_Malware_Timeseries_CLEAN.csv
+    python data_prep.py prepare --csv IIoT_Malware_Timeseries_CLEAN.csv --export preprocessor.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from feature_schema import CSV_PATH
+
+BUNDLE_VERSION = 1
+PREP_VERSION = 1          # bump when prepare() changes, to invalidate cached arrays
+PREP_CACHE = os.getenv("PREP_CACHE", "prep_cache")
+
+# Columns the notebooks drop before training (normalized names)
+DROP_COLUMNS = ("timestamp", "protocol_type", "flags")
+LABEL_COLUMN = "label"
+
+Prepared = namedtuple("Prepared", "X_train X_test y_train y_test classes feature_names preprocessor key")
+
+
+def normalize_name(name):
+    """'Packet Size ' -> 'packet_size', as the notebooks rename columns."""
+    return name.strip().lower().replace(" ", "_")
+
+
+# ── columnar bundle ──────────────────────────────────────────────────
+
+def bundle_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".bundle"
+
+
+def file_sha1(path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _source_stat(csv_path):
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _read_meta(bundle):
+    try:
+        with open(os.path.join(bundle, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _fresh_meta(csv_path):
+    """The bundle's metadata if it exists and still matches the CSV, else None."""
+    meta = _read_meta(bundle_path(csv_path))
+    if not meta or meta.get("version") != BUNDLE_VERSION:
+        return None
+    source = meta["source"]
+    if {k: source[k] for k in ("size", "mtime_ns")} != _source_stat(csv_path):
+        return None
+    return meta
+
+
+def convert(csv_path=CSV_PATH):
+    """Parse the CSV once and write its columnar bundle; returns the bundle metadata."""
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path, low_memory=False)
+    bundle = bundle_path(csv_path)
+    tmp = f"{bundle}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        entry = {"name": name, "file": f"{i}.npy"}
+        if not (pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col)):
+            cat = pd.Categorical(col.astype("string"))
+            values = cat.codes.astype(np.int32)
+            entry["categories"] = [str(c) for c in cat.categories]
+        else:
+            values = col.to_numpy()
+        entry["dtype"] = str(values.dtype)
+        np.save(os.path.join(tmp, entry["file"]), values)
+        columns.append(entry)
+
+    meta = {"version": BUNDLE_VERSION, "rows": len(df), "columns": columns,
+            "source": {"path": os.path.abspath(csv_path), **_source_stat(csv_path),
+                       "sha1": file_sha1(csv_path)}}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(bundle, ignore_errors=True)
+    os.replace(tmp, bundle)
+    print(f"[+] {csv_path}: {len(df)} rows x {len(columns)} columns → {bundle} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return meta
+
+
+def load_frame(csv_path=CSV_PATH, columns=None):
+    """The CSV as a DataFrame, read from its bundle (converted first if missing or stale)."""
+    meta = _fresh_meta(csv_path) or convert(csv_path)
+    bundle = bundle_path(csv_path)
+    data = {}
+    for entry in meta["columns"]:
+        if columns is not None and entry["name"] not in columns:
+            continue
+        values = np.load(os.path.join(bundle, entry["file"]), mmap_mode="r")
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(np.asarray(values), entry["categories"])
+        data[entry["name"]] = values
+    return pd.DataFrame(data)
+
+
+def data_hash(csv_path=CSV_PATH):
+    """SHA-1 of the CSV contents (from the bundle, so it is only computed on conversion)."""
+    return (_fresh_meta(csv_path) or convert(csv_path))["source"]["sha1"]
+
+
+# ── preprocessing ────────────────────────────────────────────────────
+
+class Preprocessor:
+    """Categorical codes, median imputation and standard scaling, as fitted by prepare()."""
+
+    def __init__(self, feature_names, categories, medians, mean=None, scale=None, classes=None):
+        self.feature_names = list(feature_names)
+        self.categories = dict(categories)       # feature -> sorted category strings
+        self.medians = np.asarray(medians, dtype=np.float64)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.classes = list(classes or [])
+
+    @classmethod
+    def fit(cls, X):
+        """Encoders and medians from a DataFrame of (normalized) feature columns."""
+        categories = {name: sorted(X[name].astype(str).unique().tolist())
+                      for name in X.columns if not pd.api.types.is_numeric_dtype(X[name])}
+        pre = cls(X.columns, categories, np.zeros(X.shape[1]))
+        encoded = pre._encode(X)
+        encoded[~np.isfinite(encoded)] = np.nan
+        with np.errstate(all="ignore"):
+            medians = np.nanmedian(encoded, axis=0)
+        pre.medians = np.nan_to_num(medians, nan=0.0)     # all-missing column
+        return pre
+
+    def fit_scaler(self, X):
+        self.mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        self.scale = np.where(std == 0, 1.0, std)
+
+    def _encode(self, X):
+        if not isinstance(X, pd.DataFrame):
+            return np.array(X, dtype=np.float64, ndmin=2)
+        out = np.empty((len(X), len(self.feature_names)))
+        for j, name in enumerate(self.feature_names):
+            col = X[name]
+            if name in self.categories:
+                # Unseen categories become NaN and are imputed like missing values
+                codes = pd.Categorical(col.astype(str), categories=self.categories[name]).codes
+                out[:, j] = np.where(codes < 0, np.nan, codes)
+            else:
+                out[:, j] = pd.to_numeric(col, errors="coerce")
+        return out
+
+    def impute(self, X):
+        X = self._encode(X)
+        X[~np.isfinite(X)] = np.nan
+        return np.where(np.isnan(X), self.medians, X)
+
+    def transform(self, X, scale=True):
+        """DataFrame with the feature columns (any order), or rows in feature_names order."""
+        X = self.impute(X)
+        if scale and self.mean is not None:
+            X = (X - self.mean) / self.scale
+        return X
+
+    def transform_record(self, record):
+        """One named feature dict (e.g. features_as_record) -> a 1-row matrix."""
+        row = {normalize_name(k): v for k, v in record.items()}
+        return self.transform(pd.DataFrame([{name: row.get(name, np.nan) for name in self.feature_names}]))
+
+    def decode(self, codes):
+        return [self.classes[i] for i in codes]
+
+    def to_dict(self):
+        return {"version": PREP_VERSION, "feature_names": self.feature_names,
+                "categories": self.categories, "medians": self.medians.tolist(),
+                "mean": None if self.mean is None else self.mean.tolist(),
+                "scale": None if self.scale is None else self.scale.tolist(),
+                "classes": self.classes}
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def load_preprocessor(path):
+    with open(path, encoding="utf-8") as f:
+        d = json.load(f)
+    if d.get("version") != PREP_VERSION:
+        raise ValueError(f"{path}: preprocessor v{d.get('version')}, expected v{PREP_VERSION}")
+    return Preprocessor(d["feature_names"], d["categories"], d["medians"],
+                        d["mean"], d["scale"], d["classes"])
+
+
+def prep_key(csv_path, **params):
+    blob = json.dumps({"prep": PREP_VERSION, "data": data_hash(csv_path), **params},
+                      sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def _load_cached(path, key):
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+              for name in ("X_train", "X_test", "y_train", "y_test")}
+    pre = load_preprocessor(os.path.join(path, "preprocessor.json"))
+    return Prepared(classes=pre.classes, feature_names=pre.feature_names,
+                    preprocessor=pre, key=key, **arrays)
+
+
+def prepare(csv_path=CSV_PATH, test_size=0.2, seed=42, smote=True, scale=True,
+            drop=DROP_COLUMNS, cache_dir=PREP_CACHE):
+    """
+    Train/test arrays and the fitted Preprocessor, from the cache when the
+    data and parameters were seen before. y_* are integer codes into
+    `classes` (the target's sorted labels).
+    """
+    key = prep_key(csv_path, test_size=test_size, seed=seed, smote=smote, scale=scale, drop=drop)
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, "preprocessor.json")):
+        print(f"[+] Preprocessed arrays from cache {path}")
+        return _load_cached(path, key)
+
+    from sklearn.model_selection import train_test_split
+
+    start = time.perf_counter()
+    df = load_frame(csv_path)
+    df.columns = [normalize_name(c) for c in df.columns]
+    y = df[LABEL_COLUMN].astype(str).to_numpy()
+    X = df.drop(columns=[c for c in (*drop, LABEL_COLUMN) if c in df.columns])
+
+    pre = Preprocessor.fit(X)
+    X_all = pre.impute(X)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X_all, y, test_size=test_size, stratify=y, random_state=seed)
+    if smote:
+        from imblearn.over_sampling import SMOTE
+        X_train, y_train = SMOTE(random_state=seed).fit_resample(X_train, y_train)
+    if scale:
+        pre.fit_scaler(X_train)
+        X_train, X_test = pre.transform(X_train), pre.transform(X_test)
+    pre.classes = sorted(set(y_train))
+    y_train = np.searchsorted(pre.classes, y_train)
+    y_test = np.searchsorted(pre.classes, y_test)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for name, arr in (("X_train", X_train), ("X_test", X_test), ("y_train", y_train), ("y_test", y_test)):
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+    pre.save(os.path.join(tmp, "preprocessor.json"))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    print(f"[+] Preprocessed {len(y_train)} train / {len(y_test)} test rows in "
+          f"{time.perf_counter() - start:.1f}s → {path}")
+    return _load_cached(path, key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar training data and cached preprocessing")
+    parser.add_argument("command", choices=["convert", "prepare"])
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-smote", action="store_true")
+    parser.add_argument("--no-scale", action="store_true")
+    parser.add_argument("--cache-dir", default=PREP_CACHE)
+    parser.add_argument("--export", default=None, help="also write the fitted preprocessor JSON here")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.csv)
+        return
+    start = time.perf_counter()
+    data = prepare(args.csv, args.test_size, args.seed, smote=not args.no_smote,
+                   scale=not args.no_scale, cache_dir=args.cache_dir)
+    print(f"[+] X_train {data.X_train.shape}, X_test {data.X_test.shape}, "
+          f"{len(data.classes)} classes in {time.perf_counter() - start:.2f}s")
+    if args.export:
+        data.preprocessor.save(args.export)
+        print(f"[+] Preprocessor → {args.export}")
+
+
+if __name__ == "__main__":
+    main()
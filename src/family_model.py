@@ -0,0 +1,160 @@
+"""
+Batch scoring for the per-family detectors in family_detectors.pkl.
+
+FamilyDetectors wraps the { family_name: CalibratedClassifierCV } dict and
+resolves each classifier's positive-class column once at load time.
+FusedFamilyDetectors goes one step further: it unpacks every calibrated
+fold into its raw booster plus calibration map, so a batch costs one
+native booster call per fold and the isotonic/sigmoid calibration is
+applied with numpy over all rows at once.
+
+    python family_model.py fuse family_detectors.pkl family_detectors.fused.pkl
+
+An .npz path loads the numpy-only export from model_export.py instead.
+"""
+import sys
+
+import joblib
+import numpy as np
+
+
+class FamilyDetectors:
+    """{ family_name: binary classifier } with positive columns resolved once."""
+
+    def __init__(self, model_dict):
+        self.models = dict(model_dict)
+        self.families = list(self.models)
+        self.pos_idx = [list(clf.classes_).index(1) for clf in self.models.values()]
+
+    def __iter__(self):
+        return iter(self.families)
+
+    def __len__(self):
+        return len(self.families)
+
+    def predict_batch(self, X):
+        """
+        Score rows X[n, d]. Returns (labels, prob_matrix) where prob_matrix[i, j]
+        is row i's positive-class probability for self.families[j].
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        probs = np.empty((X.shape[0], len(self.families)))
+        for j, (clf, pos) in enumerate(zip(self.models.values(), self.pos_idx)):
+            probs[:, j] = clf.predict_proba(X)[:, pos]
+        return self.labels_for(probs), probs
+
+    def labels_for(self, probs):
+        return [self.families[i] for i in probs.argmax(axis=1)]
+
+
+def _raw_scorer(estimator):
+    """
+    Return f(X) -> 1-D uncalibrated score, computed the way sklearn's
+    calibration does (decision_function if available, else P(class 1)).
+    XGBoost models are called through their booster directly.
+    """
+    booster = getattr(estimator, "get_booster", None)
+    if booster is not None:
+        booster = booster()
+        try:
+            iteration_range = (0, estimator.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+        return lambda X: booster.inplace_predict(X, iteration_range=iteration_range)
+    if hasattr(estimator, "decision_function"):
+        return lambda X: np.ravel(estimator.decision_function(X))
+    return lambda X: estimator.predict_proba(X)[:, 1]
+
+
+def _calibration_map(calibrator, method):
+    """Return f(scores) -> calibrated P(class 1) as plain numpy."""
+    if method == "isotonic":
+        xs = np.asarray(calibrator.X_thresholds_, dtype=float)
+        ys = np.asarray(calibrator.y_thresholds_, dtype=float)
+        # np.interp clamps outside [xs[0], xs[-1]], like out_of_bounds="clip"
+        return lambda s: np.interp(s, xs, ys)
+    if method == "sigmoid":
+        a, b = float(calibrator.a_), float(calibrator.b_)
+        return lambda s: 1.0 / (1.0 + np.exp(a * s + b))
+    raise ValueError(f"unsupported calibration method {method!r}")
+
+
+class FusedFamilyDetectors(FamilyDetectors):
+    """
+    FamilyDetectors with every CalibratedClassifierCV flattened into
+    (raw scorer, calibration map) pairs. Produces the same probabilities as
+    the wrapped classifiers without going through sklearn per fold.
+    """
+
+    def __init__(self, model_dict):
+        super().__init__(model_dict)
+        self.folds = []   # per family: list of (raw scorer, calibration map)
+        for family, clf in self.models.items():
+            folds = []
+            for cal in clf.calibrated_classifiers_:
+                if len(cal.calibrators) != 1:
+                    raise ValueError(f"{family}: only binary detectors can be fused")
+                folds.append((_raw_scorer(cal.estimator),
+                              _calibration_map(cal.calibrators[0], cal.method)))
+            self.folds.append(folds)
+
+    def predict_batch(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        probs = np.zeros((X.shape[0], len(self.families)))
+        for j, (folds, pos) in enumerate(zip(self.folds, self.pos_idx)):
+            col = probs[:, j]
+            for scorer, calibrate in folds:
+                col += calibrate(scorer(X))
+            col /= len(folds)
+            if pos == 0:
+                col[:] = 1.0 - col
+        return self.labels_for(probs), probs
+
+    def __getstate__(self):
+        # Scorers are closures; rebuild them from the classifiers on load
+        return {"models": self.models}
+
+    def __setstate__(self, state):
+        self.__init__(state["models"])
+
+
+def fuse(model_dict):
+    """Compile a { family: CalibratedClassifierCV } dict into a fused predictor."""
+    if isinstance(model_dict, FamilyDetectors):
+        model_dict = model_dict.models
+    return FusedFamilyDetectors(model_dict)
+
+
+def as_detectors(model):
+    """Accept a raw model dict or any detectors object and return the latter."""
+    if hasattr(model, "predict_batch"):
+        return model
+    return FamilyDetectors(model)
+
+
+def load_detectors(path, fused=True):
+    """
+    Load family_detectors.pkl (or an already fused artifact). Plain dicts are
+    fused when possible and fall back to FamilyDetectors otherwise; .npz
+    exports load as CompiledFamilyDetectors.
+    """
+    if str(path).endswith(".npz"):
+        from model_export import load_compiled
+        return load_compiled(path)
+    model = joblib.load(path)
+    if isinstance(model, FamilyDetectors):
+        return model
+    if fused:
+        try:
+            return fuse(model)
+        except (AttributeError, ValueError) as e:
+            print(f"[!] Cannot fuse {path} ({e}); using per-family predict_proba")
+    return FamilyDetectors(model)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "fuse":
+        sys.exit("usage: python family_model.py fuse <family_detectors.pkl> <out.pkl>")
+    fused = fuse(joblib.load(sys.argv[2]))
+    joblib.dump(fused, sys.argv[3])
+    print(f"[+] Fused {len(fused)} family detectors → {sys.argv[3]}")
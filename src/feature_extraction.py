@@ -1,14 +1,30 @@
-import pandas as pd
-import pyshark
+import socket
 import numpy as np
+from bisect import insort
 from collections import Counter
 from math import log2
+import ioc_engine
+from pcap_reader import PacketInfo, read_packets
+from feature_schema import flags_categories, protocol_categories
 
-# Automatically load categories from your training CSV
-CSV_PATH = "IIoT_Malware_Timeseries_CLEAN.csv"
-df = pd.read_csv(CSV_PATH)
-PROTOCOL_CATEGORIES = sorted(df['Protocol Type'].dropna().unique().tolist())
-FLAGS_CATEGORIES    = sorted(df['Flags'].dropna().unique().tolist())
+# "native" decodes the capture file directly, "pyshark" goes through tshark
+DEFAULT_BACKEND = "native"
+
+# Payload bytes buffered per accumulator before one np.bincount over the lot
+PAYLOAD_FLUSH_BYTES = 4096
+
+# Timestamps held back per accumulator so a packet that arrives up to this
+# many places late still gets its own gap (multi-queue NICs, merged captures)
+REORDER_DEPTH = 8
+
+
+def __getattr__(name):
+    # Category lists come from feature_schema.json, loaded on first access
+    if name == "PROTOCOL_CATEGORIES":
+        return protocol_categories()
+    if name == "FLAGS_CATEGORIES":
+        return flags_categories()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def one_hot(value, categories):
@@ -20,114 +36,433 @@ def shannon_entropy(byte_arr: np.ndarray) -> float:
     """Compute Shannon entropy of a 1-D array of byte values."""
     if byte_arr.size == 0:
         return 0.0
-    counts = np.bincount(byte_arr, minlength=256)
-    probs = counts[counts>0] / byte_arr.size
+    return entropy_from_counts(np.bincount(byte_arr, minlength=256))
+
+
+def entropy_from_counts(counts: np.ndarray) -> float:
+    """Compute Shannon entropy from a histogram of byte values."""
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    probs = counts[counts>0] / total
     return float(-np.sum(probs * np.log2(probs)))
 
 
-def extract_features_full(pcap_file: str) -> list:
+def entropy_rows(counts: np.ndarray) -> np.ndarray:
+    """Shannon entropy of every row of a (groups, 256) byte histogram."""
+    totals = counts.sum(axis=1, keepdims=True)
+    probs = counts / np.where(totals == 0, 1, totals)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(probs > 0, probs * np.log2(probs), 0.0)
+    return 0.0 - terms.sum(axis=1)
+
+
+def grouped_payload_entropy(payloads, groups) -> dict:
     """
-    Read PCAP, compute 15 numerical features + one-hot most-common Protocol Type & Flags.
-    Returns a flat list of length == 15 + len(PROTOCOL_CATEGORIES) + len(FLAGS_CATEGORIES).
+    Payload entropy per group (flow key, window index, ...) in one pass over
+    a batch of packets: payloads are joined group by group into a single
+    buffer and each group's contiguous slice goes through one np.bincount.
+    Returns {group: entropy}.
     """
-    # Capture packets
+    ids = {}
+    group_ids = np.fromiter((ids.setdefault(g, len(ids)) for g in groups), dtype=np.int64)
+    if not ids:
+        return {}
+    order = np.argsort(group_ids, kind="stable")
+    data = np.frombuffer(b"".join([payloads[i] for i in order]), dtype=np.uint8)
+    lengths = np.fromiter((len(p) for p in payloads), dtype=np.int64, count=len(group_ids))
+    group_bytes = np.bincount(group_ids, weights=lengths, minlength=len(ids)).astype(np.int64)
+    bounds = np.concatenate(([0], np.cumsum(group_bytes)))
+    counts = np.empty((len(ids), 256), dtype=np.int64)
+    for g in range(len(ids)):
+        counts[g] = np.bincount(data[bounds[g]:bounds[g + 1]], minlength=256)
+    return dict(zip(ids, entropy_rows(counts).tolist()))
+
+
+def pyshark_packets(pcap_file: str):
+    """Yield PacketInfo records by dissecting the capture with tshark."""
+    import pyshark
+
     cap = pyshark.FileCapture(pcap_file, keep_packets=False)
-    times, frame_lens, ip_lens = [], [], []
-    protocols, flags_list = [], []
-    payload_bytes = []
+    try:
+        for pkt in cap:
+            try:
+                t = float(pkt.sniff_timestamp)
+                fl = int(pkt.length)
+
+                # IP length if present
+                ip_len = int(pkt.ip.len) if hasattr(pkt, 'ip') else fl
+
+                # Endpoints for flow keys
+                src = dst = None
+                ip_proto = sport = dport = 0
+                if hasattr(pkt, 'ip'):
+                    src, dst = socket.inet_aton(pkt.ip.src), socket.inet_aton(pkt.ip.dst)
+                    ip_proto = int(pkt.ip.proto)
+                elif hasattr(pkt, 'ipv6'):
+                    src = socket.inet_pton(socket.AF_INET6, pkt.ipv6.src)
+                    dst = socket.inet_pton(socket.AF_INET6, pkt.ipv6.dst)
+                    ip_proto = int(pkt.ipv6.nxt)
+
+                # Protocol & Flags
+                proto = pkt.highest_layer.upper()
+                flags, payload = None, b""
+                if 'TCP' in pkt:
+                    sport, dport = int(pkt.tcp.srcport), int(pkt.tcp.dstport)
+                    flags = pkt.tcp.flags_str.upper()
+                    raw = getattr(pkt.tcp, 'payload', None)
+                    if raw:
+                        try:
+                            payload = bytes.fromhex(raw.replace(':', ''))
+                        except ValueError:
+                            pass
+                elif 'UDP' in pkt:
+                    sport, dport = int(pkt.udp.srcport), int(pkt.udp.dstport)
+                    raw = getattr(pkt.udp, 'payload', None)
+                    if raw:
+                        try:
+                            payload = bytes.fromhex(raw.replace(':', ''))
+                        except ValueError:
+                            pass
+            except Exception:
+                continue
+            yield PacketInfo(t, fl, ip_len, proto, flags, payload,
+                             src, dst, ip_proto, sport, dport)
+    finally:
+        cap.close()
+
+
+def iter_packets(pcap_file: str, backend: str = DEFAULT_BACKEND, keep=None):
+    """Yield PacketInfo records from `pcap_file` using the chosen backend (`keep`: see read_packets)."""
+    if backend == "native":
+        return read_packets(pcap_file, keep)
+    if backend == "pyshark":
+        packets = pyshark_packets(pcap_file)
+        return packets if keep is None else (p for p in packets if keep(p.timestamp, p.length))
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+class FlowFeatureAccumulator:
+    """
+    Incremental form of the extract_features_full statistics.
+
+    Packets are fed one at a time with add(); the state is a handful of
+    running sums (Welford mean/variance), min/max timestamps, a 256-bin
+    payload byte histogram and protocol/flag counters, so memory does not
+    grow with the window. features() returns the same flat vector as the
+    batch computation. Inter-arrival gaps are taken between sorted
+    timestamps, like the batch computation: the newest REORDER_DEPTH
+    timestamps are held back so late packets slot into place, and one
+    arriving later still is counted as a zero gap instead of a negative one.
+    """
+
+    # Many of these live at once in a FlowTable, so keep them small
+    __slots__ = ("n", "min_ts", "max_ts", "first_ts", "last_ts", "recent_ts",
+                 "size_mean", "size_m2", "size_max", "total_bytes", "ip_len_total",
+                 "iat_n", "iat_mean", "iat_m2", "byte_counts", "payload_buf", "payload_tail",
+                 "flush_bytes", "protocols", "flags", "ioc", "extra_n", "extra_bytes")
+
+    def __init__(self, flush_bytes=PAYLOAD_FLUSH_BYTES):
+        self.n = 0
+        self.min_ts = float("inf")
+        self.max_ts = float("-inf")
+        # Timestamps whose gaps are in the IAT state run first_ts .. last_ts;
+        # the newest ones wait, sorted, in recent_ts (see _add_time)
+        self.first_ts = None
+        self.last_ts = None
+        self.recent_ts = []
+        # Frame sizes (Welford)
+        self.size_mean = 0.0
+        self.size_m2 = 0.0
+        self.size_max = 0
+        self.total_bytes = 0
+        self.ip_len_total = 0
+        # Inter-arrival times (Welford)
+        self.iat_n = 0
+        self.iat_mean = 0.0
+        self.iat_m2 = 0.0
+        # Categorical / payload state (histogram allocated on first payload;
+        # payloads are batched in payload_buf and folded in by _flush_payload)
+        self.byte_counts = None
+        self.payload_buf = bytearray()
+        # Last bytes of the previous flush, so a signature across two flushes still matches
+        self.payload_tail = b""
+        self.flush_bytes = flush_bytes
+        self.protocols = Counter()
+        self.flags = Counter()
+        # IOC | C2 | EXFIL bits of every feed indicator seen (ioc_engine)
+        self.ioc = 0
+        # Packets / bytes shed by overload sampling: only their timestamp and
+        # length were seen (add_shed)
+        self.extra_n = 0
+        self.extra_bytes = 0
+
+    def add(self, pkt: PacketInfo):
+        """Fold one packet into the running state."""
+        engine = ioc_engine.ENGINE
+        if engine is not None:
+            self.ioc |= engine.match(pkt)
+        self._add_time(pkt.timestamp)
+
+        fl = pkt.length
+        self.n += 1
+        delta = fl - self.size_mean
+        self.size_mean += delta / self.n
+        self.size_m2 += delta * (fl - self.size_mean)
+        if fl > self.size_max:
+            self.size_max = fl
+        self.total_bytes += fl
+        self.ip_len_total += pkt.ip_len
 
-    for pkt in cap:
-        try:
-            t = float(pkt.sniff_timestamp)
-            times.append(t)
+        self.protocols[pkt.highest_layer] += 1
+        if pkt.tcp_flags is not None:
+            self.flags[pkt.tcp_flags.upper()] += 1
+            if pkt.payload:
+                self.payload_buf += pkt.payload
+                if len(self.payload_buf) >= self.flush_bytes:
+                    self._flush_payload()
+        elif pkt.payload and engine is not None:
+            # UDP: each datagram is scanned on its own (and stays out of the entropy)
+            self.ioc |= engine.match_payload(pkt.payload)
 
-            fl = int(pkt.length)
-            frame_lens.append(fl)
+    def add_shed(self, t: float, length: int):
+        """
+        Count a packet shed by overload sampling (sampling.py) from its
+        capture record alone: timing, packet and byte totals stay exact,
+        size statistics, protocols and payload come from the packets kept.
+        """
+        self._add_time(t)
+        self.extra_n += 1
+        self.extra_bytes += length
 
-            # IP length if present
-            if hasattr(pkt, 'ip'):
-                ip_lens.append(int(pkt.ip.len))
+    def _add_time(self, t):
+        """
+        Place `t` among the last REORDER_DEPTH timestamps, in time order, and
+        fold the oldest of them into the IAT state. A packet later than that
+        counts as a zero gap (duration and Mean IAT still use its real time).
+        """
+        if t < self.min_ts:
+            self.min_ts = t
+        if t > self.max_ts:
+            self.max_ts = t
+        recent = self.recent_ts
+        if recent and t >= recent[-1]:
+            recent.append(t)
+        else:
+            if self.last_ts is not None and t < self.last_ts:
+                t = self.last_ts
+            insort(recent, t)
+        if len(recent) > REORDER_DEPTH:
+            self._add_gap(recent.pop(0))
+
+    def _add_gap(self, t):
+        if self.last_ts is not None:
+            iat = t - self.last_ts
+            self.iat_n += 1
+            delta = iat - self.iat_mean
+            self.iat_mean += delta / self.iat_n
+            self.iat_m2 += delta * (iat - self.iat_mean)
+        else:
+            self.first_ts = t
+        self.last_ts = t
+
+    def _flush_times(self):
+        """Fold the held-back timestamps into the IAT state (later packets are clamped)."""
+        for t in self.recent_ts:
+            self._add_gap(t)
+        self.recent_ts = []
+
+    def _flush_payload(self):
+        """Fold the buffered payload bytes into the byte histogram (and scan them for signatures)."""
+        if not self.payload_buf:
+            return
+        engine = ioc_engine.ENGINE
+        if engine is not None:
+            data = self.payload_tail + self.payload_buf if self.payload_tail else self.payload_buf
+            self.ioc |= engine.match_payload(data)
+            overlap = engine.max_signature_len - 1
+            self.payload_tail = bytes(data[-overlap:]) if overlap > 0 else b""
+        counts = np.bincount(np.frombuffer(self.payload_buf, dtype=np.uint8), minlength=256)
+        if self.byte_counts is None:
+            self.byte_counts = counts
+        else:
+            self.byte_counts += counts
+        self.payload_buf = bytearray()
+
+    def merge(self, other: "FlowFeatureAccumulator"):
+        """
+        Fold in the state of `other`, which must cover packets that arrived
+        after the ones already seen here (e.g. the next pane of a window).
+        """
+        other._flush_times()
+        if other.last_ts is None:
+            return self
+        other._flush_payload()
+        self._flush_times()
+        if self.last_ts is None:
+            src = other.copy()
+            for name in self.__slots__:
+                setattr(self, name, getattr(src, name))
+            return self
+
+        # Frame sizes: Chan et al. parallel variance
+        n = self.n + other.n
+        delta = other.size_mean - self.size_mean
+        self.size_m2 += other.size_m2 + delta * delta * self.n * other.n / n
+        self.size_mean += delta * other.n / n
+        self.n = n
+        self.size_max = max(self.size_max, other.size_max)
+        self.total_bytes += other.total_bytes
+        self.ip_len_total += other.ip_len_total
+
+        # IATs: both sides' gaps plus the one between the two runs
+        gaps = [(1, other.first_ts - self.last_ts, 0.0)]
+        if other.iat_n:
+            gaps.append((other.iat_n, other.iat_mean, other.iat_m2))
+        for g_n, g_mean, g_m2 in gaps:
+            total = self.iat_n + g_n
+            delta = g_mean - self.iat_mean
+            self.iat_m2 += g_m2 + delta * delta * self.iat_n * g_n / total
+            self.iat_mean += delta * g_n / total
+            self.iat_n = total
+
+        self.min_ts = min(self.min_ts, other.min_ts)
+        self.max_ts = max(self.max_ts, other.max_ts)
+        self.last_ts = other.last_ts
+        self._flush_payload()
+        if other.byte_counts is not None:
+            if self.byte_counts is None:
+                self.byte_counts = other.byte_counts.copy()
             else:
-                ip_lens.append(fl)
-
-            # Protocol & Flags
-            proto = pkt.highest_layer.upper()
-            protocols.append(proto)
-            if 'TCP' in pkt:
-                flags_list.append(pkt.tcp.flags_str.upper())
-                raw = getattr(pkt.tcp, 'payload', None)
-                if raw:
-                    hexstr = raw.replace(':', '')
-                    try:
-                        payload_bytes.extend(bytes.fromhex(hexstr))
-                    except ValueError:
-                        pass
-        except Exception:
+                self.byte_counts += other.byte_counts
+        self.payload_tail = other.payload_tail
+        self.protocols.update(other.protocols)
+        self.flags.update(other.flags)
+        self.ioc |= other.ioc
+        self.extra_n += other.extra_n
+        self.extra_bytes += other.extra_bytes
+        return self
+
+    def copy(self) -> "FlowFeatureAccumulator":
+        new = FlowFeatureAccumulator.__new__(FlowFeatureAccumulator)
+        for name in self.__slots__:
+            setattr(new, name, getattr(self, name))
+        if self.byte_counts is not None:
+            new.byte_counts = self.byte_counts.copy()
+        new.recent_ts = list(self.recent_ts)
+        new.payload_buf = bytearray(self.payload_buf)
+        new.protocols = self.protocols.copy()
+        new.flags = self.flags.copy()
+        return new
+
+    @property
+    def sampling_rate(self) -> float:
+        """Packets per packet kept by overload sampling (1.0 when nothing was shed)."""
+        return (self.n + self.extra_n) / self.n if self.n else float(max(self.extra_n, 1))
+
+    def features(self) -> list:
+        """
+        Return 15 numerical features + one-hot most-common Protocol Type & Flags,
+        laid out exactly like extract_features_full.
+        """
+        proto_cats, flag_cats = protocol_categories(), flags_categories()
+        total_len = 15 + len(proto_cats) + len(flag_cats)
+        self._flush_times()
+        if self.last_ts is None:
+            return [0.0] * total_len
+
+        # Shed packets count in the totals and the timing; the other
+        # per-packet statistics are over the packets kept
+        flow_duration = self.max_ts - self.min_ts
+        total_packets = self.n + self.extra_n
+        total_bytes   = self.total_bytes + self.extra_bytes
+        avg_pkt_size  = total_bytes / total_packets
+        pkt_arr_rate  = total_packets / (flow_duration if flow_duration>0 else 1.0)
+
+        # Inter-arrival times: a single packet counts as one zero gap
+        mean_iat = flow_duration / self.iat_n if self.iat_n else 0.0
+        iat_std  = (self.iat_m2 / self.iat_n) ** 0.5 if self.iat_n else 0.0
+
+        # Packet-size stats (every packet of the window shed: its mean size)
+        if self.n:
+            packet_size_feat   = float(self.size_max)
+            packet_length_feat = self.ip_len_total / self.n
+            pkt_size_variance  = self.size_m2 / self.n
+        else:
+            packet_size_feat = packet_length_feat = avg_pkt_size
+            pkt_size_variance = 0.0
+
+        # Entropies
+        self._flush_payload()
+        payload_entropy = entropy_from_counts(self.byte_counts) if self.byte_counts is not None else 0.0
+        total_proto   = self.n
+        flow_entropy  = float(-sum((c/total_proto)*log2(c/total_proto) for c in self.protocols.values()))
+
+        # Baseline deviation: CV of IATs
+        if mean_iat>0:
+            baseline_deviation = float(iat_std / mean_iat)
+        else:
+            baseline_deviation = 0.0
+
+        # Binary indicators: did any packet hit a feed indicator (ioc_engine)
+        known_ioc  = 1 if self.ioc & ioc_engine.IOC else 0
+        cc_comm    = 1 if self.ioc & ioc_engine.C2 else 0
+        data_exfil = 1 if self.ioc & ioc_engine.EXFIL else 0
+
+        numerical_features = [
+            packet_size_feat,
+            packet_length_feat,
+            mean_iat,
+            flow_duration,
+            total_packets,
+            total_bytes,
+            avg_pkt_size,
+            pkt_arr_rate,
+            payload_entropy,
+            flow_entropy,
+            baseline_deviation,
+            pkt_size_variance,
+            known_ioc,
+            cc_comm,
+            data_exfil
+        ]
+
+        # One-hot encode most-common categories
+        most_proto = self.protocols.most_common(1)[0][0] if self.protocols else None
+        most_flag  = self.flags.most_common(1)[0][0] if self.flags else None
+
+        proto_vec = one_hot(most_proto, proto_cats)
+        flag_vec  = one_hot(most_flag,    flag_cats)
+
+        return numerical_features + proto_vec + flag_vec
+
+
+def extract_features_full(pcap_file: str, backend: str = DEFAULT_BACKEND, sketch=None, sampler=None) -> list:
+    """
+    Read PCAP, compute 15 numerical features + one-hot most-common Protocol Type & Flags.
+    Returns a flat list of length == 15 + len(PROTOCOL_CATEGORIES) + len(FLAGS_CATEGORIES),
+    with the category lists taken from feature_schema.json. A sketches.TrafficSketch
+    passed as `sketch` is fed the same packets. With a sampling.Sampler only its
+    share of the packets is fully processed (see FlowFeatureAccumulator.add_shed).
+    """
+    return accumulate_capture(pcap_file, backend, sketch, sampler).features()
+
+
+def accumulate_capture(pcap_file: str, backend: str = DEFAULT_BACKEND, sketch=None,
+                       sampler=None) -> FlowFeatureAccumulator:
+    """The FlowFeatureAccumulator behind extract_features_full (for its sampling_rate)."""
+    acc = FlowFeatureAccumulator()
+    keep, weight, flow_keep = None, 1, None
+    if sampler is not None:
+        keep, weight = sampler.reader_hook(shed=acc.add_shed), sampler.rate
+        flow_keep = sampler.keep if sampler.mode == "flow" else None
+    for pkt in iter_packets(pcap_file, backend, keep):
+        if flow_keep is not None and not flow_keep(pkt):
+            acc.add_shed(pkt.timestamp, pkt.length)
             continue
-    cap.close()
-
-    # If no packets, return zeros
-    total_len = 15 + len(PROTOCOL_CATEGORIES) + len(FLAGS_CATEGORIES)
-    if not times:
-        return [0.0] * total_len
-
-    # --- Numerical features ---
-    flow_duration = max(times) - min(times)
-    total_packets = len(frame_lens)
-    total_bytes   = sum(frame_lens)
-    avg_pkt_size  = float(np.mean(frame_lens))
-    pkt_arr_rate  = total_packets / (flow_duration if flow_duration>0 else 1.0)
-
-    # Inter-arrival times
-    sorted_t = sorted(times)
-    iats = np.diff(sorted_t) if total_packets>1 else np.array([0.0])
-    mean_iat = float(np.mean(iats))
-
-    # Packet-size stats
-    packet_size_feat   = float(max(frame_lens))
-    packet_length_feat = float(np.mean(ip_lens))
-    pkt_size_variance  = float(np.var(frame_lens))
-
-    # Entropies
-    payload_entropy = shannon_entropy(np.array(payload_bytes, dtype=np.uint8))
-    proto_counts  = Counter(protocols)
-    total_proto   = sum(proto_counts.values())
-    flow_entropy  = float(-sum((c/total_proto)*log2(c/total_proto) for c in proto_counts.values()))
-
-    # Baseline deviation: CV of IATs
-    if mean_iat>0:
-        baseline_deviation = float(np.std(iats) / mean_iat)
-    else:
-        baseline_deviation = 0.0
-
-    # Binary indicators (implement your IOC/C&C/exfil logic)
-    known_ioc  = 0
-    cc_comm    = 0
-    data_exfil = 0
-
-    numerical_features = [
-        packet_size_feat,
-        packet_length_feat,
-        mean_iat,
-        flow_duration,
-        total_packets,
-        total_bytes,
-        avg_pkt_size,
-        pkt_arr_rate,
-        payload_entropy,
-        flow_entropy,
-        baseline_deviation,
-        pkt_size_variance,
-        known_ioc,
-        cc_comm,
-        data_exfil
-    ]
-
-    # One-hot encode most-common categories
-    most_proto = Counter(protocols).most_common(1)[0][0]
-    most_flag  = Counter(flags_list).most_common(1)[0][0] if flags_list else None
-
-    proto_vec = one_hot(most_proto, PROTOCOL_CATEGORIES)
-    flag_vec  = one_hot(most_flag,    FLAGS_CATEGORIES)
-
-    return numerical_features + proto_vec + flag_vec
\ No newline at end of file
+        acc.add(pkt)
+        if sketch is not None:
+            sketch.add(pkt, weight)
+    if sampler is not None:
+        sampler.report()
+    return acc
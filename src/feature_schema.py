@@ -0,0 +1,107 @@
+"""
+Versioned feature schema shared by training, the predictor and the API.
+
+The category vocabularies for the one-hot Protocol Type / Flags columns and
+the full feature-column order live in a small JSON file next to
+family_detectors.pkl. It is read lazily on first use; scanning the training
+CSV is only the fallback used to (re)generate it.
+
+    python feature_schema.py --csv IIoT_Malware_Timeseries_CLEAN.csv
+"""
+import argparse
+import json
+import os
+from functools import lru_cache
+
+SCHEMA_VERSION = 1
+SCHEMA_FILE = os.getenv("FEATURE_SCHEMA", "feature_schema.json")
+CSV_PATH = "IIoT_Malware_Timeseries_CLEAN.csv"
+
+# The 15 numerical columns, in model input order
+NUMERICAL_FEATURES = [
+    "Packet Size", "Packet Length", "Inter-Arrival Time",
+    "Flow Duration", "Total Packets", "Total Bytes",
+    "Average Packet Size", "Packet Arrival Rate",
+    "Payload Entropy", "Flow Entropy",
+    "Baseline Deviation", "Packet Size Variance",
+    "Known IoC", "C&C Communication", "Data Exfiltration"
+]
+
+
+class SchemaError(ValueError):
+    """Raised when the schema file is missing and cannot be regenerated."""
+
+
+def build_schema(csv_path=CSV_PATH):
+    """Derive the schema from the training CSV (reads only the two category columns)."""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, usecols=['Protocol Type', 'Flags'])
+    protocols = sorted(df['Protocol Type'].dropna().unique().tolist())
+    flags = sorted(df['Flags'].dropna().unique().tolist())
+    return {
+        "version": SCHEMA_VERSION,
+        "protocol_categories": protocols,
+        "flags_categories": flags,
+        "feature_columns": (NUMERICAL_FEATURES
+                            + [f"Protocol Type={p}" for p in protocols]
+                            + [f"Flags={f}" for f in flags]),
+    }
+
+
+def write_schema(schema, path=SCHEMA_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=None)
+def load_schema(path=SCHEMA_FILE, csv_path=CSV_PATH):
+    """
+    Return the schema dict, regenerating the file from the training CSV if it
+    is missing or from an older schema version.
+    """
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            schema = json.load(f)
+        if schema.get("version") == SCHEMA_VERSION:
+            return schema
+        print(f"[!] {path} is schema v{schema.get('version')}, expected v{SCHEMA_VERSION}; regenerating")
+    if not os.path.exists(csv_path):
+        raise SchemaError(f"no feature schema at {path} and no training CSV at {csv_path}")
+    schema = build_schema(csv_path)
+    write_schema(schema, path)
+    print(f"[+] Wrote feature schema → {path}")
+    return schema
+
+
+def protocol_categories():
+    return load_schema()["protocol_categories"]
+
+
+def flags_categories():
+    return load_schema()["flags_categories"]
+
+
+def feature_columns():
+    return load_schema()["feature_columns"]
+
+
+def features_as_record(feats):
+    """Flat feature vector → the named dict stored on anomaly records."""
+    n_proto = len(protocol_categories())
+    record = dict(zip(NUMERICAL_FEATURES, feats[:15]))
+    record["Protocol Type (one-hot)"] = feats[15 : 15 + n_proto]
+    record["Flags (one-hot)"] = feats[15 + n_proto :]
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the feature schema from the training CSV")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--out", default=SCHEMA_FILE)
+    args = parser.parse_args()
+    schema = build_schema(args.csv)
+    write_schema(schema, args.out)
+    print(f"[+] {len(schema['feature_columns'])} feature columns → {args.out}")
@@ -0,0 +1,138 @@
+"""
+Per-flow feature extraction.
+
+Packets are grouped by bidirectional 5-tuple (or by source host) into a
+FlowTable of FlowFeatureAccumulators. Flows are exported when they go idle,
+when they exceed the active timeout, or when the table is full (least
+recently seen flow first), so memory stays bounded however many
+concurrent flows the link carries. Every exported row has the same column
+layout as extract_features_full, so it can go straight into predict_batch.
+
+Memory per flow, worst case: the 256-bin int64 byte histogram (~2.2 KB,
+allocated at the first payload flush), up to FLOW_PAYLOAD_FLUSH_BYTES of
+buffered payload, the held-back timestamps and the protocol/flag Counters
+(~1 KB with a handful of entries) - about 4 KB, so ~1 GB at MAX_FLOWS.
+Flows that never buffer FLOW_PAYLOAD_FLUSH_BYTES of payload skip the
+histogram and stay under ~2 KB. Lower max_flows to cap it further.
+"""
+import ipaddress
+from collections import OrderedDict, namedtuple
+
+from feature_extraction import DEFAULT_BACKEND, FlowFeatureAccumulator, iter_packets
+
+FLOW_IDLE_TIMEOUT   = 60      # seconds without packets before a flow is closed
+FLOW_ACTIVE_TIMEOUT = 600     # maximum lifetime of one flow record
+MAX_FLOWS           = 250_000
+# Payload buffered per flow before it is folded into the histogram; far
+# below PAYLOAD_FLUSH_BYTES since up to MAX_FLOWS buffers are live at once
+FLOW_PAYLOAD_FLUSH_BYTES = 512
+
+FlowRecord = namedtuple("FlowRecord", ["key", "acc"])
+
+
+def flow_key(pkt, per_host=False):
+    """
+    Key a packet by (proto, src, sport, dst, dport), or by source address
+    only with per_host=True.
+    """
+    if per_host:
+        return (pkt.src,)
+    return (pkt.proto, pkt.src, pkt.sport, pkt.dst, pkt.dport)
+
+
+def reverse_key(key):
+    proto, src, sport, dst, dport = key
+    return (proto, dst, dport, src, sport)
+
+
+def describe_key(key):
+    """Turn a flow key into a JSON-friendly dict for prediction records."""
+    def addr(raw):
+        return str(ipaddress.ip_address(raw)) if raw is not None else None
+
+    if len(key) == 1:
+        return {"host": addr(key[0])}
+    proto, a, a_port, b, b_port = key
+    return {"proto": proto, "src": addr(a), "sport": a_port,
+            "dst": addr(b), "dport": b_port}
+
+
+class FlowTable:
+    """
+    LRU-ordered table of live flows with idle/active timeouts. Both directions
+    of a conversation share one flow, keyed in the direction of its first packet.
+    """
+
+    def __init__(self, idle_timeout=FLOW_IDLE_TIMEOUT, active_timeout=FLOW_ACTIVE_TIMEOUT,
+                 max_flows=MAX_FLOWS, per_host=False, flush_bytes=FLOW_PAYLOAD_FLUSH_BYTES):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.per_host = per_host
+        self.flush_bytes = flush_bytes
+        self.flows = OrderedDict()   # key -> accumulator, least recently seen first
+        self.evicted = 0             # flows pushed out by the size limit
+
+    def __len__(self):
+        return len(self.flows)
+
+    def add(self, pkt):
+        """Add a packet; return the FlowRecords it caused to be exported."""
+        done = []
+        key = flow_key(pkt, self.per_host)
+        acc = self.flows.get(key)
+        if acc is None and not self.per_host:
+            rkey = reverse_key(key)
+            acc = self.flows.get(rkey)
+            if acc is not None:
+                key = rkey
+        if acc is not None:
+            if pkt.timestamp - acc.min_ts >= self.active_timeout \
+                    or pkt.timestamp - acc.max_ts >= self.idle_timeout:
+                done.append(FlowRecord(key, self.flows.pop(key)))
+                acc = None
+            else:
+                self.flows.move_to_end(key)
+        if acc is None:
+            acc = self.flows[key] = FlowFeatureAccumulator(self.flush_bytes)
+            if len(self.flows) > self.max_flows:
+                old_key, old_acc = self.flows.popitem(last=False)
+                self.evicted += 1
+                done.append(FlowRecord(old_key, old_acc))
+        acc.add(pkt)
+        done.extend(self.expire(pkt.timestamp))
+        return done
+
+    def expire(self, now):
+        """Export flows idle since before `now - idle_timeout`."""
+        done = []
+        limit = now - self.idle_timeout
+        while self.flows:
+            key, acc = next(iter(self.flows.items()))
+            if acc.max_ts > limit:
+                break
+            done.append(FlowRecord(key, self.flows.pop(key)))
+        return done
+
+    def flush(self):
+        """Export every remaining flow (end of capture / window)."""
+        done = [FlowRecord(k, acc) for k, acc in self.flows.items()]
+        self.flows.clear()
+        return done
+
+
+def extract_flow_features(pcap_file: str, backend: str = DEFAULT_BACKEND, sampler=None, **table_kwargs):
+    """
+    Read PCAP and return (flow_keys, rows): one feature row per flow, in the
+    same layout as extract_features_full. A sampling.Sampler drops whole flows
+    by hash (whatever its mode), so the rows kept are exact.
+    """
+    table = FlowTable(**table_kwargs)
+    records = []
+    keep = sampler.keep if sampler is not None and sampler.rate > 1 else None
+    for pkt in iter_packets(pcap_file, backend):
+        if keep is not None and not keep(pkt):
+            continue
+        records.extend(table.add(pkt))
+    records.extend(table.flush())
+    return [r.key for r in records], [r.acc.features() for r in records]
@@ -0,0 +1,340 @@
+"""
+Indicator-of-compromise matching for the known_ioc / cc_comm / data_exfil
+features.
+
+Feeds are plain text files in one directory (IOC_FEEDS, default
+ioc_feeds/). The file name says which feature an indicator sets:
+ioc*.txt -> known_ioc, c2*.txt -> cc_comm, exfil*.txt -> data_exfil.
+One indicator per line, `#` starts a comment:
+
+    203.0.113.7             address
+    198.51.100.0/24         CIDR block (IPv4 or IPv6)
+    192.0.2.10:4444         address + port (either end of the packet)
+    [2001:db8::5]:8883      IPv6 address + port
+    hex:4d5a90000300        payload byte signature
+    str:/bin/busybox        payload signature as text
+
+The engine is built once from the feeds and checked for every packet in
+the feature loop:
+
+- CIDR blocks go into one hash table per prefix length. An address is
+  looked up once per distinct length, and the result is cached per
+  address, so steady traffic costs a single dict lookup per endpoint.
+- Address + port pairs are one hashed set, only consulted for packets
+  whose address appears in one of them.
+- Payload signatures are matched against the TCP payload bytes a
+  FlowFeatureAccumulator already buffers for its entropy histogram, a few
+  KB per call, through a hashed index of signature prefixes (see
+  SignatureMatcher). Each scan is prefixed with the last
+  max_signature_len - 1 bytes of the previous one, so a signature also
+  matches across two consecutive segments of the same window or flow,
+  flush boundaries included. UDP datagrams are scanned one at a time.
+
+watch() reloads the feeds when a file changes. The new engine is built
+next to the old one and swapped in with a single assignment, so packets
+are never checked against a half-loaded feed.
+"""
+import ipaddress
+import os
+import re
+import time
+
+import numpy as np
+
+import metrics
+
+FEEDS_DIR = os.getenv("IOC_FEEDS", "ioc_feeds")
+RELOAD_CHECK_SECONDS = 5.0
+ADDR_CACHE_SIZE = 65536
+
+# Payload signatures are indexed by their first GRAM bytes, hashed into a
+# bitmap of 2**PREFIX_HASH_BITS entries
+GRAM = 4
+PREFIX_HASH_BITS = 20
+
+# Bits of the per-packet match mask, one per feature
+IOC, C2, EXFIL = 1, 2, 4
+CATEGORIES = {"ioc": IOC, "c2": C2, "exfil": EXFIL}
+# Address-cache flag: the address appears in an address:port indicator
+HAS_ENDPOINTS = 8
+
+IOC_RELOADS    = metrics.Counter("wids_ioc_reloads_total", "IoC feed loads", ["result"])
+IOC_INDICATORS = metrics.Gauge("wids_ioc_indicators", "IoC indicators loaded", ["kind"])
+
+# The engine packets are checked against (None: no feeds); replaced whole on reload
+ENGINE = None
+
+_watch = {"dir": None, "fingerprint": None, "checked": 0.0}
+
+
+def category_of(filename):
+    """Match bit for a feed file, from its name; None for files that are not feeds."""
+    name = os.path.basename(filename).lower()
+    if not name.endswith(".txt"):
+        return None
+    for prefix, bit in CATEGORIES.items():
+        if name.startswith(prefix):
+            return bit
+    return None
+
+
+def parse_indicator(text):
+    """
+    ("net", (address bytes, prefix length, prefix)), ("endpoint", (address bytes, port))
+    or ("sig", bytes) for one feed entry; ValueError if it is none of these.
+    """
+    if text.startswith("hex:"):
+        sig = bytes.fromhex(text[4:].replace(":", "").replace(" ", ""))
+        if not sig:
+            raise ValueError("empty signature")
+        return "sig", sig
+    if text.startswith("str:"):
+        if len(text) == 4:
+            raise ValueError("empty signature")
+        return "sig", text[4:].encode("utf-8")
+    if "/" in text or text.count(":") != 1 and not text.startswith("["):
+        net = ipaddress.ip_network(text, strict=False)
+        width = net.max_prefixlen
+        prefix = int(net.network_address) >> (width - net.prefixlen)
+        return "net", (width // 8, net.prefixlen, prefix)
+    host, _, port = text.rpartition(":")
+    port = int(port)
+    if not 0 <= port <= 65535:
+        raise ValueError(f"port {port} out of range")
+    return "endpoint", (ipaddress.ip_address(host.strip("[]")).packed, port)
+
+
+def trie_pattern(signatures):
+    """
+    One regex matching any of `signatures`, shaped as their byte trie:
+    shared prefixes are tested once, so a search costs about one trie walk
+    per payload offset instead of one comparison per signature.
+    """
+    trie = {}
+    for sig in signatures:
+        node = trie
+        for byte in sig:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def emit(node):
+        if None in node:
+            return b""      # a whole signature ends here; longer ones add nothing
+        alts = [re.escape(bytes((byte,))) + emit(child) for byte, child in sorted(node.items())]
+        return alts[0] if len(alts) == 1 else b"(?:" + b"|".join(alts) + b")"
+
+    return re.compile(emit(trie))
+
+
+class SignatureMatcher:
+    """
+    Payload signatures -> OR of the match bits of every signature found in
+    a buffer.
+
+    Signatures are indexed by their first GRAM bytes. A scan computes every
+    GRAM-byte window of the buffer with numpy, drops the ones whose hash is
+    not in a bitmap of signature prefixes, and only the few survivors are
+    compared against the full signatures. Signatures shorter than GRAM go
+    through trie_pattern().
+    """
+
+    def __init__(self, signatures):
+        self.count = len(signatures)
+        self.max_len = max(map(len, signatures), default=0)
+        self.all_bits = 0
+        self.by_prefix = {}       # first GRAM bytes as int -> [(signature, bit)]
+        short = {}
+        for sig, bit in signatures.items():
+            self.all_bits |= bit
+            if len(sig) >= GRAM:
+                self.by_prefix.setdefault(int.from_bytes(sig[:GRAM], "big"), []).append((sig, bit))
+            else:
+                short[sig] = bit
+        prefixes = np.fromiter(self.by_prefix, dtype=np.uint32, count=len(self.by_prefix))
+        self.bitmap = np.zeros(1 << PREFIX_HASH_BITS, dtype=bool)
+        self.bitmap[self._hash(prefixes)] = True
+        self.short = [(bit, trie_pattern(s for s, b in short.items() if b == bit))
+                      for bit in sorted(set(short.values()))]
+
+    @staticmethod
+    def _hash(grams):
+        return (grams * np.uint32(2654435761)) >> np.uint32(32 - PREFIX_HASH_BITS)
+
+    def match(self, data):
+        found = 0
+        for bit, pattern in self.short:
+            if pattern.search(data):
+                found |= bit
+        if not self.by_prefix or len(data) < GRAM or found == self.all_bits:
+            return found
+        b = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+        grams = (b[:-3] << 24) | (b[1:-2] << 16) | (b[2:-1] << 8) | b[3:]
+        for off in np.flatnonzero(self.bitmap[self._hash(grams)]).tolist():
+            for sig, bit in self.by_prefix.get(int(grams[off]), ()):
+                if bit & ~found and data.startswith(sig, off):
+                    found |= bit
+                    if found == self.all_bits:
+                        return found
+        return found
+
+
+class IocEngine:
+    """Indexed feeds; match()/match_payload() return the IOC | C2 | EXFIL bits hit."""
+
+    def __init__(self, networks=(), endpoints=None, signatures=None):
+        # {address length: [(shift, {prefix: bits})]}, one table per prefix length
+        tables = {}
+        for addr_len, plen, prefix, bit in networks:
+            table = tables.setdefault(addr_len, {}).setdefault(plen, {})
+            table[prefix] = table.get(prefix, 0) | bit
+        self.networks = {addr_len: [(addr_len * 8 - plen, t) for plen, t in sorted(by_len.items())]
+                         for addr_len, by_len in tables.items()}
+        self.n_networks = sum(len(t) for by_len in tables.values() for t in by_len.values())
+        self.endpoints = dict(endpoints or {})
+        self.endpoint_addrs = {addr for addr, _ in self.endpoints}
+        self.signatures = SignatureMatcher(signatures) if signatures else None
+        # bytes a payload scan must carry over to catch a signature split between two scans
+        self.max_signature_len = self.signatures.max_len if self.signatures else 0
+        self.addr_cache = {}
+
+    def lookup_address(self, addr):
+        """
+        Bits of every CIDR block containing the packed address `addr`, plus
+        HAS_ENDPOINTS if some address:port indicator uses it. Cached per address.
+        """
+        bits = 0
+        ip = int.from_bytes(addr, "big")
+        for shift, table in self.networks.get(len(addr), ()):
+            bits |= table.get(ip >> shift, 0)
+        if addr in self.endpoint_addrs:
+            bits |= HAS_ENDPOINTS
+        if len(self.addr_cache) >= ADDR_CACHE_SIZE:
+            self.addr_cache.clear()
+        self.addr_cache[addr] = bits
+        return bits
+
+    def match(self, pkt):
+        """Bits of the address and address:port indicators `pkt` hits (payload: match_payload)."""
+        src, dst = pkt.src, pkt.dst
+        if src is None:
+            return 0
+        cache = self.addr_cache
+        a = cache.get(src)
+        if a is None:
+            a = self.lookup_address(src)
+        b = cache.get(dst)
+        if b is None:
+            b = self.lookup_address(dst)
+        bits = a | b
+        if bits & HAS_ENDPOINTS:
+            bits = (bits ^ HAS_ENDPOINTS) | self.endpoints.get((dst, pkt.dport), 0) \
+                | self.endpoints.get((src, pkt.sport), 0)
+        return bits
+
+    def match_payload(self, data):
+        """Bits of the payload signatures found in `data` (bytes or bytearray)."""
+        return self.signatures.match(data) if self.signatures is not None else 0
+
+    def stats(self):
+        return {"networks": self.n_networks, "endpoints": len(self.endpoints),
+                "signatures": self.signatures.count if self.signatures else 0}
+
+
+def feed_files(feeds_dir):
+    if not os.path.isdir(feeds_dir):
+        return []
+    return sorted(os.path.join(feeds_dir, n) for n in os.listdir(feeds_dir)
+                  if category_of(n) is not None)
+
+
+def fingerprint(feeds_dir):
+    """(name, size, mtime) of every feed file; changes whenever a feed is rewritten."""
+    out = []
+    for path in feed_files(feeds_dir):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        out.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+    return tuple(out)
+
+
+def load_feeds(feeds_dir=FEEDS_DIR):
+    """Build an IocEngine from every feed file in `feeds_dir`; None if there are none."""
+    files = feed_files(feeds_dir)
+    if not files:
+        return None
+    networks, endpoints, signatures = [], {}, {}
+    for path in files:
+        bit = category_of(path)
+        skipped = 0
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line.startswith("str:"):
+                    line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    kind, value = parse_indicator(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if kind == "net":
+                    networks.append((*value, bit))
+                elif kind == "endpoint":
+                    endpoints[value] = endpoints.get(value, 0) | bit
+                else:
+                    signatures[value] = signatures.get(value, 0) | bit
+        if skipped:
+            print(f"[!] {path}: skipped {skipped} unparseable lines")
+    return IocEngine(networks, endpoints, signatures)
+
+
+def _indicator_count(kind):
+    stats = ENGINE.stats() if ENGINE is not None else {}
+    return stats.get(kind, 0)
+
+
+for _kind in ("networks", "endpoints", "signatures"):
+    IOC_INDICATORS.set_function(lambda kind=_kind: _indicator_count(kind), kind=_kind)
+
+
+def watch(feeds_dir=None, force=False):
+    """
+    Load the feeds in `feeds_dir` (default: the directory watched last, else
+    FEEDS_DIR), or reload them if a file changed since the last call (checked
+    at most every RELOAD_CHECK_SECONDS). Cheap enough to call once per capture
+    window. Returns the engine in use.
+    """
+    global ENGINE
+    feeds_dir = feeds_dir or _watch["dir"] or FEEDS_DIR
+    now = time.monotonic()
+    if (not force and feeds_dir == _watch["dir"]
+            and now - _watch["checked"] < RELOAD_CHECK_SECONDS):
+        return ENGINE
+    _watch["checked"] = now
+    before = fingerprint(feeds_dir)
+    if feeds_dir == _watch["dir"] and before == _watch["fingerprint"]:
+        return ENGINE
+
+    start = time.perf_counter()
+    try:
+        engine = load_feeds(feeds_dir)
+    except Exception as e:
+        print(f"[!] IoC feeds in {feeds_dir} not reloaded ({e}); keeping the previous set")
+        IOC_RELOADS.inc(result="error")
+        return ENGINE
+    if fingerprint(feeds_dir) != before:
+        # A feed was rewritten while we read it; take it on the next check
+        return ENGINE
+    first = _watch["dir"] != feeds_dir
+    ENGINE = engine
+    _watch["dir"], _watch["fingerprint"] = feeds_dir, before
+    IOC_RELOADS.inc(result="ok")
+    if engine is None:
+        print(f"[!] No IoC feeds in {feeds_dir}; known_ioc/cc_comm/data_exfil stay 0")
+    else:
+        print(f"[+] IoC feeds {'loaded' if first else 'reloaded'} from {feeds_dir} in "
+              f"{time.perf_counter() - start:.2f}s: {engine.stats()}")
+    return ENGINE
@@ -0,0 +1,169 @@
+"""
+Local channel carrying the newest prediction from live_predictor to app.py.
+
+The predictor publishes each prediction by atomically replacing a small
+JSON file; the API keeps the parsed contents in memory, re-reading the file
+only when its mtime changes, and wakes any streaming clients waiting for
+the next prediction. Works the same on Windows and Linux.
+
+Each supervisor worker (live_predictor --name) has its own channel,
+latest_prediction_<name>.json, and tags its payloads with "worker", so
+workers on different interfaces never overwrite each other's latest
+prediction. LatestChannels serves one LatestCache per channel.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+LATEST_FILE = os.getenv("LATEST_FILE", "latest_prediction.json")
+# Worker whose channel publish() writes; live_predictor sets it from --name
+WORKER = None
+WORKER_NAME = re.compile(r"[\w.-]+")
+
+# Fields of a prediction record the dashboard needs
+LATEST_FIELDS = ("timestamp", "label", "probability", "probabilities")
+
+
+def json_default(obj):
+    """JSON fallback: ISO-8601 datetimes (naive ones are UTC, as pymongo returns them)."""
+    if isinstance(obj, datetime):
+        return obj.isoformat() + ("Z" if obj.tzinfo is None else "")
+    return str(obj)
+
+
+def channel_path(worker=None, path=LATEST_FILE):
+    """Channel file of `worker` (`path` itself for an unnamed predictor)."""
+    if not worker:
+        return path
+    if not WORKER_NAME.fullmatch(worker):
+        raise ValueError(f"invalid worker name {worker!r}")
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{worker}{ext}"
+
+
+def set_worker(worker):
+    """Publish to (and tag payloads with) `worker`'s channel from now on."""
+    global WORKER
+    channel_path(worker)      # rejects names that cannot be a file name
+    WORKER = worker or None
+
+
+def publish(record, path=None):
+    """Atomically replace the latest-prediction file of WORKER with `record`."""
+    doc = {k: record[k] for k in LATEST_FIELDS if k in record}
+    if WORKER:
+        doc["worker"] = WORKER
+    path = path or channel_path(WORKER)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f, default=json_default)
+    os.replace(tmp, path)
+
+
+class LatestCache:
+    """In-memory copy of the latest prediction, refreshed from the channel file."""
+
+    def __init__(self, path=LATEST_FILE, poll_interval=0.25):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.cond = threading.Condition()
+        self.doc = None
+        self.body = None      # serialized JSON served as-is
+        self.etag = None
+        self.seq = 0
+        self._mtime = None
+        self._watcher = None
+
+    def start(self):
+        """Start the background thread that watches the channel file."""
+        if self._watcher is None:
+            self.refresh()
+            self._watcher = threading.Thread(target=self._watch, name="latest-watch", daemon=True)
+            self._watcher.start()
+        return self
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.refresh()
+
+    def refresh(self):
+        """Reload the file if it changed since the last read."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            return   # replaced mid-read; next poll picks it up
+        self._mtime = mtime
+        self.set(doc)
+
+    def set(self, doc):
+        """Store a new latest prediction and wake waiting streams."""
+        body = json.dumps(doc, default=json_default)
+        with self.cond:
+            self.doc = doc
+            self.body = body
+            self.etag = hashlib.sha1(body.encode()).hexdigest()[:16]
+            self.seq += 1
+            self.cond.notify_all()
+
+    def get(self):
+        """Return (doc, body, etag) of the latest prediction, or (None, None, None)."""
+        with self.cond:
+            return self.doc, self.body, self.etag
+
+    def wait(self, after_seq, timeout=15.0):
+        """
+        Block until a prediction newer than `after_seq` is available.
+        Returns (seq, body), or None on timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq and self.body is not None, timeout):
+                return None
+            return self.seq, self.body
+
+
+class LatestChannels:
+    """One LatestCache per channel file, started on first use."""
+
+    def __init__(self, path=LATEST_FILE, poll_interval=0.25):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.caches = {}      # worker (None: unnamed predictor) -> LatestCache
+        self.lock = threading.Lock()
+
+    def workers(self):
+        """Workers with a channel file, by name (None first if an unnamed predictor publishes)."""
+        stem, ext = os.path.splitext(self.path)
+        found = sorted(p[len(stem) + 1:len(p) - len(ext)] for p in glob.glob(f"{glob.escape(stem)}_*{ext}"))
+        found = [w for w in found if WORKER_NAME.fullmatch(w)]
+        return ([None] if os.path.exists(self.path) else []) + found
+
+    def get(self, worker=None):
+        """
+        LatestCache of `worker`; without one, the unnamed predictor's, else
+        the first worker's by name (stable, so its ETag only moves with it).
+        None if `worker` has not published anything yet.
+        """
+        if worker is None:
+            workers = self.workers()
+            worker = workers[0] if workers else None
+        path = channel_path(worker, self.path)
+        with self.lock:
+            cache = self.caches.get(worker)
+            if cache is None:
+                if worker is not None and not os.path.exists(path):
+                    return None
+                cache = self.caches[worker] = LatestCache(path, self.poll_interval).start()
+            return cache
@@ -1,9 +1,26 @@
+import argparse
+import re
 import subprocess
+import threading
 import time
-import joblib
-import numpy as np
-from pymongo import MongoClient
-from feature_extraction import extract_features_full, PROTOCOL_CATEGORIES, FLAGS_CATEGORIES
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from cascade import CascadeDetectors, load_filter
+from family_model import as_detectors, load_detectors
+from feature_extraction import accumulate_capture
+from feature_schema import features_as_record
+from flow_table import describe_key, extract_flow_features
+from pcap_reader import iter_packets_from
+from sliding_window import SlidingWindow
+from model_manager import MODEL_DIR, ModelManager
+from mongo_writer import BatchedMongoWriter, CollapsingWriter, mongo_client
+from prediction_cache import PredictionCache
+from sampling import MAX_RATE as MAX_SAMPLE_RATE, Sampler
+from sketches import TrafficSketch
+from anomaly_rollups import ROLLUP_COLLECTION, AnomalyWriter
+import ioc_engine
+import latest_channel
+import metrics
 import os
 from dotenv import load_dotenv
 
@@ -13,6 +30,41 @@ CAPTURE_DURATION = 3600
 DEFAULT_INTERFACE = '5'
 DEVICE_FILTER = "host 192.168.1.44"
 
+# Sliding mode: predict every SLIDING_HOP seconds over the last SLIDING_WINDOW seconds
+SLIDING_WINDOW = 60
+SLIDING_HOP    = 10
+
+# Ring mode: tshark rotates through RING_FILES files of RING_SECONDS each
+RING_DIR     = "ring"
+RING_SECONDS = 60
+RING_FILES   = 10
+RING_WORKERS = 2
+RING_POLL    = 0.5
+
+# Prometheus-style /metrics for this process (0 disables)
+METRICS_PORT = 9108
+
+# Idle links repeat the same feature vector; answer those from an LRU
+PREDICTION_CACHE_SIZE = 4096
+
+# Overload sampling (--sampling): sliding mode sheds packets once capture
+# timestamps trail the clock by MAX_LAG seconds, batch mode once extraction
+# takes more than MAX_EXTRACT_SHARE of the capture time, ring mode once more
+# files wait than there are workers
+MAX_LAG           = 5.0
+MAX_EXTRACT_SHARE = 0.25
+
+STAGE_SECONDS      = metrics.Histogram("wids_stage_seconds", "Time spent per pipeline stage", ["stage"])
+PACKETS_PER_WINDOW = metrics.Histogram("wids_packets_per_window", "Packets behind each scored row",
+                                       buckets=(1, 10, 100, 1e3, 1e4, 1e5, 1e6, 1e7))
+PACKETS_PARSED     = metrics.Counter("wids_packets_parsed_total", "Packets decoded")
+BYTES_PARSED       = metrics.Counter("wids_bytes_parsed_total", "Frame bytes decoded")
+ROWS_SCORED        = metrics.Counter("wids_rows_scored_total", "Feature rows scored")
+PREDICTIONS        = metrics.Counter("wids_predictions_total", "Stored predictions by label", ["label"])
+DROPPED_WINDOWS    = metrics.Counter("wids_dropped_windows_total",
+                                     "Windows/captures that were never scored", ["reason"])
+RING_QUEUE         = metrics.Gauge("wids_ring_queue_depth", "Ring files waiting for extraction")
+
 # MongoDB connection
 load_dotenv()
 user = os.getenv('user')
@@ -57,12 +109,62 @@ def capture_pcap(interface, duration=CAPTURE_DURATION, output=PCAP_FILE, bpf=DEV
     print(f"[+] Capturing {duration}s on {interface} → {output}")
     subprocess.run(cmd, check=True)
 
-def load_model(path=MODEL_FILE):
+def open_capture_stream(interface, bpf=DEVICE_FILTER):
+    """Start a long-running tshark that writes libpcap to its stdout."""
+    cmd = [
+        TSHARK_CMD,
+        "-i", interface,
+        "-f", bpf,
+        "-l",
+        "-F", "pcap",
+        "-w", "-"
+    ]
+    print(f"[+] Streaming capture on {interface} ({bpf})")
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def open_ring_capture(interface, bpf=DEVICE_FILTER, seconds=RING_SECONDS,
+                      files=RING_FILES, ring_dir=RING_DIR):
+    """Start tshark writing a ring buffer of `files` pcaps of `seconds` each."""
+    cmd = [
+        TSHARK_CMD,
+        "-i", interface,
+        "-f", bpf,
+        "-F", "pcap",
+        "-b", f"duration:{seconds}",
+        "-b", f"files:{files}",
+        "-w", os.path.join(ring_dir, "capture.pcap")
+    ]
+    print(f"[+] Ring capture on {interface}: {files} x {seconds}s files in {ring_dir}")
+    return subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+
+# tshark names ring files capture_<seq>_<YYYYmmddHHMMSS>.pcap
+RING_NAME = re.compile(r"^capture_(\d+)_\d{14}\.pcap$")
+
+def ring_files(ring_dir=RING_DIR):
+    """Ring buffer files, oldest first."""
+    found = []
+    for name in os.listdir(ring_dir):
+        m = RING_NAME.match(name)
+        if m:
+            found.append((int(m.group(1)), os.path.join(ring_dir, name)))
+    return [path for _, path in sorted(found)]
+
+def load_model(path=MODEL_FILE, fused=True):
     """
     Loads your joblib‐dumped dict of CalibratedClassifierCVs:
       { family_name: CalibratedClassifierCV, … }
+    and wraps it for batch scoring (fused into raw boosters + calibration
+    maps unless fused=False).
+    """
+    return load_detectors(path, fused=fused)
+
+def predict_batch(X, model_dict):
     """
-    return joblib.load(path)
+    Score many feature rows at once.
+    Returns (labels, prob_matrix) where prob_matrix[i, j] is row i's
+    probability for the j-th family of the model.
+    """
+    return as_detectors(model_dict).predict_batch(X)
 
 def predict(features, model_dict):
     """
@@ -72,87 +174,411 @@ def predict(features, model_dict):
     Each classifier is assumed binary with .classes_ = [0,1],
     so we pull out the probability of class==1 as that family's score.
     """
-    arr = np.array(features).reshape(1, -1)
-    probs = {}
-    for family, clf in model_dict.items():
-        p = clf.predict_proba(arr)[0]
+    detectors = as_detectors(model_dict)
+    labels, prob_matrix = detectors.predict_batch([features])
+    probs = {family: float(p) for family, p in zip(detectors.families, prob_matrix[0])}
+    return labels[0], probs
+
+def count_parsed(rows):
+    """Bump the parse counters from the Total Packets / Total Bytes features."""
+    PACKETS_PARSED.inc(sum(r[4] for r in rows))
+    BYTES_PARSED.inc(sum(r[5] for r in rows))
+
+def between_windows(model_dict):
+    """Reload changed IoC feeds and swap in a newly validated model before the next window."""
+    ioc_engine.watch()
+    if isinstance(model_dict, ModelManager):
+        model_dict.poll()
+
+def handle_prediction(feats, model_dict, interface, col, anomalies_col, extra=None):
+    """Score one feature vector and store the prediction (and anomaly, if any)."""
+    with metrics.timed(STAGE_SECONDS, stage="predict"):
+        label, probs = predict(feats, model_dict)
+    return store_prediction(feats, label, probs, interface, col, anomalies_col, extra,
+                            model_version=getattr(model_dict, "version", None))
+
+def store_prediction(feats, label, probs, interface, col, anomalies_col, extra=None,
+                     model_version=None):
+    """Insert the prediction record, plus an anomaly record when a family beats Benign."""
+    start = time.perf_counter()
+    ROWS_SCORED.inc()
+    PREDICTIONS.inc(label=label)
+    PACKETS_PER_WINDOW.observe(feats[4])
+    risk_score   = probs[label]
+
+    record = {
+        "timestamp":    datetime.now(timezone.utc),
+        "interface":    interface,
+        "label":        label,
+        "probability":   risk_score,
+        "probabilities": probs,
+        "model_version": model_version,
+        **(extra or {})
+    }
+    col.put(record)
+    latest_channel.publish(record)
+    print(f"[+] {record}")
+    benign_p = probs["Benign"]
+    hits = [f for f,p in probs.items() if f!="Benign" and p>benign_p]
+    if hits:
+        anomaly_record = {**record,"anomaly_families": hits,"anomaly_probs":    {f:probs[f] for f in hits},
+                          "features": features_as_record(feats)
+                          }
+        anomalies_col.put(anomaly_record)
+        print(f"[!] Anomaly! stored: {anomaly_record}")
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="store")
+    return record
+
+def handle_flows(pcap_file, model_dict, interface, col, anomalies_col, per_host=False,
+                 sampler=None):
+    """Score every flow of a capture in one batch and store one record per flow."""
+    # Flows are kept or dropped whole: each row stands for 1 in `rate` flows
+    extra = {"sampling_rate": float(sampler.rate)} if sampler else None
+    with metrics.timed(STAGE_SECONDS, stage="extract"):
+        keys, rows = extract_flow_features(pcap_file, per_host=per_host, sampler=sampler)
+    count_parsed(rows)
+    return score_flows(keys, rows, model_dict, interface, col, anomalies_col, extra)
+
+def score_flows(keys, rows, model_dict, interface, col, anomalies_col, extra=None):
+    if not rows:
+        return []
+    detectors = as_detectors(model_dict)
+    with metrics.timed(STAGE_SECONDS, stage="predict"):
+        labels, prob_matrix = detectors.predict_batch(rows)
+    families = detectors.families
+    records = []
+    for key, feats, label, p in zip(keys, rows, labels, prob_matrix):
+        probs = {family: float(v) for family, v in zip(families, p)}
+        records.append(store_prediction(feats, label, probs, interface, col, anomalies_col,
+                                        extra={"flow": describe_key(key), **(extra or {})},
+                                        model_version=getattr(model_dict, "version", None)))
+    return records
+
+def run_batch(interface, bpf, duration, model_dict, col, anomalies_col,
+              flows=False, per_host=False, pcap_file=PCAP_FILE, sketches=False, sampler=None):
+    """Original loop: capture `duration` seconds to a file, score it, repeat."""
+    while True:
         
-        pos_idx = list(clf.classes_).index(1)
-        probs[family] = float(p[pos_idx])
-    
-    best = max(probs, key=probs.get)
-    return best, probs
+        with metrics.timed(STAGE_SECONDS, stage="capture"):
+            capture_pcap(interface, duration=duration, output=pcap_file, bpf=bpf)
+        with metrics.timed(STAGE_SECONDS, stage="flush_wait"):
+            flushed = wait_for_flush(pcap_file)
+        if not flushed:
+            print("[!] PCAP still unstable or empty — skipping this cycle.")
+            DROPPED_WINDOWS.inc(reason="unstable_pcap")
+            continue
 
-def main():
-    
-    interface = DEFAULT_INTERFACE
-    print(f"[+] Using default interface {interface}")
+        between_windows(model_dict)
+        start = time.perf_counter()
+        if flows:
+            handle_flows(pcap_file, model_dict, interface, col, anomalies_col, per_host, sampler)
+        else:
+            sketch = TrafficSketch() if sketches else None
+            with metrics.timed(STAGE_SECONDS, stage="extract"):
+                acc = accumulate_capture(pcap_file, sketch=sketch, sampler=sampler)
+                feats = acc.features()
+            count_parsed([feats])
+            extra = {}
+            if sketch:
+                extra["traffic"] = sketch.summary()
+            if sampler:
+                extra["sampling_rate"] = round(acc.sampling_rate, 3)
+            handle_prediction(feats, model_dict, interface, col, anomalies_col, extra=extra or None)
+        if sampler:
+            # Capture is paused while we extract: shed load when that eats the cycle
+            sampler.adjust((time.perf_counter() - start) / duration)
 
-   
-    client = MongoClient(MONGO_URI)
-    col    = client[DB_NAME][COLLECTION]
-    anomalies_col = client[DB_NAME]["anomalies"]
+      
+        time.sleep(1)
 
-    
-    model_dict = load_model()
+def extract_ring_file(path, flows=False, per_host=False, sketches=False, sampling=None):
+    """
+    Worker: features of one finished ring file, the extraction time, the
+    file's traffic sketch summary (None without sketches or in flow mode)
+    and the sampling rate of its rows. `sampling` is (mode, rate) or None.
+    """
+    start = time.perf_counter()
+    ioc_engine.watch()
+    sketch = None
+    sampler = None
+    if sampling:
+        mode, rate = sampling
+        sampler = Sampler(mode, rate, adaptive=False, per_host=per_host)
+    rate = 1.0
+    if flows:
+        result = extract_flow_features(path, per_host=per_host, sampler=sampler)
+        if sampler:
+            rate = float(sampler.rate)
+    else:
+        sketch = TrafficSketch() if sketches else None
+        acc = accumulate_capture(path, sketch=sketch, sampler=sampler)
+        result, rate = acc.features(), acc.sampling_rate
+    traffic = sketch.summary() if sketch else None
+    return result, time.perf_counter() - start, traffic, rate
 
-    print("[*] Starting live capture & prediction loop. Ctrl-C to stop.")
+def run_ring(interface, bpf, seconds, files, workers, model_dict, col, anomalies_col,
+             flows=False, per_host=False, ring_dir=RING_DIR, ioc_feeds=None, sketches=False,
+             sampler=None):
+    """
+    Pipelined mode: tshark keeps writing a ring buffer while a process pool
+    extracts every finished file and this thread scores and stores it, so
+    capture never pauses. A file counts as finished once tshark has moved
+    on to the next one (or has exited).
+    """
+    os.makedirs(ring_dir, exist_ok=True)
+    for stale in ring_files(ring_dir):
+        os.remove(stale)
+    proc = open_ring_capture(interface, bpf, seconds, files, ring_dir)
+    seen = set()
+    inflight = {}   # future -> (path, time handed to the pool)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=ioc_engine.watch,
+                               initargs=(ioc_feeds,))
     try:
         while True:
-            
-            capture_pcap(interface, duration=CAPTURE_DURATION)
-            if not wait_for_flush(PCAP_FILE):
-                print("[!] PCAP still unstable or empty — skipping this cycle.")
-                continue
+            if isinstance(model_dict, ModelManager):
+                model_dict.poll()     # scoring happens here, between ring files
+            exited = proc.poll() is not None
+            current = ring_files(ring_dir)
+            finished = current if exited else current[:-1]
+            for path in finished:
+                if path not in seen:
+                    seen.add(path)
+                    sampling = None
+                    if sampler:
+                        # Backlog: files still queued beyond one per worker
+                        sampling = (sampler.mode, sampler.adjust(len(inflight), high=workers, low=1))
+                    inflight[pool.submit(extract_ring_file, path, flows, per_host,
+                                         sketches, sampling)] = (path, time.time())
+            if len(inflight) >= files - 1:
+                print(f"[!] {len(inflight)} ring files waiting to be scored — "
+                      f"tshark will overwrite them; raise --workers or --ring-files")
 
+            for fut in [f for f in inflight if f.done()]:
+                path, queued_at = inflight.pop(fut)
+                try:
+                    result, extract_s, traffic, rate = fut.result()
+                except Exception as e:
+                    print(f"[!] {os.path.basename(path)}: extraction failed ({e})")
+                    DROPPED_WINDOWS.inc(reason="extract_error")
+                    continue
+                STAGE_SECONDS.observe(extract_s, stage="extract")
+                count_parsed(result[1] if flows else [result])
+                sampled = {"sampling_rate": round(rate, 3)} if sampler else {}
+                t0 = time.perf_counter()
+                if flows:
+                    score_flows(*result, model_dict, interface, col, anomalies_col, extra=sampled)
+                    t1 = t2 = time.perf_counter()
+                else:
+                    label, probs = predict(result, model_dict)
+                    t1 = time.perf_counter()
+                    STAGE_SECONDS.observe(t1 - t0, stage="predict")
+                    extra = {"capture_file": os.path.basename(path), **sampled}
+                    if traffic:
+                        extra["traffic"] = traffic
+                    store_prediction(result, label, probs, interface, col, anomalies_col, extra=extra,
+                                     model_version=getattr(model_dict, "version", None))
+                    t2 = time.perf_counter()
+                print(f"[+] {os.path.basename(path)}: lag {time.time() - queued_at:.2f}s  "
+                      f"extract {extract_s:.2f}s  predict {t1 - t0:.3f}s  store {t2 - t1:.3f}s  "
+                      f"pool queue {len(inflight)}  mongo queue {col.stats()['queue_depth']}")
 
-            feats = extract_features_full(PCAP_FILE)
+            RING_QUEUE.set(len(inflight))
+            if exited and not inflight:
+                break
+            time.sleep(RING_POLL)
+        print(f"[!] tshark exited with code {proc.returncode}")
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
 
-            
-            label, probs = predict(feats, model_dict)
-            risk_score   = probs[label]
+def run_sliding(interface, bpf, window, hop, model_dict, col, anomalies_col, sketches=False,
+                sampler=None):
+    """
+    Continuous mode: one long-running capture feeds a sliding window and a
+    prediction over the last `window` seconds is emitted every `hop` seconds.
+    A sampler (built with max_lag) sheds packets while the reader falls behind.
+    """
+    state = SlidingWindow(window, hop, sketches=sketches)
+    proc = open_capture_stream(interface, bpf)
 
-            
-            record = {
-                "timestamp":    time.strftime("%Y-%m-%d %H:%M:%S"),
-                "interface":    interface,
-                "label":        label,
-                "probability":   risk_score,
-                "probabilities": probs
+    def reader():
+        keep = sampler.reader_hook(shed=state.add_shed) if sampler else None
+        flow_keep = sampler.keep if sampler and sampler.mode == "flow" else None
+        for pkt in iter_packets_from(proc.stdout, keep):
+            if flow_keep is not None and not flow_keep(pkt):
+                state.add_shed(pkt.timestamp, pkt.length)
+                continue
+            state.add(pkt, sampler.rate if sampler else 1)
+            PACKETS_PARSED.inc()
+            BYTES_PARSED.inc(pkt.length)
+
+    threading.Thread(target=reader, daemon=True).start()
+    try:
+        # Emit on hop boundaries so every prediction covers whole panes
+        next_emit = (time.time() // state.hop + 1) * state.hop
+        while proc.poll() is None:
+            late = time.time() - next_emit
+            if late > state.hop:
+                # Scoring fell behind by whole hops: skip to the current one
+                missed = int(late // state.hop)
+                DROPPED_WINDOWS.inc(missed, reason="late")
+                next_emit += missed * state.hop
+            time.sleep(max(0.0, next_emit - time.time()))
+            between_windows(model_dict)
+            with metrics.timed(STAGE_SECONDS, stage="extract"):
+                acc = state.snapshot(next_emit)
+                feats = acc.features()
+            extra = {
+                "window_start": datetime.fromtimestamp(next_emit - state.window, timezone.utc),
+                "window_end":   datetime.fromtimestamp(next_emit, timezone.utc),
             }
-            col.insert_one(record)
-            print(f"[+] {record}")
-            benign_p = probs["Benign"]
-            hits = [f for f,p in probs.items() if f!="Benign" and p>benign_p]
-            if hits:
-                anomaly_record = {**record,"anomaly_families": hits,"anomaly_probs":    {f:probs[f] for f in hits},
-                                  "features": {
-                                      "Packet Size": feats[0],
-                                      "Packet Length": feats[1],
-                                      "Inter-Arrival Time": feats[2],
-                                      "Flow Duration": feats[3],
-                                      "Total Packets": feats[4],
-                                      "Total Bytes": feats[5],
-                                      "Average Packet Size": feats[6],
-                                      "Packet Arrival Rate": feats[7],
-                                      "Payload Entropy": feats[8],
-                                      "Flow Entropy": feats[9],
-                                      "Baseline Deviation": feats[10],
-                                      "Packet Size Variance": feats[11],
-                                      "Known IoC": feats[12],
-                                      "C&C Communication": feats[13],
-                                      "Data Exfiltration": feats[14],
-                                      "Protocol Type (one-hot)": feats[15 : 15 + len(PROTOCOL_CATEGORIES)],
-                                      "Flags (one-hot)": feats[15 + len(PROTOCOL_CATEGORIES) :] }
-                                  }
-                anomalies_col.insert_one(anomaly_record)
-                print(f"[!] Anomaly! stored: {anomaly_record}")
-
-          
-            time.sleep(1)
+            if sampler:
+                extra["sampling_rate"] = round(acc.sampling_rate, 3)
+            if sketches:
+                extra["traffic"] = state.sketch(next_emit).summary()
+            handle_prediction(feats, model_dict, interface, col, anomalies_col, extra=extra)
+            next_emit += state.hop
+        print(f"[!] tshark exited with code {proc.returncode}")
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Live capture & prediction loop")
+    parser.add_argument("--mode", choices=["batch", "sliding", "ring"], default="batch",
+                        help="batch: capture-then-score cycles; sliding: continuous sliding window; "
+                             "ring: ring-buffer capture scored by a worker pool")
+    parser.add_argument("--interface", default=DEFAULT_INTERFACE)
+    parser.add_argument("--filter", default=DEVICE_FILTER, help="BPF capture filter")
+    parser.add_argument("--duration", type=int, default=CAPTURE_DURATION,
+                        help="capture length per cycle in batch mode (s)")
+    parser.add_argument("--window", type=float, default=SLIDING_WINDOW,
+                        help="sliding window length (s)")
+    parser.add_argument("--hop", type=float, default=SLIDING_HOP,
+                        help="seconds between predictions in sliding mode")
+    parser.add_argument("--ring-seconds", type=int, default=RING_SECONDS,
+                        help="length of each ring-buffer file in ring mode (s)")
+    parser.add_argument("--ring-files", type=int, default=RING_FILES,
+                        help="number of files tshark rotates through in ring mode")
+    parser.add_argument("--workers", type=int, default=RING_WORKERS,
+                        help="extraction processes in ring mode")
+    parser.add_argument("--pcap-file", default=PCAP_FILE, help="capture file in batch mode")
+    parser.add_argument("--ring-dir", default=RING_DIR, help="ring-buffer directory in ring mode")
+    parser.add_argument("--name", default=None,
+                        help="worker name; keeps writer spill files and metrics apart")
+    parser.add_argument("--model", default=MODEL_FILE,
+                        help="family_detectors.pkl, or an .npz from model_export.py")
+    parser.add_argument("--model-dir", default=MODEL_DIR,
+                        help="hot-reload the newest .pkl/.npz dropped here (validated first, "
+                             "swapped in between windows)")
+    parser.add_argument("--cache-size", type=int, default=PREDICTION_CACHE_SIZE,
+                        help="LRU entries for repeated feature vectors (0 = no cache)")
+    parser.add_argument("--cascade", default=None, metavar="FILTER_JSON",
+                        help="benign_filter.json from cascade.py: clear obviously benign rows "
+                             "before running every family detector")
+    parser.add_argument("--collapse", action="store_true",
+                        help="extend the previous record's span instead of storing an unchanged prediction")
+    parser.add_argument("--sketches", action="store_true",
+                        help="add distinct-host/port counts, fan-out and top talkers to each "
+                             "whole-window record (not with --flows)")
+    parser.add_argument("--ioc-feeds", default=ioc_engine.FEEDS_DIR,
+                        help="directory of IoC feed files (ioc*/c2*/exfil*.txt), reloaded when they change")
+    parser.add_argument("--sampling", choices=["off", "count", "flow"], default="off",
+                        help="under overload keep 1 in N packets (count) or flows (flow); counts "
+                             "and timing stay exact and records carry sampling_rate")
+    parser.add_argument("--sample-rate", type=int, default=None,
+                        help="with --sampling, always sample 1 in N instead of adapting to the backlog")
+    parser.add_argument("--max-sample-rate", type=int, default=MAX_SAMPLE_RATE,
+                        help="with --sampling, never keep fewer than 1 in N packets")
+    parser.add_argument("--max-lag", type=float, default=MAX_LAG,
+                        help="sliding mode with --sampling: capture lag (s) at which to start shedding")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on this port (0 = off)")
+    parser.add_argument("--flows", action="store_true",
+                        help="batch/ring mode: score each 5-tuple flow instead of the whole capture")
+    parser.add_argument("--per-host", action="store_true",
+                        help="with --flows, key flows by source host instead of 5-tuple")
+    return parser.parse_args(argv)
+
+def make_sampler(args):
+    """The Sampler for `args` (None with --sampling off)."""
+    if args.sampling == "off":
+        return None
+    if args.sample_rate:
+        return Sampler(args.sampling, args.sample_rate, adaptive=False, per_host=args.per_host)
+    if args.mode == "sliding":
+        return Sampler(args.sampling, max_rate=args.max_sample_rate, max_lag=args.max_lag)
+    if args.mode == "batch":
+        return Sampler(args.sampling, max_rate=args.max_sample_rate, per_host=args.per_host,
+                       high=MAX_EXTRACT_SHARE, low=MAX_EXTRACT_SHARE / 4)
+    return Sampler(args.sampling, max_rate=args.max_sample_rate, per_host=args.per_host)
+
+def run(args, model_dict):
+    """Capture and score per `args` with an already loaded model until stopped."""
+    interface = args.interface
+    print(f"[+] Using interface {interface}")
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+   
+    # Inserts go through background batch writers so scoring never waits on Atlas
+    client = mongo_client(MONGO_URI)
+    writer = CollapsingWriter if args.collapse else BatchedMongoWriter
+    suffix = f"_{args.name}" if args.name else ""
+    latest_channel.set_worker(args.name)     # one latest-prediction channel per worker
+    col    = writer(client[DB_NAME][COLLECTION], name=f"{COLLECTION}{suffix}")
+    anomalies_col = AnomalyWriter(client[DB_NAME]["anomalies"], client[DB_NAME][ROLLUP_COLLECTION],
+                                  name=f"anomalies{suffix}")
+
+    ioc_engine.watch(args.ioc_feeds)
+    benign_filter = load_filter(args.cascade) if args.cascade else None
+
+    def wrap(detectors):
+        # Every model version gets its own cascade and (empty) prediction cache
+        detectors = as_detectors(detectors)
+        if benign_filter is not None:
+            detectors = CascadeDetectors(detectors, benign_filter)
+        if args.cache_size:
+            detectors = PredictionCache(detectors, size=args.cache_size)
+        return detectors
+
+    model_dict = ModelManager(model_dict, args.model, args.model_dir, wrap=wrap, name=args.name)
+    sampler = make_sampler(args)
+
+    print("[*] Starting live capture & prediction loop. Ctrl-C to stop.")
+    try:
+        if args.mode == "sliding":
+            run_sliding(interface, args.filter, args.window, args.hop,
+                        model_dict, col, anomalies_col, sketches=args.sketches, sampler=sampler)
+        elif args.mode == "ring":
+            run_ring(interface, args.filter, args.ring_seconds, args.ring_files, args.workers,
+                     model_dict, col, anomalies_col, flows=args.flows, per_host=args.per_host,
+                     ring_dir=args.ring_dir, ioc_feeds=args.ioc_feeds, sketches=args.sketches,
+                     sampler=sampler)
+        else:
+            run_batch(interface, args.filter, args.duration,
+                      model_dict, col, anomalies_col,
+                      flows=args.flows, per_host=args.per_host, pcap_file=args.pcap_file,
+                      sketches=args.sketches, sampler=sampler)
 
     except KeyboardInterrupt:
         print("\n[!] Stopped by user.")
+    finally:
+        active = model_dict.detectors
+        if isinstance(active, PredictionCache):
+            print(f"[+] Prediction cache: {active.stats()}")
+            active = active.detectors
+        if isinstance(active, CascadeDetectors):
+            print(f"[+] Cascade: {active.stats()}")
+        print(f"[+] Model: {model_dict.stats()}")
+        col.close()
+        anomalies_col.close()
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.install_profile_signal("profile-predictor")
+    run(args, load_model(args.model))
 
 if __name__ == "__main__":
     main()
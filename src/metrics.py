@@ -0,0 +1,267 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms register themselves in REGISTRY when they
+are created; render() turns the registry into the text format Prometheus
+scrapes. live_predictor serves it from a small stdlib HTTP server
+(serve()), app.py from its own /metrics route.
+
+    STAGE_SECONDS = Histogram("wids_stage_seconds", "Time per pipeline stage", ["stage"])
+    with timed(STAGE_SECONDS, stage="predict"):
+        ...
+
+install_profile_signal() adds an on-demand profiler: the first SIGUSR1
+starts cProfile (or pyinstrument with WIDS_PROFILER=pyinstrument), the
+next one stops it and writes the report next to the process.
+"""
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REGISTRY = {}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label names, label values, value)."""
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield "", self.labelnames, key, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_label_str(names, values)} {_fmt(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; may be computed at scrape time with set_function."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.functions[key] = fn
+
+    def samples(self):
+        with self.lock:
+            items = dict(self.values)
+            functions = list(self.functions.items())
+        for key, fn in functions:
+            try:
+                items[key] = fn()
+            except Exception:
+                continue
+        for key, value in items.items():
+            yield "", self.labelnames, key, value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with _sum and _count."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self.values.items()]
+        names = self.labelnames + ("le",)
+        for key, (counts, total, n) in items:
+            running = 0
+            for bound, c in zip(self.buckets, counts):
+                running += c
+                yield "_bucket", names, key + (_fmt(bound),), running
+            yield "_sum", self.labelnames, key, total
+            yield "_count", self.labelnames, key, n
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the wall time of the with-block in `histogram`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def render():
+    """All registered metrics in Prometheus text format."""
+    return "\n".join(m.render() for m in list(REGISTRY.values())) + "\n"
+
+
+def unregister(*metrics):
+    """Drop metrics from REGISTRY (a forked child that does not own them)."""
+    for m in metrics:
+        REGISTRY.pop(m.name, None)
+
+
+def _reset_locks():
+    # A fork may happen while another thread holds a metric's lock (a scrape
+    # mid-render); that thread does not exist in the child, so start fresh
+    for m in list(REGISTRY.values()):
+        m.lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics on `port` from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[+] Metrics at http://{host}:{port}/metrics")
+    return server
+
+
+class _SignalProfiler:
+    """Toggle a profiler of the main thread on each signal."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.profiler = None
+
+    def __call__(self, signum, frame):
+        if self.profiler is None:
+            self.profiler = self._start()
+            print("[+] Profiling started (send the signal again to stop)")
+            return
+        profiler, self.profiler = self.profiler, None
+        path = self._stop(profiler)
+        print(f"[+] Profile written → {path}")
+
+    def _start(self):
+        if os.getenv("WIDS_PROFILER") == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("[!] pyinstrument not installed; using cProfile")
+            else:
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop(self, profiler):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if hasattr(profiler, "output_html"):
+            profiler.stop()
+            path = f"{self.prefix}-{stamp}.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            return path
+        profiler.disable()
+        path = f"{self.prefix}-{stamp}.prof"
+        profiler.dump_stats(path)
+        return path
+
+
+def install_profile_signal(prefix="profile", signame="SIGUSR1"):
+    """Toggle profiling on `signame`; a no-op where the signal does not exist (Windows)."""
+    signum = getattr(signal, signame, None)
+    if signum is None:
+        print(f"[!] {signame} not available on this platform; signal profiling disabled")
+        return False
+    signal.signal(signum, _SignalProfiler(f"{prefix}-{os.getpid()}"))
+    return True
@@ -0,0 +1,45 @@
+"""
+One-off migration: convert the old "%Y-%m-%d %H:%M:%S" string timestamps
+in the predictions and anomalies collections to BSON dates, so time-range
+queries can use the timestamp indexes. Runs server-side, one update per
+collection.
+
+    python migrate_timestamps.py --timezone Asia/Kolkata
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = os.getenv('DB_NAME')
+COLLECTION = os.getenv('COLLECTION')
+
+
+def migrate(collection, tz=None):
+    """Rewrite string timestamps in place; returns the number of documents changed."""
+    convert = {'dateString': '$timestamp', 'format': '%Y-%m-%d %H:%M:%S'}
+    if tz:
+        convert['timezone'] = tz
+    res = collection.update_many(
+        {'timestamp': {'$type': 'string'}},
+        [{'$set': {'timestamp': {'$dateFromString': convert}}}],
+    )
+    return res.modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert string timestamps to dates")
+    parser.add_argument("--timezone", default=None,
+                        help="Olson zone the old strings were written in (default UTC)")
+    args = parser.parse_args()
+
+    db = MongoClient(MONGO_URI)[DB_NAME]
+    for name in (COLLECTION, "anomalies"):
+        print(f"[+] {name}: {migrate(db[name], args.timezone)} documents converted")
+
+
+if __name__ == "__main__":
+    main()
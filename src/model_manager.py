@@ -0,0 +1,373 @@
+"""
+Hot reload of the family detectors without restarting the predictor.
+
+ModelManager stands where the detectors object used to be (same
+predict_batch / families interface) and watches a model directory
+(MODEL_DIR, --model-dir). When a new or changed *.pkl / *.npz appears
+there after startup (the most recently modified one wins), it is loaded
+and validated in a background thread. The model the predictor was started
+with (--model) stays active until then, even if an artifact already in
+the directory is newer; a reload request loads that one. Validation:
+
+- the feature count the model declares matches feature_schema.json
+- there is a Benign detector
+- a smoke prediction on canned rows gives one finite probability in
+  [0, 1] per family and known labels
+
+poll(), which the live loop calls between windows, then swaps it in with a
+single assignment, so every window is scored by exactly one model and the
+capture never stops. A model that fails validation is kept out until its
+file changes. rollback() returns to the previous model (the last HISTORY
+versions are kept in memory) and keeps the artifact it left from being
+picked up again. Copy new models in under a temporary name and rename
+them, so a half-written file is never seen.
+
+Records carry model_version, "<file stem>-<first 10 hex digits of its SHA-1>".
+
+supervisor.py's POST /reload and /rollback (app.py: POST /api/model/reload,
+/api/model/rollback) append a request to CONTROL_FILE in the model
+directory; on its next poll() every manager works through the requests
+added since, in order, acts on those addressed to it and reports its
+state in active_<worker>.json there.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+import metrics
+from family_model import as_detectors, load_detectors
+from feature_schema import NUMERICAL_FEATURES, feature_columns, flags_categories, protocol_categories
+
+MODEL_DIR = os.getenv("WIDS_MODEL_DIR", "models")
+MODEL_EXTS = (".pkl", ".npz")
+CONTROL_FILE = "control.jsonl"   # append-only request queue, one JSON request per line
+RELOAD_CHECK_SECONDS = 5      # directory scans at most this often
+HISTORY = 3                   # previous models kept for rollback
+BENIGN = "Benign"
+CANNED_ROWS = 8
+
+MODEL_RELOADS = metrics.Counter("wids_model_reloads_total", "Model hot reloads by result", ["result"])
+
+ModelVersion = namedtuple("ModelVersion", "detectors version path fingerprint loaded_at")
+
+
+def fingerprint(path):
+    """(path, size, mtime) of a model file, or None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def version_of(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{h.hexdigest()[:10]}"
+
+
+def model_paths(model_dir=MODEL_DIR):
+    """Model artifacts in `model_dir` (none if it does not exist)."""
+    try:
+        names = [n for n in os.listdir(model_dir) if n.endswith(MODEL_EXTS)]
+    except OSError:
+        return []
+    return [os.path.join(model_dir, n) for n in names]
+
+
+def newest_model(model_dir=MODEL_DIR):
+    """The most recently modified model artifact in `model_dir`, or None."""
+    newest, newest_mtime = None, None
+    for path in model_paths(model_dir):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue    # removed or renamed since listdir
+        if newest_mtime is None or mtime > newest_mtime:
+            newest, newest_mtime = path, mtime
+    return newest
+
+
+def model_n_features(detectors):
+    """Feature count the model declares (None if it does not say)."""
+    n = getattr(detectors, "n_features", None)
+    if n is not None:
+        return n
+    counts = {getattr(m, "n_features_in_", None) for m in getattr(detectors, "models", {}).values()}
+    counts.discard(None)
+    if len(counts) > 1:
+        raise ValueError(f"family detectors disagree on the feature count: {sorted(counts)}")
+    return counts.pop() if counts else None
+
+
+def canned_rows(n_features):
+    """A zero row plus deterministic traffic-like rows in the live feature layout."""
+    rng = np.random.default_rng(0)
+    X = np.zeros((CANNED_ROWS, n_features))
+    n_num = len(NUMERICAL_FEATURES)
+    X[1:, :n_num] = rng.lognormal(3.0, 2.0, (CANNED_ROWS - 1, n_num))
+    X[1:, 12:15] = rng.random((CANNED_ROWS - 1, 3)) < 0.2          # IoC / C&C / exfil bits
+    n_proto, n_flags = len(protocol_categories()), len(flags_categories())
+    for i in range(1, CANNED_ROWS):
+        if n_proto:
+            X[i, n_num + i % n_proto] = 1.0
+        if n_flags:
+            X[i, n_num + n_proto + i % n_flags] = 1.0
+    return X
+
+
+def validate(detectors):
+    """Raise ValueError unless `detectors` fit the feature schema and score canned rows sanely."""
+    detectors = as_detectors(detectors)
+    families = list(detectors.families)
+    if BENIGN not in families:
+        raise ValueError(f"no {BENIGN!r} detector (families: {families})")
+    n_features = len(feature_columns())
+    declared = model_n_features(detectors)
+    if declared is not None and declared != n_features:
+        raise ValueError(f"model takes {declared} features, feature schema has {n_features}")
+    labels, probs = detectors.predict_batch(canned_rows(n_features))
+    probs = np.asarray(probs, dtype=np.float64)
+    if probs.shape != (CANNED_ROWS, len(families)):
+        raise ValueError(f"smoke prediction has shape {probs.shape}, "
+                         f"expected {(CANNED_ROWS, len(families))}")
+    if not np.isfinite(probs).all() or probs.min() < 0 or probs.max() > 1:
+        raise ValueError("smoke prediction gave probabilities outside [0, 1]")
+    if any(label not in families for label in labels):
+        raise ValueError("smoke prediction gave unknown labels")
+
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def request(action, model_dir=MODEL_DIR, workers=None, path=None):
+    """Ask the managers watching `model_dir` (all, or the named `workers`) to reload or roll back."""
+    if action not in ("reload", "rollback"):
+        raise ValueError(f"unknown model action {action!r}")
+    os.makedirs(model_dir, exist_ok=True)
+    req = {"seq": time.time_ns(), "action": action, "workers": workers, "path": path}
+    # One write() on an O_APPEND descriptor, so concurrent requests never interleave
+    fd = os.open(os.path.join(model_dir, CONTROL_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (json.dumps(req) + "\n").encode())
+    finally:
+        os.close(fd)
+    return req
+
+
+def read_requests(model_dir=MODEL_DIR, offset=0):
+    """
+    (request, offset just past it) for each complete request in the queue
+    from byte `offset` on, and the offset after the last one.
+    """
+    try:
+        with open(os.path.join(model_dir, CONTROL_FILE), "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < offset:
+                offset = 0          # queue was removed and started again
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return [], 0
+    requests, pos = [], 0
+    end = data.rfind(b"\n") + 1    # a line still being written waits for the next poll
+    for line in data[:end].splitlines(keepends=True):
+        pos += len(line)
+        try:
+            requests.append((json.loads(line), offset + pos))
+        except ValueError:
+            continue
+    return requests, offset + end
+
+
+def read_state(model_dir=MODEL_DIR, name=None):
+    """What the manager of worker `name` last reported (empty if nothing yet)."""
+    return read_json(os.path.join(model_dir, f"active_{name or 'default'}.json"))
+
+
+class ModelManager:
+    """Detectors front that hot-swaps validated models between windows."""
+
+    def __init__(self, detectors, path=None, model_dir=MODEL_DIR, wrap=as_detectors, name=None):
+        self.model_dir = model_dir
+        self.wrap = wrap               # loaded detectors -> what predict_batch calls (cache, cascade)
+        self.name = name or "default"
+        self.history = deque(maxlen=HISTORY)
+        self.pending = None            # validated ModelVersion waiting for poll()
+        self.loading = None            # path being loaded in the background
+        self.rejected = set()          # fingerprints not to load again on their own
+        self.last_error = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        # Requests queued before this manager started are not replayed
+        self.control_offset = read_requests(model_dir)[1]
+        # The model we were started with wins over artifacts already in the
+        # directory: those load on a reload request or once rewritten
+        self.rejected.update(fingerprint(p) for p in model_paths(model_dir))
+        self.rejected.discard(None)
+        fp = fingerprint(path) if path else None
+        self.active = ModelVersion(wrap(detectors), version_of(path) if fp else "unversioned",
+                                   path, fp, time.time())
+        print(f"[+] Model {self.active.version} active")
+        self._write_state()
+
+    # ── detectors interface ──────────────────────────────────────────
+    @property
+    def version(self):
+        return self.active.version
+
+    @property
+    def detectors(self):
+        return self.active.detectors
+
+    @property
+    def families(self):
+        return self.active.detectors.families
+
+    def __iter__(self):
+        return iter(self.families)
+
+    def __len__(self):
+        return len(self.families)
+
+    def predict_batch(self, X):
+        return self.active.detectors.predict_batch(X)
+
+    def labels_for(self, probs):
+        return self.active.detectors.labels_for(probs)
+
+    # ── reload ───────────────────────────────────────────────────────
+    def poll(self, force=False):
+        """
+        Between windows: swap in a model the background loader has
+        validated, act on new control requests, and (at most every
+        RELOAD_CHECK_SECONDS) start loading a new artifact from the model
+        directory. Returns the version in use.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is not None:
+            self._install(pending)
+        self._control()
+        now = time.monotonic()
+        if force or now - self.checked >= RELOAD_CHECK_SECONDS:
+            self.checked = now
+            path = newest_model(self.model_dir)
+            fp = fingerprint(path) if path else None
+            pending = self.pending
+            if (fp and fp != self.active.fingerprint and fp not in self.rejected
+                    and (pending is None or fp != pending.fingerprint)):
+                self.load_async(path)
+        return self.active.version
+
+    def load_async(self, path):
+        """Load and validate `path` in a background thread; poll() swaps it in."""
+        with self.lock:
+            if self.loading is not None:
+                return None
+            self.loading = path
+        thread = threading.Thread(target=self._load, args=(path,), name="model-load", daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self, path):
+        start = time.perf_counter()
+        before = fingerprint(path)
+        try:
+            detectors = load_detectors(path)
+            validate(detectors)
+            entry = ModelVersion(self.wrap(detectors), version_of(path), path, before, None)
+        except Exception as e:
+            with self.lock:
+                self.loading = None
+            self.rejected.add(before)
+            self.last_error = f"{os.path.basename(path)}: {type(e).__name__}: {e}"
+            MODEL_RELOADS.inc(result="rejected")
+            print(f"[!] Model {path} rejected ({type(e).__name__}: {e}); keeping {self.active.version}")
+            self._write_state()
+            return
+        with self.lock:
+            self.loading = None
+            if fingerprint(path) != before:
+                # Rewritten while we read it; the next check picks up the final file
+                return
+            self.pending = entry
+        print(f"[+] Model {entry.version} loaded and validated in {time.perf_counter() - start:.1f}s; "
+              f"swapping in before the next window")
+
+    def _install(self, entry):
+        self.history.append(self.active)
+        self.active = entry._replace(loaded_at=time.time())
+        self.last_error = None
+        MODEL_RELOADS.inc(result="loaded")
+        print(f"[+] Model {self.active.version} active (was {self.history[-1].version})")
+        self._write_state()
+
+    def rollback(self):
+        """Return to the previous model; the one left is not reloaded until its file changes."""
+        if not self.history:
+            print(f"[!] No previous model to roll back to; keeping {self.active.version}")
+            return False
+        if self.active.fingerprint:
+            self.rejected.add(self.active.fingerprint)
+        left = self.active
+        self.active = self.history.pop()
+        MODEL_RELOADS.inc(result="rolled_back")
+        print(f"[!] Model rolled back from {left.version} to {self.active.version}")
+        self._write_state()
+        return True
+
+    def _control(self):
+        """Act on queued requests in order; one after a reload waits until that model is in."""
+        requests, _ = read_requests(self.model_dir, self.control_offset)
+        for req, offset in requests:
+            if self.loading is not None or self.pending is not None:
+                return
+            self.control_offset = offset
+            if not req.get("workers") or self.name in req["workers"]:
+                self._handle(req)
+
+    def _handle(self, req):
+        if req.get("action") == "rollback":
+            self.rollback()
+        elif req.get("action") == "reload":
+            path = req.get("path")
+            if path and not os.path.isabs(path):
+                path = os.path.join(self.model_dir, path)
+            path = path or newest_model(self.model_dir)
+            if path is None or fingerprint(path) is None:
+                print(f"[!] Reload requested but no model found in {self.model_dir}")
+                return
+            self.rejected.discard(fingerprint(path))
+            if fingerprint(path) != self.active.fingerprint:
+                self.load_async(path)
+
+    def _write_state(self):
+        if not os.path.isdir(self.model_dir):
+            return
+        write_json(os.path.join(self.model_dir, f"active_{self.name}.json"), self.stats())
+
+    def stats(self):
+        return {"worker": self.name, "version": self.active.version, "path": self.active.path,
+                "loaded_at": self.active.loaded_at, "loading": self.loading,
+                "previous": [m.version for m in reversed(self.history)],
+                "last_error": self.last_error}
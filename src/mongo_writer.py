@@ -0,0 +1,330 @@
+"""
+Batched, non-blocking MongoDB writes for the prediction loop.
+
+BatchedMongoWriter owns a bounded queue and a background thread that
+flushes with insert_many when either `batch_size` documents are waiting
+or `flush_interval` seconds have passed. Failed flushes are retried with
+exponential backoff; if the database stays unreachable the batch is
+spilled to a local JSON-lines file and replayed after the next successful
+flush (a replay cut short by a crash is picked up again at the next start). When the queue is full put() blocks (backpressure) for up to
+`put_timeout` seconds before spilling the document straight to disk.
+
+Any object with insert_many() works as the collection, so the writer can
+be exercised against mongomock or a local mongod.
+
+CollapsingWriter adds a "collapse unchanged" mode: a prediction equal to
+the previous one of the same stream (interface/flow) is not inserted;
+the earlier record's `span_end` and `windows` are extended instead.
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId, json_util
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import metrics
+
+FLUSH_SECONDS = metrics.Histogram("wids_mongo_flush_seconds",
+                                  "insert_many latency per batch, including retries", ["writer"])
+DOCS_INSERTED = metrics.Counter("wids_mongo_docs_inserted_total", "Documents stored", ["writer"])
+DOCS_SPILLED  = metrics.Counter("wids_mongo_docs_spilled_total", "Documents spilled to disk", ["writer"])
+QUEUE_DEPTH   = metrics.Gauge("wids_mongo_queue_depth", "Documents waiting in the writer queue", ["writer"])
+SPILL_BACKLOG = metrics.Gauge("wids_mongo_spill_backlog", "Spilled documents not yet replayed", ["writer"])
+DOCS_COLLAPSED = metrics.Counter("wids_mongo_docs_collapsed_total",
+                                 "Unchanged predictions folded into the previous record", ["writer"])
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def mongo_client(uri, **kwargs):
+    """Return a process-wide MongoClient for `uri` so connections are reused."""
+    key = (uri, tuple(sorted(kwargs.items())))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = MongoClient(uri, **kwargs)
+        return _clients[key]
+
+
+def only_duplicates(err: BulkWriteError) -> bool:
+    """True when a retried batch failed only because some docs already landed."""
+    errors = err.details.get("writeErrors", [])
+    return bool(errors) and all(e.get("code") == 11000 for e in errors)
+
+
+class BatchedMongoWriter:
+    """Background insert_many writer with backoff, disk spill and stats."""
+
+    def __init__(self, collection, batch_size=500, flush_interval=2.0, max_queue=10_000,
+                 put_timeout=1.0, max_retries=4, backoff=0.5, spill_path=None,
+                 log_interval=60.0, name=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.name = name or getattr(collection, "name", "mongo")
+        self.spill_path = spill_path or f"spill_{self.name}.jsonl"
+        self.log_interval = log_interval
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self.inserted = 0
+        self._recover_replay()
+        self.spill_backlog = self._count_spilled()
+        self.failed_flushes = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+        QUEUE_DEPTH.set_function(self.queue.qsize, writer=self.name)
+        SPILL_BACKLOG.set_function(lambda: self.spill_backlog, writer=self.name)
+
+        self._thread = threading.Thread(target=self._run, name=f"writer-{self.name}", daemon=True)
+        self._thread.start()
+
+    # ── producer side ────────────────────────────────────────────────
+    def put(self, doc):
+        """Queue a document for insertion; blocks while the queue is full."""
+        doc.setdefault("_id", ObjectId())   # makes retries idempotent
+        try:
+            self.queue.put(doc, timeout=self.put_timeout)
+        except queue.Full:
+            self._spill([doc])
+
+    def stats(self):
+        return {
+            "queue_depth":        self.queue.qsize(),
+            "inserted":           self.inserted,
+            "spill_backlog":      self.spill_backlog,
+            "flushes":            self.flushes,
+            "failed_flushes":     self.failed_flushes,
+            "last_flush_latency": self.last_flush_latency,
+            "avg_flush_latency":  self.total_flush_latency / self.flushes if self.flushes else 0.0,
+        }
+
+    def close(self, timeout=30.0):
+        """Flush what is queued and stop the background thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # ── writer thread ────────────────────────────────────────────────
+    def _run(self):
+        next_log = time.monotonic() + self.log_interval
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if time.monotonic() >= next_log:
+                print(f"[writer:{self.name}] {self.stats()}")
+                next_log = time.monotonic() + self.log_interval
+
+    def _next_batch(self):
+        """Collect up to batch_size docs, waiting at most flush_interval."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self.queue.empty()):
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.25)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def write(self, batch):
+        """Database operation for one batch; subclasses may override."""
+        self.collection.insert_many(batch, ordered=False)
+
+    def replay_chunks(self, docs):
+        """(offset, chunk) pairs to replay spilled `docs` in; subclasses may keep batches whole."""
+        for i in range(0, len(docs), self.batch_size):
+            yield i, docs[i:i + self.batch_size]
+
+    def _insert(self, batch):
+        """write() with retries; True once the batch is stored."""
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write(batch)
+                return True
+            except BulkWriteError as e:
+                if only_duplicates(e):
+                    return True
+                err = e
+            except PyMongoError as e:
+                err = e
+            if attempt < self.max_retries and not self._stop.is_set():
+                time.sleep(delay)
+                delay *= 2
+        print(f"[!] writer:{self.name} insert failed after retries: {err}")
+        return False
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        ok = self._insert(batch)
+        self.last_flush_latency = time.perf_counter() - start
+        self.total_flush_latency += self.last_flush_latency
+        self.flushes += 1
+        FLUSH_SECONDS.observe(self.last_flush_latency, writer=self.name)
+        if ok:
+            self.inserted += len(batch)
+            DOCS_INSERTED.inc(len(batch), writer=self.name)
+            self._replay_spill()
+        else:
+            self.failed_flushes += 1
+            self._spill(batch)
+
+    # ── disk spill ───────────────────────────────────────────────────
+    def _recover_replay(self):
+        """
+        Put back a replay file left by a run that died mid-replay, ahead of
+        the newer spill. Documents it had already stored come back as
+        duplicates, which inserts (by _id) and rollups (by batch id) ignore.
+        """
+        replay = self.spill_path + ".replay"
+        if not os.path.exists(replay):
+            return
+        merged = self.spill_path + ".merge"
+        with open(merged, "wb") as out:
+            for path in (replay, self.spill_path):
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    out.write(data if data.endswith(b"\n") or not data else data + b"\n")
+        os.replace(merged, self.spill_path)
+        os.remove(replay)
+        print(f"[+] writer:{self.name} recovered an interrupted replay into {self.spill_path}")
+
+    def _count_spilled(self):
+        """Documents left on disk by an earlier run; replayed on first flush."""
+        if not os.path.exists(self.spill_path):
+            return 0
+        with open(self.spill_path, encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+
+    def _spill(self, docs):
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for doc in docs:
+                    f.write(json_util.dumps(doc) + "\n")
+            self.spill_backlog += len(docs)
+        DOCS_SPILLED.inc(len(docs), writer=self.name)
+
+    def _replay_spill(self):
+        """Push spilled documents back to the database once it is reachable."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            replay = self.spill_path + ".replay"
+            os.replace(self.spill_path, replay)
+        docs = []
+        with open(replay, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    docs.append(json_util.loads(line))
+                except ValueError:
+                    # a line cut short by a crash while spilling
+                    print(f"[!] writer:{self.name} skipping unreadable spill line")
+                    self.spill_backlog -= 1
+        for i, chunk in self.replay_chunks(docs):
+            if self._insert(chunk):
+                self.inserted += len(chunk)
+                DOCS_INSERTED.inc(len(chunk), writer=self.name)
+                self.spill_backlog -= len(chunk)
+            else:
+                self._spill(docs[i:])
+                self.spill_backlog -= len(docs) - i   # _spill counted them again
+                break
+        os.remove(replay)
+
+
+class CollapsingWriter(BatchedMongoWriter):
+    """
+    BatchedMongoWriter that folds runs of unchanged predictions into one record.
+
+    The first record of a run is inserted as usual, with `span_end` and
+    `windows` = 1. Later records of the same stream with the same label,
+    model version and probabilities (rounded to `prob_decimals`) only move
+    the run's end; the stored record is brought up to date with one $set
+    when the run ends, every `max_span` seconds while it lasts, and on
+    close(). Updates travel through the same queue (and spill file) as
+    inserts.
+    """
+
+    def __init__(self, collection, stream_fields=("interface", "flow"), prob_decimals=2,
+                 max_span=300.0, max_streams=10_000, **kwargs):
+        super().__init__(collection, **kwargs)
+        self.stream_fields = stream_fields
+        self.prob_decimals = prob_decimals
+        self.max_span = max_span
+        self.max_streams = max_streams
+        self.runs = OrderedDict()     # stream -> open run
+        self.collapsed = 0
+
+    def signature(self, doc):
+        probs = doc.get("probabilities", {})
+        return (doc.get("label"), doc.get("model_version"),
+                tuple(sorted((f, round(p, self.prob_decimals)) for f, p in probs.items())))
+
+    def put(self, doc):
+        stream = tuple(str(doc.get(f)) for f in self.stream_fields)
+        sig = self.signature(doc)
+        run = self.runs.get(stream)
+        if run is not None and run["sig"] == sig:
+            self.runs.move_to_end(stream)
+            run["end"] = doc["timestamp"]
+            run["windows"] += 1
+            self.collapsed += 1
+            DOCS_COLLAPSED.inc(writer=self.name)
+            if time.monotonic() - run["synced_at"] >= self.max_span:
+                self._sync(run)
+            return
+        if run is not None:
+            self._sync(run)
+        doc.setdefault("span_end", doc["timestamp"])
+        doc.setdefault("windows", 1)
+        super().put(doc)
+        self.runs[stream] = {"_id": doc["_id"], "sig": sig, "end": doc["timestamp"],
+                             "windows": 1, "synced": 1, "synced_at": time.monotonic()}
+        self.runs.move_to_end(stream)
+        while len(self.runs) > self.max_streams:
+            self._sync(self.runs.popitem(last=False)[1])
+
+    def _sync(self, run):
+        """Queue the $set that brings the stored record up to the run's end."""
+        if run["windows"] == run["synced"]:
+            return
+        super().put({"_id": run["_id"], "$set": {"span_end": run["end"], "windows": run["windows"]}})
+        run["synced"] = run["windows"]
+        run["synced_at"] = time.monotonic()
+
+    def write(self, batch):
+        docs = [d for d in batch if "$set" not in d]
+        updates = [d for d in batch if "$set" in d]
+        if docs:
+            try:
+                self.collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                if not only_duplicates(e):
+                    raise
+        # $set is idempotent, so a retried batch may apply these twice
+        for u in updates:
+            self.collection.update_one({"_id": u["_id"]}, {"$set": u["$set"]})
+
+    def stats(self):
+        return {**super().stats(), "collapsed": self.collapsed, "open_runs": len(self.runs)}
+
+    def close(self, timeout=30.0):
+        for run in list(self.runs.values()):
+            self._sync(run)
+        super().close(timeout)
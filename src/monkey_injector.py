@@ -1,8 +1,9 @@
-import time
+from datetime import datetime, timezone
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient
-from feature_extraction import PROTOCOL_CATEGORIES, FLAGS_CATEGORIES
+from feature_schema import NUMERICAL_FEATURES, flags_categories, protocol_categories
+from mongo_writer import mongo_client
+from anomaly_rollups import ROLLUP_COLLECTION, AnomalyWriter
 
 # ───── CONFIG ───────────────────────────────────────────────────
 CSV_FILE   = "IIoT_Malware_Timeseries_CLEAN.csv"
@@ -13,14 +14,7 @@ NUM_SAMPLES = 3
 # ─────────────────────────────────────────────────────────────────
 
 # Same continuous columns used in feature_extraction
-CONT_COLS = [
-    "Packet Size", "Packet Length", "Inter-Arrival Time",
-    "Flow Duration", "Total Packets", "Total Bytes",
-    "Average Packet Size", "Packet Arrival Rate",
-    "Payload Entropy", "Flow Entropy",
-    "Baseline Deviation", "Packet Size Variance",
-    "Known IoC", "C&C Communication", "Data Exfiltration"
-]
+CONT_COLS = NUMERICAL_FEATURES
 
 
 def build_features(row):
@@ -31,10 +25,10 @@ def build_features(row):
     cont = {col: float(row[col]) for col in CONT_COLS}
     # protocol one-hot
     proto_val = row["Protocol Type"]
-    proto_arr = [1.0 if p == proto_val else 0.0 for p in PROTOCOL_CATEGORIES]
+    proto_arr = [1.0 if p == proto_val else 0.0 for p in protocol_categories()]
     # flags one-hot
     flags_list = [f.strip() for f in row["Flags"].split(",")]
-    flag_arr = [1.0 if f in flags_list else 0.0 for f in FLAGS_CATEGORIES]
+    flag_arr = [1.0 if f in flags_list else 0.0 for f in flags_categories()]
 
     feats = cont.copy()
     feats["Protocol Type (one-hot)"] = proto_arr
@@ -47,8 +41,8 @@ def main():
     df = pd.read_csv(CSV_FILE)
     samples = df[df["Label"] != "Benign"].sample(NUM_SAMPLES)
 
-    client = MongoClient(MONGO_URI)
-    anoms_col = client[DB_NAME][ANOM_COLL]
+    client = mongo_client(MONGO_URI)
+    anoms_col = AnomalyWriter(client[DB_NAME][ANOM_COLL], client[DB_NAME][ROLLUP_COLLECTION])
 
     for _, row in samples.iterrows():
         label = row["Label"]
@@ -57,7 +51,7 @@ def main():
         probs = {label: 1.0}
 
         record = {
-            "timestamp":     time.strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp":     datetime.now(timezone.utc),
             "interface":     "csv-inject",
             "label":         label,
             "probability":   prob,
@@ -69,8 +63,9 @@ def main():
         }
 
         print(f"Injecting anomaly: {label} -> {record}")
-        anoms_col.insert_one(record)
+        anoms_col.put(record)
 
+    anoms_col.close()
     print(f"Done: injected {NUM_SAMPLES} anomalies into {DB_NAME}.{ANOM_COLL}")
 
 if __name__ == "__main__":
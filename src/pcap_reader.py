@@ -0,0 +1,392 @@
+"""
+Native libpcap / pcapng reader used as the fast path of feature extraction.
+
+Only the fields the numerical features need are decoded: timestamp,
+frame length, IP length, highest layer, TCP flags and TCP or UDP payload
+(entropy uses TCP payload only, IoC signatures both), plus the 5-tuple
+used to key flows. Works on regular files and on non-seekable streams (e.g. `tshark -w -`).
+"""
+import os
+import struct
+from collections import namedtuple
+
+# src/dst are packed addresses (4 or 16 bytes), None for non-IP frames
+PacketInfo = namedtuple(
+    "PacketInfo",
+    ["timestamp", "length", "ip_len", "highest_layer", "tcp_flags", "payload",
+     "src", "dst", "proto", "sport", "dport"],
+    defaults=(None, None, 0, 0, 0),
+)
+
+# Link-layer header types we know how to strip
+LINKTYPE_NULL      = 0
+LINKTYPE_ETHERNET  = 1
+LINKTYPE_RAW       = 101
+LINKTYPE_LOOP      = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4      = 228
+LINKTYPE_IPV6      = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETH_IPV4 = 0x0800
+ETH_IPV6 = 0x86DD
+ETH_ARP  = 0x0806
+ETH_VLAN = (0x8100, 0x88A8, 0x9100)
+
+# Port → tshark dissector name (as pyshark reports it in `highest_layer`).
+# tshark picks dissectors by port and by heuristics; this table covers the
+# protocols seen on our IIoT segments, everything else falls back to DATA.
+TCP_PORT_LAYERS = {
+    21: "FTP", 22: "SSH", 23: "TELNET", 25: "SMTP", 53: "DNS", 80: "HTTP",
+    102: "S7COMM", 110: "POP", 143: "IMAP", 443: "TLS", 445: "SMB2",
+    502: "MODBUS", 1883: "MQTT", 3389: "RDP", 4840: "OPCUA", 8080: "HTTP",
+    8883: "TLS", 20000: "DNP3", 44818: "ENIP",
+}
+UDP_PORT_LAYERS = {
+    53: "DNS", 67: "DHCP", 68: "DHCP", 69: "TFTP", 123: "NTP", 137: "NBNS",
+    138: "NBDGM", 161: "SNMP", 162: "SNMP", 514: "SYSLOG", 1900: "SSDP",
+    2222: "ENIP", 5353: "MDNS", 5683: "COAP", 20000: "DNP3", 47808: "BVLC",
+}
+IP_PROTO_LAYERS = {1: "ICMP", 2: "IGMP", 47: "GRE", 50: "ESP", 58: "ICMPV6",
+                   89: "OSPF", 132: "SCTP"}
+
+# Same layout as tshark's tcp.flags.str: 12 positions, MSB first,
+# unset flags shown as a middle dot.
+_FLAG_LETTERS = "RRRACEUAPRSF"
+_FLAG_DOT = "·"
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1000000),
+    b"\xa1\xb2\xc3\xd4": (">", 1000000),
+    b"\x4d\x3c\xb2\xa1": ("<", 1000000000),
+    b"\xa1\xb2\x3c\x4d": (">", 1000000000),
+}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+
+class PcapFormatError(ValueError):
+    """Raised when a file is neither libpcap nor pcapng."""
+
+
+def tcp_flags_str(flags12: int) -> str:
+    """Render the 12 TCP flag bits the way tshark's tcp.flags.str does."""
+    return "".join(
+        _FLAG_LETTERS[i] if flags12 & (0x800 >> i) else _FLAG_DOT
+        for i in range(12)
+    )
+
+
+# Flags strings are reused constantly; precompute all 4096 combinations.
+_FLAGS_TABLE = [tcp_flags_str(v) for v in range(4096)]
+
+
+def _read_exact(f, n):
+    buf = f.read(n)
+    if len(buf) < n:
+        return None
+    return buf
+
+
+def _transport_layer(proto, seg):
+    """Return (highest layer, sport, dport, payload) for an IP payload that is not TCP."""
+    if proto == 17:
+        if len(seg) < 8:
+            return "UDP", 0, 0, b""
+        sport, dport, ulen = struct.unpack_from("!HHH", seg, 0)
+        end = min(ulen, len(seg))
+        if end <= 8:
+            return "UDP", sport, dport, b""
+        layer = UDP_PORT_LAYERS.get(dport) or UDP_PORT_LAYERS.get(sport) or "DATA"
+        return layer, sport, dport, seg[8:end]
+    return IP_PROTO_LAYERS.get(proto, "IP"), 0, 0, b""
+
+
+def _decode_ip(ts, buf, off, frame_len):
+    """Decode an IPv4/IPv6 packet starting at `off` into a PacketInfo."""
+    if len(buf) - off < 1:
+        return PacketInfo(ts, frame_len, frame_len, "IP", None, b"")
+    version = buf[off] >> 4
+    if version == 4:
+        if len(buf) - off < 20:
+            return PacketInfo(ts, frame_len, frame_len, "IP", None, b"")
+        ihl = (buf[off] & 0x0F) * 4
+        total_len, frag = struct.unpack_from("!H2xH", buf, off + 2)
+        proto = buf[off + 9]
+        src, dst = buf[off + 12:off + 16], buf[off + 16:off + 20]
+        ip_len = total_len
+        if frag & 0x1FFF:
+            # Non-first fragment: no transport header here
+            return PacketInfo(ts, frame_len, ip_len, "IP", None, b"", src, dst, proto)
+        start = off + ihl
+        end = min(len(buf), off + total_len) if total_len >= ihl else len(buf)
+        seg = buf[start:end]
+    elif version == 6:
+        if len(buf) - off < 40:
+            return PacketInfo(ts, frame_len, frame_len, "IPV6", None, b"")
+        plen = struct.unpack_from("!H", buf, off + 4)[0]
+        proto = buf[off + 6]
+        src, dst = buf[off + 8:off + 24], buf[off + 24:off + 40]
+        ip_len = frame_len
+        start = off + 40
+        end = min(len(buf), start + plen)
+        # Walk the common extension headers
+        while proto in (0, 43, 60) and end - start >= 8:
+            proto, hlen = buf[start], (buf[start + 1] + 1) * 8
+            start += hlen
+        if proto == 44:
+            return PacketInfo(ts, frame_len, ip_len, "IPV6", None, b"", src, dst, proto)
+        seg = buf[start:end]
+    else:
+        return PacketInfo(ts, frame_len, frame_len, "IP", None, b"")
+
+    if proto != 6:
+        layer, sport, dport, payload = _transport_layer(proto, seg)
+        return PacketInfo(ts, frame_len, ip_len, layer, None, payload, src, dst, proto, sport, dport)
+
+    if len(seg) < 14:
+        return PacketInfo(ts, frame_len, ip_len, "TCP", None, b"", src, dst, proto)
+    sport, dport = struct.unpack_from("!HH", seg, 0)
+    doff = (seg[12] >> 4) * 4
+    flags = _FLAGS_TABLE[((seg[12] & 0x0F) << 8) | seg[13]]
+    payload = seg[doff:] if doff >= 20 else b""
+    if not payload:
+        layer = "TCP"
+    else:
+        layer = TCP_PORT_LAYERS.get(dport) or TCP_PORT_LAYERS.get(sport) or "DATA"
+    return PacketInfo(ts, frame_len, ip_len, layer, flags, payload, src, dst, proto, sport, dport)
+
+
+def decode_packet(linktype, ts, buf, frame_len):
+    """Decode one captured frame into a PacketInfo."""
+    off = 0
+    ethertype = None
+    if linktype == LINKTYPE_ETHERNET:
+        if len(buf) < 14:
+            return PacketInfo(ts, frame_len, frame_len, "ETH", None, b"")
+        ethertype = struct.unpack_from("!H", buf, 12)[0]
+        off = 14
+        while ethertype in ETH_VLAN and len(buf) >= off + 4:
+            ethertype = struct.unpack_from("!H", buf, off + 2)[0]
+            off += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(buf) < 16:
+            return PacketInfo(ts, frame_len, frame_len, "SLL", None, b"")
+        ethertype = struct.unpack_from("!H", buf, 14)[0]
+        off = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(buf) < 20:
+            return PacketInfo(ts, frame_len, frame_len, "SLL", None, b"")
+        ethertype = struct.unpack_from("!H", buf, 0)[0]
+        off = 20
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        off = 4
+    elif linktype not in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return PacketInfo(ts, frame_len, frame_len, "DATA", None, b"")
+
+    if ethertype is not None:
+        if ethertype == ETH_ARP:
+            return PacketInfo(ts, frame_len, frame_len, "ARP", None, b"")
+        if ethertype not in (ETH_IPV4, ETH_IPV6):
+            return PacketInfo(ts, frame_len, frame_len, "ETH", None, b"")
+
+    return _decode_ip(ts, buf, off, frame_len)
+
+
+def _iter_pcap(f, header, keep=None):
+    endian, ticks = PCAP_MAGIC[header[:4]]
+    rest = _read_exact(f, 20)
+    if rest is None:
+        return
+    linktype = struct.unpack(endian + "16xI", rest)[0] & 0x0FFFFFFF
+    yield from _iter_records(f, endian, ticks, linktype, keep=keep)
+
+
+def _iter_records(f, endian, ticks, linktype, pos=0, end=None, keep=None):
+    """Decode libpcap records from the current position (`pos`) up to byte `end`.
+
+    keep(ts, length) -> bool, if given, is asked before decoding (length is
+    the frame's wire length); rejected records are only read past (overload
+    sampling sheds them here).
+    """
+    rec_hdr = struct.Struct(endian + "IIII")
+    while end is None or pos < end:
+        hdr = _read_exact(f, 16)
+        if hdr is None:
+            return
+        sec, frac, incl, orig = rec_hdr.unpack(hdr)
+        data = _read_exact(f, incl)
+        if data is None:
+            return  # capture still being written / truncated tail
+        pos += 16 + incl
+        ts = sec + frac / ticks
+        if keep is None or keep(ts, orig):
+            yield decode_packet(linktype, ts, data, orig)
+
+
+def _pcap_header(f):
+    """Return (endian, ticks, snaplen, linktype) of a libpcap file, or None for pcapng."""
+    header = _read_exact(f, 24)
+    if header is None or header[:4] not in PCAP_MAGIC:
+        return None
+    endian, ticks = PCAP_MAGIC[header[:4]]
+    snaplen, linktype = struct.unpack(endian + "16xII", header)
+    return endian, ticks, snaplen, linktype & 0x0FFFFFFF
+
+
+def _is_record_chain(buf, off, endian, snaplen, ts_lo, ts_hi, depth=8):
+    """True if `depth` consecutive plausible record headers start at buf[off]."""
+    rec_hdr = struct.Struct(endian + "IIII")
+    for _ in range(depth):
+        if off + 16 > len(buf):
+            return off == len(buf)   # chain ran exactly into end of file
+        sec, frac, incl, orig = rec_hdr.unpack_from(buf, off)
+        if not (ts_lo <= sec <= ts_hi and incl <= snaplen and incl <= orig):
+            return False
+        off += 16 + incl
+    return True
+
+
+def pcap_shards(pcap_file: str, shard_bytes: int = 64 << 20):
+    """
+    Split a libpcap file into byte ranges of roughly `shard_bytes` that start
+    on record boundaries, for reading in parallel with read_packets_range.
+    Boundaries are found by seeking to the nominal offset and scanning
+    forward for a run of plausible record headers. pcapng files and files
+    smaller than one shard come back as a single (0, None) range.
+    """
+    size = os.path.getsize(pcap_file)
+    with open(pcap_file, "rb") as f:
+        info = _pcap_header(f)
+        if info is None or size <= shard_bytes:
+            return [(0, None)]
+        endian, _, snaplen, _ = info
+        snaplen = snaplen or 0xFFFFFFFF
+        first = _read_exact(f, 4)
+        if first is None:
+            return [(0, None)]
+        first_sec = struct.unpack(endian + "I", first)[0]
+        # Archived captures rarely span more than a few weeks
+        ts_lo, ts_hi = first_sec - 86400, first_sec + 86400 * 366
+
+        starts = [24]
+        scan = 2 * min(snaplen, 262144) + 64 * 16
+        for nominal in range(shard_bytes, size, shard_bytes):
+            if nominal <= starts[-1]:
+                continue
+            f.seek(nominal)
+            buf = f.read(scan + 9 * (16 + min(snaplen, 262144)))
+            for off in range(min(scan, len(buf))):
+                if _is_record_chain(buf, off, endian, snaplen, ts_lo, ts_hi):
+                    starts.append(nominal + off)
+                    break
+    ends = starts[1:] + [None]
+    return list(zip(starts, ends))
+
+
+def read_packets_range(pcap_file: str, start: int, end=None):
+    """Yield PacketInfo records whose record header lies in [start, end) of a file."""
+    with open(pcap_file, "rb", buffering=1 << 20) as f:
+        if start == 0:
+            yield from iter_packets_from(f)
+            return
+        endian, ticks, _, linktype = _pcap_header(f)
+        f.seek(start)
+        yield from _iter_records(f, endian, ticks, linktype, start, end)
+
+
+def _tsresol(value):
+    """Ticks per second for an if_tsresol option value."""
+    if value & 0x80:
+        return 2 ** (value & 0x7F)
+    return 10 ** value
+
+
+def _iter_options(body, endian):
+    off = 0
+    while off + 4 <= len(body):
+        code, length = struct.unpack_from(endian + "HH", body, off)
+        if code == 0:
+            return
+        yield code, body[off + 4: off + 4 + length]
+        off += 4 + ((length + 3) & ~3)
+
+
+def _iter_pcapng(f, first4, keep=None):
+    endian = "<"
+    interfaces = []   # list of (linktype, ticks_per_second, ts_offset)
+    block_type_raw = first4
+    while True:
+        if block_type_raw is None:
+            return
+        head = _read_exact(f, 4)
+        if head is None:
+            return
+        if block_type_raw == PCAPNG_SHB:
+            bom = _read_exact(f, 4)
+            if bom is None:
+                return
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            total = struct.unpack(endian + "I", head)[0]
+            body = _read_exact(f, total - 12)
+            if body is None:
+                return
+            interfaces = []
+            block_type_raw = _read_exact(f, 4)
+            continue
+
+        block_type = struct.unpack(endian + "I", block_type_raw)[0]
+        total = struct.unpack(endian + "I", head)[0]
+        if total < 12:
+            raise PcapFormatError(f"bad pcapng block length {total}")
+        body = _read_exact(f, total - 8)
+        if body is None:
+            return
+        body = body[:-4]  # trailing copy of the block length
+
+        if block_type == 1:      # Interface Description Block
+            linktype = struct.unpack_from(endian + "H", body, 0)[0]
+            ticks, offset = 1000000, 0
+            for code, val in _iter_options(body[8:], endian):
+                if code == 9 and val:
+                    ticks = _tsresol(val[0])
+                elif code == 14 and len(val) == 8:
+                    offset = struct.unpack(endian + "q", val)[0]
+            interfaces.append((linktype, ticks, offset))
+        elif block_type == 6:    # Enhanced Packet Block
+            if_id, ts_hi, ts_lo, incl, orig = struct.unpack_from(endian + "IIIII", body, 0)
+            linktype, ticks, offset = interfaces[if_id]
+            ts = ((ts_hi << 32) | ts_lo) / ticks + offset
+            if keep is None or keep(ts, orig):
+                yield decode_packet(linktype, ts, body[20:20 + incl], orig)
+        elif block_type == 3:    # Simple Packet Block (no timestamp)
+            orig = struct.unpack_from(endian + "I", body, 0)[0]
+            linktype = interfaces[0][0] if interfaces else LINKTYPE_ETHERNET
+            if keep is None or keep(0.0, orig):
+                yield decode_packet(linktype, 0.0, body[4:4 + orig], orig)
+        elif block_type == 2:    # obsolete Packet Block
+            if_id, _drops, ts_hi, ts_lo, incl, orig = struct.unpack_from(endian + "HHIIII", body, 0)
+            linktype, ticks, offset = interfaces[if_id]
+            ts = ((ts_hi << 32) | ts_lo) / ticks + offset
+            if keep is None or keep(ts, orig):
+                yield decode_packet(linktype, ts, body[20:20 + incl], orig)
+
+        block_type_raw = _read_exact(f, 4)
+
+
+def iter_packets_from(f, keep=None):
+    """Yield PacketInfo records from an open binary file or stream (see _iter_records for `keep`)."""
+    first4 = _read_exact(f, 4)
+    if first4 is None:
+        return
+    if first4 in PCAP_MAGIC:
+        yield from _iter_pcap(f, first4, keep)
+    elif first4 == PCAPNG_SHB:
+        yield from _iter_pcapng(f, first4, keep)
+    else:
+        raise PcapFormatError(f"unknown capture format (magic {first4.hex()})")
+
+
+def read_packets(pcap_file: str, keep=None):
+    """Yield PacketInfo records from a libpcap or pcapng file."""
+    with open(pcap_file, "rb", buffering=1 << 20) as f:
+        yield from iter_packets_from(f, keep)
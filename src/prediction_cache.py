@@ -0,0 +1,97 @@
+"""
+LRU memoization of detector outputs for repeated feature vectors.
+
+Idle links produce the all-zero vector, or vectors that differ only in
+the last digits, window after window. PredictionCache sits in front of
+any detectors object (FamilyDetectors, FusedFamilyDetectors,
+CompiledFamilyDetectors) and scores only the rows it has not seen. Rows
+are keyed on their values rounded to `sig_bits` significant bits
+(relative precision 2**-sig_bits), so near-identical vectors share an
+entry and exact zeros always do.
+
+    detectors = PredictionCache(load_detectors("family_detectors.pkl"), size=4096)
+    labels, probs = detectors.predict_batch(rows)
+    detectors.stats()   # {'hits': ..., 'misses': ..., 'hit_rate': ..., 'size': ...}
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+CACHE_LOOKUPS = metrics.Counter("wids_prediction_cache_total", "Prediction cache lookups", ["result"])
+CACHE_SIZE    = metrics.Gauge("wids_prediction_cache_entries", "Feature vectors held in the prediction cache")
+
+DEFAULT_SIZE = 4096
+DEFAULT_SIG_BITS = 10     # ~0.1% relative precision
+
+
+def quantize(X, sig_bits=DEFAULT_SIG_BITS):
+    """Round every value of X to `sig_bits` significant bits; one bytes key per row."""
+    mantissa, exponent = np.frexp(np.asarray(X, dtype=np.float64))
+    scale = float(1 << sig_bits)
+    rounded = np.ldexp(np.round(mantissa * scale) / scale, exponent)
+    rounded[rounded == 0] = 0.0     # -0.0 and 0.0 share a key
+    return [row.tobytes() for row in np.atleast_2d(rounded)]
+
+
+class PredictionCache:
+    """Detectors wrapper that answers repeated rows from an LRU of (label, probabilities)."""
+
+    def __init__(self, detectors, size=DEFAULT_SIZE, sig_bits=DEFAULT_SIG_BITS):
+        self.detectors = detectors
+        self.families = detectors.families
+        self.size = size
+        self.sig_bits = sig_bits
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        CACHE_SIZE.set_function(lambda: len(self.entries))
+
+    def __iter__(self):
+        return iter(self.families)
+
+    def __len__(self):
+        return len(self.families)
+
+    def labels_for(self, probs):
+        return self.detectors.labels_for(probs)
+
+    def predict_batch(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        keys = quantize(X, self.sig_bits)
+        probs = np.empty((len(keys), len(self.families)))
+        labels = [None] * len(keys)
+        missing = {}        # key -> row indices (duplicates within the batch score once)
+        for i, key in enumerate(keys):
+            hit = self.entries.get(key)
+            if hit is None:
+                missing.setdefault(key, []).append(i)
+                continue
+            self.entries.move_to_end(key)
+            labels[i], probs[i] = hit
+
+        if missing:
+            first = [rows[0] for rows in missing.values()]
+            new_labels, new_probs = self.detectors.predict_batch(X[first])
+            for (key, rows), label, p in zip(missing.items(), new_labels, new_probs):
+                for i in rows:
+                    labels[i], probs[i] = label, p
+                self.entries[key] = (label, p)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        misses = len(missing)
+        self.hits += len(keys) - misses
+        self.misses += misses
+        CACHE_LOOKUPS.inc(len(keys) - misses, result="hit")
+        CACHE_LOOKUPS.inc(misses, result="miss")
+        return labels, probs
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "size": len(self.entries)}
@@ -0,0 +1,159 @@
+"""
+Packet sampling for overload protection in the live path.
+
+A flood on the monitored host must not make scoring fall further and
+further behind. Sampler keeps one packet in `rate` and, when adaptive,
+doubles the rate while the backlog is above `high` and halves it again
+once it drops below `low` (at most once per ADJUST_SECONDS):
+
+    count   every rate-th capture record. Decided before the record is
+            decoded (pcap_reader's `keep` hook), so shed packets cost only
+            the read.
+    flow    packets whose bidirectional flow hash falls in 1/rate of the
+            hash space. Kept flows are complete, which --flows rows need.
+            With power-of-two rates the flows kept at a higher rate are a
+            subset of those kept at a lower one.
+
+Shed packets still reach FlowFeatureAccumulator.add_shed() with their
+timestamp and length (count mode straight from the record header, before
+any decode), so packet and byte totals and every timing feature stay
+exact; only the packet-size statistics, protocol mix and payload entropy
+come from the kept packets. Records carry their window's packets per kept
+packet as sampling_rate (for --flows rows, the 1-in-N flow rate).
+TrafficSketch weights each kept packet by the rate instead.
+"""
+import struct
+import time
+import zlib
+
+import metrics
+
+MAX_RATE = 64             # never keep fewer than 1 in MAX_RATE packets
+ADJUST_SECONDS = 1.0      # minimum time between two rate changes
+CHECK_EVERY = 256         # records between backlog checks in the reader
+FLOW_CACHE_SIZE = 65536   # 5-tuples whose flow hash is remembered
+
+SAMPLING_RATE = metrics.Gauge("wids_sampling_rate", "Current 1-in-N packet sampling rate")
+PACKETS_SHED  = metrics.Counter("wids_packets_shed_total", "Packets skipped by overload sampling")
+
+
+def flow_hash(pkt, per_host=False):
+    """
+    Direction-independent hash of the packet's 5-tuple (source host only with
+    per_host=True). CRC-32 rather than hash(), so ring workers in different
+    processes sample the same flows.
+    """
+    if per_host:
+        return zlib.crc32(pkt.src or b"")
+    a, b = (pkt.src or b"", pkt.sport or 0), (pkt.dst or b"", pkt.dport or 0)
+    if b < a:
+        a, b = b, a
+    return zlib.crc32(a[0] + b[0] + struct.pack("!HHH", a[1], b[1], pkt.proto or 0))
+
+
+class Sampler:
+    """1-in-`rate` packet sampling, optionally adapted to a backlog signal."""
+
+    def __init__(self, mode="count", rate=1, adaptive=True, high=None, low=None,
+                 max_rate=MAX_RATE, per_host=False, max_lag=None):
+        if mode not in ("count", "flow"):
+            raise ValueError(f"unknown sampling mode {mode!r}")
+        self.mode = mode
+        self.rate = max(1, int(rate))
+        self.adaptive = adaptive
+        self.high = high
+        self.low = low
+        self.max_rate = max_rate
+        self.per_host = per_host
+        # With max_lag the sampler adapts itself to how far capture timestamps
+        # trail the wall clock (a live stream); otherwise the caller adjust()s
+        self.max_lag = max_lag
+        if max_lag is not None:
+            self.high, self.low = max_lag, max_lag / 4
+        self.changed_at = 0.0
+        self.seen = 0            # packets offered
+        self.kept = 0
+        self.shed_reported = 0   # of seen - kept, already added to PACKETS_SHED
+        self.hashes = {}         # 5-tuple (as seen on the wire) -> flow_hash
+        SAMPLING_RATE.set_function(lambda: self.rate)
+
+    def adjust(self, backlog, high=None, low=None):
+        """Double or halve the rate for `backlog` (lag in s, queue depth, ...)."""
+        if not self.adaptive:
+            return self.rate
+        high = self.high if high is None else high
+        low = self.low if low is None else low
+        now = time.monotonic()
+        if now - self.changed_at < ADJUST_SECONDS:
+            return self.rate
+        old = self.rate
+        if backlog > high and self.rate < self.max_rate:
+            self.rate = min(self.rate * 2, self.max_rate)
+        elif backlog < low and self.rate > 1:
+            self.rate //= 2
+        if self.rate != old:
+            self.changed_at = now
+            print(f"[!] Backlog {backlog:.2f}: sampling 1 in {self.rate} packets ({self.mode})"
+                  if self.rate > old else f"[+] Backlog {backlog:.2f}: sampling 1 in {self.rate} packets")
+        return self.rate
+
+    def _report(self):
+        shed = self.seen - self.kept
+        PACKETS_SHED.inc(shed - self.shed_reported)
+        self.shed_reported = shed
+
+    def _check(self, ts):
+        # Every CHECK_EVERY packets: publish the shed count, look at the lag
+        self._report()
+        if self.max_lag is not None and ts:
+            self.adjust(time.time() - ts)
+
+    def keep_record(self, ts=None, length=0):
+        """count mode: True for every rate-th record (pcap_reader `keep` hook)."""
+        self.seen += 1
+        if self.seen % CHECK_EVERY == 0:
+            self._check(ts)
+        if self.rate == 1 or self.seen % self.rate == 0:
+            self.kept += 1
+            return True
+        return False
+
+    def keep(self, pkt):
+        """flow mode: True if the packet's flow is in the sampled 1/rate."""
+        self.seen += 1
+        if self.seen % CHECK_EVERY == 0:
+            self._check(pkt.timestamp)
+        if self.rate == 1:
+            self.kept += 1
+            return True
+        key = (pkt.src, pkt.sport, pkt.dst, pkt.dport, pkt.proto)
+        h = self.hashes.get(key)
+        if h is None:
+            if len(self.hashes) >= FLOW_CACHE_SIZE:
+                self.hashes.clear()
+            h = self.hashes[key] = flow_hash(pkt, self.per_host)
+        if h % self.rate == 0:
+            self.kept += 1
+            return True
+        return False
+
+    def reader_hook(self, shed=None):
+        """
+        `keep(ts, length)` callable for pcap_reader: count mode samples there,
+        flow mode needs the decode (None). Rejected records go to shed(ts, length).
+        """
+        if self.mode != "count":
+            return None
+        if shed is None:
+            return self.keep_record
+
+        def keep(ts, length):
+            if self.keep_record(ts):
+                return True
+            shed(ts, length)
+            return False
+        return keep
+
+    def report(self):
+        """Publish the shed count not yet in wids_packets_shed_total (end of a window)."""
+        self._report()
@@ -0,0 +1,243 @@
+"""
+Fixed-memory traffic sketches for high-cardinality features.
+
+FlowFeatureAccumulator keeps exact counters, which is fine for one window
+of one link but not for distinct-host or per-host statistics over a whole
+plant segment. TrafficSketch sits next to it and keeps:
+
+- HyperLogLog distinct counts of sources, destinations, destination ports,
+  destination endpoints (address:port) and source->destination pairs
+  (the pairs over the sources give the mean fan-out; a port scan shows up
+  as many endpoints per destination)
+- a Count-Min sketch of bytes and packets per source host
+- the top-k source hosts by bytes (heavy hitters) estimated from it
+
+All state is numpy arrays of a fixed size, independent of traffic volume,
+and merge() combines sketches of different windows, panes or worker
+processes exactly as if they had seen the packets together. Packets are
+buffered and folded in with vectorized hashing every SKETCH_FLUSH_PACKETS
+packets, so add() costs a few list appends.
+
+    sketch = TrafficSketch()
+    for pkt in packets:
+        sketch.add(pkt)
+    sketch.features()     # values for SKETCH_FEATURES
+    sketch.summary()      # the same as a dict, plus the top talkers
+"""
+import ipaddress
+
+import numpy as np
+
+# Extra feature columns, in the order TrafficSketch.features() returns them
+SKETCH_FEATURES = [
+    "Distinct Sources", "Distinct Destinations", "Distinct Destination Ports",
+    "Distinct Endpoints", "Mean Fan-out", "Top Talker Byte Share",
+]
+
+HLL_PRECISION = 12            # 4096 registers, ~1.6% standard error
+CM_WIDTH = 2048
+CM_DEPTH = 4
+TOP_K = 5
+SKETCH_FLUSH_PACKETS = 4096
+
+_M64 = (1 << 64) - 1
+_V6_TAG = 0x9E3779B97F4A7C15  # keeps folded IPv6 keys away from the IPv4 range
+
+
+def mix64(x):
+    """splitmix64 finalizer over a uint64 array (wrapping arithmetic)."""
+    x = np.asarray(x, dtype=np.uint64)
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hash64(*columns, seed=0):
+    """One 64-bit hash per row of the given uint64 columns."""
+    h = mix64(np.full(len(columns[0]), seed, dtype=np.uint64))
+    for col in columns:
+        h = mix64(h ^ np.asarray(col, dtype=np.uint64))
+    return h
+
+
+def address_keys(addrs):
+    """Packed addresses -> uint64 keys (IPv4 as is, IPv6 folded to 64 bits)."""
+    buf = b"".join(addrs)
+    if len(buf) == 4 * len(addrs):
+        return np.frombuffer(buf, dtype=">u4").astype(np.uint64)
+    keys = []
+    for a in addrs:
+        k = int.from_bytes(a, "big")
+        if len(a) == 16:
+            k = ((k >> 64) ^ k ^ _V6_TAG) & _M64
+        keys.append(k)
+    return np.array(keys, dtype=np.uint64)
+
+
+class HyperLogLog:
+    """Distinct-count estimator over 64-bit hashes; 2**p one-byte registers."""
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, hashes):
+        if not len(hashes):
+            return
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        # The remaining 64-p bits fit a float64 exactly, so frexp gives their bit length
+        rest = (hashes & np.uint64((1 << (64 - self.p)) - 1)).astype(np.float64)
+        rank = (64 - self.p + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)      # linear counting for small sets
+        return float(estimate)
+
+
+class CountMin:
+    """Count-Min sketch of `n_values` weights (e.g. bytes, packets) per key hash."""
+
+    def __init__(self, width=CM_WIDTH, depth=CM_DEPTH, n_values=1):
+        if width & (width - 1) or width > 1 << 16 or depth > 4:
+            raise ValueError("width must be a power of two <= 65536 and depth <= 4")
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((n_values, depth, width))
+
+    def _rows(self, hashes):
+        # Row i takes the i-th 16-bit slice of the hash
+        mask = np.uint64(self.width - 1)
+        return [((hashes >> np.uint64(16 * i)) & mask).astype(np.intp) for i in range(self.depth)]
+
+    def add(self, hashes, weights):
+        """weights: (n, n_values)"""
+        weights = np.asarray(weights, dtype=np.float64).reshape(len(hashes), -1)
+        for i, idx in enumerate(self._rows(hashes)):
+            for v in range(self.table.shape[0]):
+                self.table[v, i] += np.bincount(idx, weights=weights[:, v], minlength=self.width)
+
+    def query(self, hashes):
+        """(n, n_values) upper-bound estimates for each key hash."""
+        rows = self._rows(hashes)
+        est = np.stack([self.table[:, i, idx] for i, idx in enumerate(rows)])
+        return est.min(axis=0).T
+
+    def merge(self, other):
+        self.table += other.table
+        return self
+
+
+class TrafficSketch:
+    """Per-window sketch state; mergeable across panes, windows and workers."""
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.sources = HyperLogLog()
+        self.destinations = HyperLogLog()
+        self.ports = HyperLogLog()
+        self.endpoints = HyperLogLog()
+        self.pairs = HyperLogLog()
+        self.per_host = CountMin(n_values=2)      # bytes, packets by source host
+        self.candidates = {}                      # source key -> packed address
+        self.packets = 0
+        self.bytes = 0
+        self._src, self._dst, self._dport, self._len, self._weight = [], [], [], [], []
+
+    def add(self, pkt, weight=1):
+        """`weight` > 1 for a sampled packet standing in for several (sampling.py)."""
+        if pkt.src is None:
+            return
+        self._src.append(pkt.src)
+        self._dst.append(pkt.dst)
+        self._dport.append(pkt.dport)
+        self._len.append(pkt.length)
+        self._weight.append(weight)
+        if len(self._src) >= SKETCH_FLUSH_PACKETS:
+            self.flush()
+
+    def flush(self):
+        """Fold the buffered packets into the sketches."""
+        if not self._src:
+            return
+        src, dst = address_keys(self._src), address_keys(self._dst)
+        dport = np.array(self._dport, dtype=np.uint64)
+        weight = np.array(self._weight, dtype=np.float64)
+        length = np.array(self._len, dtype=np.float64) * weight
+        names = dict(zip(src.tolist(), self._src))
+        self._src, self._dst, self._dport, self._len, self._weight = [], [], [], [], []
+
+        src_h = hash64(src, seed=1)
+        self.sources.add(src_h)
+        self.destinations.add(hash64(dst, seed=2))
+        self.ports.add(hash64(dport, seed=3))
+        self.endpoints.add(hash64(dst, dport, seed=4))
+        self.pairs.add(hash64(src, dst, seed=5))
+        self.per_host.add(src_h, np.column_stack((length, weight)))
+        self.packets += int(weight.sum())
+        self.bytes += int(length.sum())
+        self._update_top(names)
+
+    def _update_top(self, new):
+        """Keep the top_k sources by estimated bytes among the old top and `new`."""
+        candidates = {**self.candidates, **new}
+        keys = np.fromiter(candidates, dtype=np.uint64, count=len(candidates))
+        est = self.per_host.query(hash64(keys, seed=1))[:, 0]
+        keep = np.argsort(-est, kind="stable")[:self.top_k]
+        self.candidates = {int(keys[i]): candidates[int(keys[i])] for i in keep}
+
+    def merge(self, other):
+        """Fold in `other` (another window, pane or worker's share of the traffic)."""
+        self.flush()
+        other.flush()
+        for name in ("sources", "destinations", "ports", "endpoints", "pairs", "per_host"):
+            getattr(self, name).merge(getattr(other, name))
+        self.packets += other.packets
+        self.bytes += other.bytes
+        if other.candidates or self.candidates:
+            self._update_top(other.candidates)
+        return self
+
+    def top_talkers(self):
+        """[{host, bytes, packets}] for the heaviest sources, largest first (estimates)."""
+        self.flush()
+        if not self.candidates:
+            return []
+        keys = np.fromiter(self.candidates, dtype=np.uint64, count=len(self.candidates))
+        est = self.per_host.query(hash64(keys, seed=1))
+        order = np.argsort(-est[:, 0], kind="stable")
+        return [{"host": str(ipaddress.ip_address(self.candidates[int(keys[i])])),
+                 "bytes": int(est[i, 0]), "packets": int(est[i, 1])} for i in order]
+
+    def features(self):
+        """Values for SKETCH_FEATURES."""
+        self.flush()
+        if not self.packets:
+            return [0.0] * len(SKETCH_FEATURES)
+        sources = self.sources.count()
+        top = self.top_talkers()
+        return [
+            sources,
+            self.destinations.count(),
+            self.ports.count(),
+            self.endpoints.count(),
+            self.pairs.count() / max(sources, 1.0),
+            min(top[0]["bytes"] / self.bytes, 1.0) if top else 0.0,
+        ]
+
+    def summary(self):
+        """JSON-friendly dict for prediction and anomaly records."""
+        record = {name: round(v, 3) for name, v in zip(SKETCH_FEATURES, self.features())}
+        record["top_talkers"] = self.top_talkers()
+        return record
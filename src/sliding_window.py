@@ -0,0 +1,103 @@
+"""
+Sliding-window feature state for continuous live prediction.
+
+The window of `window` seconds is split into panes of `hop` seconds, each
+holding its own FlowFeatureAccumulator (and TrafficSketch, with sketches=True). New packets only touch the newest
+pane and sliding the window drops whole panes, so a step costs
+O(new packets + panes) instead of O(packets in the window).
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from feature_extraction import FlowFeatureAccumulator
+from sketches import TrafficSketch
+
+
+class SlidingWindow:
+    """Pane-based sliding window over FlowFeatureAccumulator state."""
+
+    def __init__(self, window: float, hop: float, sketches: bool = False):
+        if hop <= 0 or window < hop:
+            raise ValueError("need 0 < hop <= window")
+        self.hop = float(hop)
+        self.n_panes = int(math.ceil(window / hop))
+        self.window = self.n_panes * self.hop
+        self.panes = OrderedDict()   # pane index -> FlowFeatureAccumulator
+        self.sketches = {} if sketches else None   # pane index -> TrafficSketch
+        self.lock = threading.Lock()
+
+    def pane_of(self, ts: float) -> int:
+        return int(ts // self.hop)
+
+    def _pane(self, idx):
+        """Accumulator of pane `idx` (created if needed; None if already evicted). Hold the lock."""
+        acc = self.panes.get(idx)
+        if acc is None:
+            if self.panes and idx < next(iter(self.panes)):
+                return None  # older than anything still in the window
+            acc = self.panes[idx] = FlowFeatureAccumulator()
+            if len(self.panes) > 1 and idx < next(reversed(self.panes)):
+                # late packet for a pane we had skipped; keep panes ordered
+                self.panes = OrderedDict(sorted(self.panes.items()))
+        return acc
+
+    def add(self, pkt, weight=1):
+        """Add one packet to the pane its timestamp falls in (`weight`: its sampling rate, for the sketch)."""
+        idx = self.pane_of(pkt.timestamp)
+        with self.lock:
+            acc = self._pane(idx)
+            if acc is None:
+                return
+            acc.add(pkt)
+            if self.sketches is not None:
+                sketch = self.sketches.get(idx)
+                if sketch is None:
+                    sketch = self.sketches[idx] = TrafficSketch()
+                sketch.add(pkt, weight)
+
+    def add_shed(self, ts, length):
+        """Count a packet shed by overload sampling (FlowFeatureAccumulator.add_shed)."""
+        with self.lock:
+            acc = self._pane(self.pane_of(ts))
+            if acc is not None:
+                acc.add_shed(ts, length)
+
+    def evict(self, now: float):
+        """Drop panes that ended before the window ending at `now` starts."""
+        first_live = self.pane_of(now) - self.n_panes
+        with self.lock:
+            while self.panes and next(iter(self.panes)) < first_live:
+                self.panes.popitem(last=False)
+            if self.sketches:
+                for idx in [i for i in self.sketches if i < first_live]:
+                    del self.sketches[idx]
+
+    def snapshot(self, now: float) -> FlowFeatureAccumulator:
+        """
+        Evict expired panes and return the merged state of the window that
+        ends at `now` (panes that started at or after `now` are excluded).
+        """
+        self.evict(now)
+        last = self.pane_of(now)
+        merged = FlowFeatureAccumulator()
+        with self.lock:
+            for idx, acc in self.panes.items():
+                if idx >= last:
+                    break
+                merged.merge(acc)
+        return merged
+
+    def features(self, now: float) -> list:
+        return self.snapshot(now).features()
+
+    def sketch(self, now: float) -> TrafficSketch:
+        """Merged TrafficSketch of the window ending at `now` (requires sketches=True)."""
+        self.evict(now)
+        last = self.pane_of(now)
+        merged = TrafficSketch()
+        with self.lock:
+            for idx in sorted(self.sketches):
+                if idx < last:
+                    merged.merge(self.sketches[idx])
+        return merged
@@ -0,0 +1,385 @@
+"""
+Supervisor for several capture/score workers, one per interface/filter pair.
+
+The workers come from a JSON config; every key of a worker entry is a
+live_predictor option (``"ring_seconds": 30`` -> ``--ring-seconds 30``,
+``true`` -> bare flag), with "defaults" applied to all of them:
+
+    {
+      "defaults": {"mode": "sliding", "window": 60, "hop": 10, "collapse": true},
+      "workers": [
+        {"name": "line1", "interface": "eth1", "filter": "host 192.168.1.44"},
+        {"name": "line2", "interface": "eth2", "filter": "net 192.168.2.0/24", "mode": "ring"}
+      ]
+    }
+
+The model and feature schema are loaded once here and the workers are
+forked from this process, so they share those pages copy-on-write (where
+fork is unavailable each worker loads its own copy). Each worker is its
+own process, so the OS spreads them over the cores; "cpus": [2, 3] pins
+one on Linux. Workers that exit while they should be running are
+restarted with exponential backoff.
+
+A small HTTP control API on localhost (used by app.py's /api/start,
+/api/stop, /api/status and /api/model/*):
+
+    GET  /status[/<name>]     POST /start[/<name>]     POST /stop[/<name>]     GET /metrics
+    POST /reload[/<name>][?path=<model file>]          POST /rollback[/<name>]
+
+/reload and /rollback reach the running workers through their model
+directory (see model_manager.py); the new model is loaded in the workers
+without restarting them.
+
+    python supervisor.py --config workers.json
+"""
+import argparse
+import gc
+import json
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+import model_manager
+
+WORKERS_FILE = os.getenv("WORKERS_FILE", "workers.json")
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = int(os.getenv("SUPERVISOR_PORT", "9107"))
+WORKER_METRICS_PORT = 9108      # worker i serves its metrics on WORKER_METRICS_PORT + i
+
+POLL_INTERVAL = 1.0
+STOP_TIMEOUT = 10.0             # SIGTERM grace before SIGKILL
+RESTART_DELAY = 1.0             # first restart delay, doubled per consecutive crash
+RESTART_MAX_DELAY = 60.0
+STABLE_AFTER = 60.0             # uptime that resets the crash backoff
+
+# Entry keys that configure the supervisor rather than live_predictor
+# ("name" goes to both: it keys the worker's spill files, metrics and model state)
+SUPERVISOR_KEYS = ("autostart", "cpus")
+
+_control_server = None
+
+WORKERS_UP = metrics.Gauge("wids_supervisor_workers_running", "Capture workers alive")
+RESTARTS   = metrics.Counter("wids_supervisor_restarts_total", "Crashed workers restarted", ["worker"])
+
+
+def worker_argv(entry):
+    """live_predictor argv for one config entry."""
+    argv = []
+    for key, value in entry.items():
+        if key in SUPERVISOR_KEYS or value is None or value is False:
+            continue
+        flag = "--" + key.replace("_", "-")
+        argv += [flag] if value is True else [flag, str(value)]
+    return argv
+
+
+def load_config(path=WORKERS_FILE):
+    """
+    Worker entries from `path`, defaults merged in and per-worker capture
+    file, ring directory and metrics port filled in. Without a config file
+    a single worker runs live_predictor's defaults.
+    """
+    from live_predictor import PCAP_FILE, RING_DIR, parse_args
+
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        print(f"[!] {path} not found; running one worker with live_predictor's defaults")
+        config = {"workers": [{"name": "default"}]}
+
+    entries, names = [], set()
+    for i, worker in enumerate(config.get("workers", [])):
+        entry = {**config.get("defaults", {}), **worker}
+        name = str(entry.setdefault("name", f"worker{i}"))
+        if name in names:
+            raise ValueError(f"{path}: duplicate worker name {name!r}")
+        names.add(name)
+        stem, ext = os.path.splitext(PCAP_FILE)
+        entry.setdefault("pcap_file", f"{stem}_{name}{ext}")
+        entry.setdefault("ring_dir", os.path.join(RING_DIR, name))
+        entry.setdefault("metrics_port", WORKER_METRICS_PORT + i)
+        try:
+            parse_args(worker_argv(entry))
+        except SystemExit:
+            raise ValueError(f"{path}: invalid options for worker {name!r}: {worker_argv(entry)}")
+        entries.append(entry)
+    if not entries:
+        raise ValueError(f"{path}: no workers configured")
+    return entries
+
+
+def _interrupt(signum, frame):
+    # One-shot: a repeated SIGTERM must not break the writers' final flush
+    signal.signal(signum, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def _worker_main(name, argv, model, cpus):
+    """Child process: run live_predictor with the inherited (or freshly loaded) model."""
+    import live_predictor
+
+    if _control_server is not None:
+        _control_server.socket.close()     # inherited by fork; the port belongs to the supervisor
+    metrics.unregister(WORKERS_UP, RESTARTS)   # served by the supervisor, not on the worker's port
+    signal.signal(signal.SIGTERM, _interrupt)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    args = live_predictor.parse_args(argv)
+    if model is None:
+        model = live_predictor.load_model(args.model)
+    print(f"[+] worker {name} (pid {os.getpid()}): {' '.join(argv)}")
+    live_predictor.run(args, model)
+
+
+class Worker:
+    """One configured capture; `wanted` is what the supervisor converges to."""
+
+    def __init__(self, entry):
+        self.name = entry["name"]
+        self.entry = entry
+        self.argv = worker_argv(entry)
+        self.cpus = entry.get("cpus")
+        self.wanted = entry.get("autostart", True)
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.crashes = 0            # consecutive, for the backoff
+        self.next_start = 0.0
+        self.last_exit = None
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def status(self):
+        if self.alive():
+            state = "running" if self.wanted else "stopping"
+        elif self.wanted:
+            state = "backoff" if self.next_start > time.time() else "starting"
+        else:
+            state = "stopped"
+        return {
+            "name": self.name, "state": state, "wanted": self.wanted,
+            "pid": self.process.pid if self.alive() else None,
+            "uptime": round(time.time() - self.started_at, 1) if self.alive() else None,
+            "restarts": self.restarts, "last_exit": self.last_exit,
+            "interface": self.entry.get("interface"), "filter": self.entry.get("filter"),
+            "mode": self.entry.get("mode", "batch"), "metrics_port": self.entry.get("metrics_port"),
+            "model": model_manager.read_state(self.model_dir(), self.name) or None,
+        }
+
+    def model_dir(self):
+        return self.entry.get("model_dir") or model_manager.MODEL_DIR
+
+
+class Supervisor:
+    """Starts, stops and restarts the workers; the main thread runs loop()."""
+
+    # Child process entry point: worker_main(name, argv, model, cpus)
+    worker_main = staticmethod(_worker_main)
+
+    def __init__(self, entries):
+        self.workers = {e["name"]: Worker(e) for e in entries}
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.models = {}
+        if "fork" in mp.get_all_start_methods():
+            self.ctx = mp.get_context("fork")
+            self._preload({e.get("model") for e in entries})
+        else:
+            self.ctx = mp.get_context("spawn")
+            print("[!] fork not available: every worker loads its own copy of the model")
+        WORKERS_UP.set_function(lambda: sum(w.alive() for w in self.workers.values()))
+
+    def _preload(self, paths):
+        """Load model(s) and schema before forking so workers share them."""
+        from feature_schema import load_schema
+        from live_predictor import MODEL_FILE, load_model
+
+        load_schema()
+        for path in paths:
+            start = time.perf_counter()
+            self.models[path] = load_model(path or MODEL_FILE)
+            print(f"[+] Loaded {path or MODEL_FILE} in {time.perf_counter() - start:.1f}s (shared by workers)")
+        # Park the loaded objects outside the GC generations so collections in
+        # the workers do not write to (and un-share) their pages
+        gc.freeze()
+
+    # ── control (any thread) ─────────────────────────────────────────
+    def select(self, name=None):
+        if name is None:
+            return list(self.workers.values())
+        if name not in self.workers:
+            raise KeyError(name)
+        return [self.workers[name]]
+
+    def set_wanted(self, name, wanted):
+        with self.lock:
+            workers = self.select(name)
+            for w in workers:
+                w.wanted = wanted
+                if wanted:
+                    w.crashes, w.next_start = 0, 0.0
+        return [w.name for w in workers]
+
+    def status(self, name=None):
+        with self.lock:
+            return [w.status() for w in self.select(name)]
+
+    def model_request(self, action, name=None, path=None):
+        """Ask the workers (all, or `name`) to hot-reload their model or roll it back."""
+        with self.lock:
+            workers = self.select(name)
+        by_dir = {}
+        for w in workers:
+            by_dir.setdefault(w.model_dir(), []).append(w.name)
+        for model_dir, names in by_dir.items():
+            model_manager.request(action, model_dir, workers=names, path=path)
+        return [w.name for w in workers]
+
+    # ── reconcile (main thread) ──────────────────────────────────────
+    def _start(self, w):
+        model = self.models.get(w.entry.get("model")) if self.ctx.get_start_method() == "fork" else None
+        w.process = self.ctx.Process(target=self.worker_main, name=f"wids-{w.name}",
+                                     args=(w.name, w.argv, model, w.cpus), daemon=False)
+        w.process.start()
+        w.started_at = time.time()
+
+    def _stop(self, w):
+        w.process.terminate()
+        w.process.join(STOP_TIMEOUT)
+        if w.process.is_alive():
+            print(f"[!] worker {w.name} ignored SIGTERM; killing")
+            w.process.kill()
+            w.process.join()
+        w.last_exit = w.process.exitcode
+        w.process = None
+        print(f"[+] worker {w.name} stopped")
+
+    def reconcile(self):
+        now = time.time()
+        with self.lock:
+            workers = list(self.workers.values())
+        for w in workers:
+            if w.process is not None and not w.process.is_alive():
+                w.last_exit = w.process.exitcode
+                uptime = now - w.started_at
+                w.process = None
+                if w.wanted:
+                    w.crashes = 1 if uptime >= STABLE_AFTER else w.crashes + 1
+                    delay = min(RESTART_MAX_DELAY, RESTART_DELAY * 2 ** (w.crashes - 1))
+                    w.next_start = now + delay
+                    w.restarts += 1
+                    RESTARTS.inc(worker=w.name)
+                    print(f"[!] worker {w.name} exited with code {w.last_exit} after "
+                          f"{uptime:.0f}s; restarting in {delay:.0f}s")
+            if w.wanted and w.process is None and now >= w.next_start and not self.stopping:
+                self._start(w)
+            elif not w.wanted and w.alive():
+                self._stop(w)
+
+    def loop(self):
+        try:
+            while True:
+                self.reconcile()
+                time.sleep(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            print("\n[!] Stopping workers")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.stopping = True
+        for w in self.workers.values():
+            w.wanted = False
+            if w.alive():
+                self._stop(w)
+
+
+def _control_handler(supervisor):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, payload, content_type="application/json"):
+            body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            parts = [p for p in self.path.split("?")[0].split("/") if p]
+            return (parts[0] if parts else ""), (parts[1] if len(parts) > 1 else None)
+
+        def do_GET(self):
+            action, name = self._route()
+            if action == "metrics":
+                return self._reply(200, metrics.render(), metrics.CONTENT_TYPE)
+            if action != "status":
+                return self._reply(404, {"error": "not found"})
+            try:
+                self._reply(200, {"workers": supervisor.status(name)})
+            except KeyError:
+                self._reply(404, {"error": f"unknown worker {name!r}"})
+
+        def do_POST(self):
+            action, name = self._route()
+            if action not in ("start", "stop", "reload", "rollback"):
+                return self._reply(404, {"error": "not found"})
+            try:
+                if action in ("reload", "rollback"):
+                    path = parse_qs(urlsplit(self.path).query).get("path", [None])[0]
+                    names = supervisor.model_request(action, name, path)
+                    return self._reply(202, {"status": f"{action} requested", "workers": names})
+                names = supervisor.set_wanted(name, action == "start")
+            except KeyError:
+                return self._reply(404, {"error": f"unknown worker {name!r}"})
+            self._reply(200, {"status": "starting" if action == "start" else "stopping",
+                              "workers": names})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve_control(supervisor, port=CONTROL_PORT, host=CONTROL_HOST):
+    global _control_server
+    server = _control_server = ThreadingHTTPServer((host, port), _control_handler(supervisor))
+    threading.Thread(target=server.serve_forever, name="supervisor-http", daemon=True).start()
+    print(f"[+] Supervisor control at http://{host}:{port}/status")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one capture/score worker per configured interface")
+    parser.add_argument("--config", default=WORKERS_FILE)
+    parser.add_argument("--model", default=None, help="default model for workers without a \"model\" key")
+    parser.add_argument("--port", type=int, default=CONTROL_PORT, help="control API port (localhost)")
+    parser.add_argument("--idle", action="store_true",
+                        help="start with every worker stopped (app.py starts them on request)")
+    args = parser.parse_args()
+
+    entries = load_config(args.config)
+    if args.model:
+        for entry in entries:
+            entry.setdefault("model", args.model)
+    for entry in entries:
+        if args.idle:
+            entry["autostart"] = False
+    supervisor = Supervisor(entries)
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"[+] {len(entries)} worker(s): {', '.join(e['name'] for e in entries)}")
+    # Fork the first workers while this process is still single-threaded;
+    # the control thread only starts afterwards
+    supervisor.reconcile()
+    serve_control(supervisor, args.port)
+    supervisor.loop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Shared fixtures. `mongo_db` is a fresh mongomock database; its bulk_write
+runs UpdateOne requests one by one, because mongomock 4.3 predates the
+`sort` option that pymongo 4.11+ passes from UpdateOne to the bulk builder.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def _bulk_write(collection, requests, ordered=True, **kwargs):
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+    errors = []
+    for i, op in enumerate(requests):
+        if not isinstance(op, UpdateOne):
+            raise NotImplementedError(f"test bulk_write: {type(op).__name__}")
+        try:
+            collection.update_one(op._filter, op._doc, upsert=op._upsert)
+        except DuplicateKeyError as e:
+            errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+            if ordered:
+                break
+    if errors:
+        raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": 0,
+                              "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                              "upserted": []})
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", _bulk_write)
+    return mongomock.MongoClient()["wids_test"]
@@ -0,0 +1,157 @@
+"""
+Regenerate the small sample captures in tests/data (deterministic output).
+
+    iiot_mix.pcap       Modbus/TCP polling, MQTT publishes and ICMP echo
+                        (benchmarks/synth_pcap.py, 300 packets)
+    edge_cases.pcapng   one frame each of the layers the port tables guess:
+                        HTTP over IPv4 and IPv6, DNS, NTP, TCP/UDP payload on
+                        unmapped ports, a VLAN-tagged Modbus request, a bare
+                        IPv6 SYN, ICMPv6 echo and ARP
+
+Next to each capture, <name>.fields.json holds the expected per-packet
+fields (bytes as hex), so the native reader is checked without tshark.
+They are decoded with pyshark where it and tshark are installed and with
+the native reader otherwise; review the diff of a natively written file
+against the frames above before committing it.
+
+    python tests/make_samples.py
+"""
+import importlib.util
+import json
+import os
+import shutil
+import struct
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from synth_pcap import START_TS, write_synthetic_pcap  # noqa: E402
+
+DATA_DIR = os.path.join(HERE, "data")
+MIX = {"modbus": 0.6, "mqtt": 0.3, "icmp": 0.1}
+FIELDS = ("length", "ip_len", "highest_layer", "tcp_flags", "payload",
+          "src", "dst", "proto", "sport", "dport")
+
+MAC_A, MAC_B = b"\x02\x00\x00\x00\x00\x01", b"\x02\x00\x00\x00\x00\x02"
+V4_A, V4_B = bytes((192, 168, 1, 10)), bytes((192, 168, 1, 44))
+V6_A = bytes.fromhex("fd000000000000000000000000000010")
+V6_B = bytes.fromhex("fd000000000000000000000000000044")
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def _eth(payload, ethertype=0x0800, vlan=None):
+    tag = struct.pack("!HH", 0x8100, vlan) if vlan is not None else b""
+    frame = MAC_B + MAC_A + tag + struct.pack("!H", ethertype) + payload
+    return frame + b"\x00" * (60 - len(frame)) if len(frame) < 60 else frame
+
+
+def _ipv4(proto, body, ident=1):
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(body), ident, 0x4000, 64, proto, 0, V4_A, V4_B)
+    return header[:10] + struct.pack("!H", _checksum(header)) + header[12:] + body
+
+
+def _ipv6(proto, body):
+    return struct.pack("!IHBB", 6 << 28, len(body), proto, 64) + V6_A + V6_B + body
+
+
+def _tcp(sport, dport, flags, payload=b"", seq=1000):
+    return struct.pack("!HHIIBBHHH", sport, dport, seq, 1, 5 << 4, flags, 64240, 0, 0) + payload
+
+
+def _udp(sport, dport, payload):
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+
+def edge_frames():
+    http = b"GET /status HTTP/1.1\r\nHost: plc-gw\r\nUser-Agent: wids-test\r\n\r\n"
+    dns = struct.pack("!HHHHHH", 0x1234, 0x0100, 1, 0, 0, 0) + b"\x06plc-gw\x05local\x00" + struct.pack("!HH", 1, 1)
+    ntp = bytes((0x23,)) + b"\x00" * 47
+    modbus = struct.pack("!HHHB", 7, 0, 6, 1) + struct.pack("!BHH", 3, 0, 4)
+    echo6 = struct.pack("!BBHHH", 128, 0, 0, 1, 1) + b"ping" * 8
+    arp = struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 1, MAC_A, V4_A, b"\x00" * 6, V4_B)
+    return [
+        _eth(_ipv4(6, _tcp(51000, 80, 0x18, http))),
+        _eth(_ipv6(6, _tcp(51001, 8080, 0x18, http)), 0x86DD),
+        _eth(_ipv4(17, _udp(53000, 53, dns), 2)),
+        _eth(_ipv4(17, _udp(123, 123, ntp), 3)),
+        _eth(_ipv4(6, _tcp(51002, 9999, 0x18, b"\x8a\x01proprietary-telemetry\x00\x10"), 4)),
+        _eth(_ipv4(17, _udp(40000, 40001, b"\x7f\x00raw-sensor-frame\x01\x02\x03"), 5)),
+        _eth(_ipv4(6, _tcp(40002, 502, 0x18, modbus), 6), vlan=10),
+        _eth(_ipv6(6, _tcp(51003, 443, 0x02)), 0x86DD),
+        _eth(_ipv6(58, echo6), 0x86DD),
+        _eth(arp, 0x0806),
+    ]
+
+
+def _block(block_type, body):
+    body += b"\x00" * (-len(body) % 4)
+    total = 12 + len(body)
+    return struct.pack("<II", block_type, total) + body + struct.pack("<I", total)
+
+
+def write_pcapng(path, frames, start=START_TS, gap=0.0125):
+    """Section header, one Ethernet interface at microsecond resolution, one EPB per frame."""
+    with open(path, "wb") as f:
+        f.write(_block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)))
+        f.write(_block(1, struct.pack("<HHI", 1, 0, 65535)))
+        for i, frame in enumerate(frames):
+            ticks = int(round((start + i * gap) * 1e6))
+            f.write(_block(6, struct.pack("<IIIII", 0, ticks >> 32, ticks & 0xFFFFFFFF,
+                                          len(frame), len(frame)) + frame))
+
+
+def fields_path(pcap_path):
+    return os.path.splitext(pcap_path)[0] + ".fields.json"
+
+
+def packet_fields(pkt):
+    """JSON-ready timestamp and FIELDS of one PacketInfo."""
+    row = {"timestamp": pkt.timestamp}
+    for field in FIELDS:
+        value = getattr(pkt, field)
+        row[field] = value.hex() if isinstance(value, bytes) else value
+    return row
+
+
+def load_fields(pcap_path):
+    with open(fields_path(pcap_path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_fields(pcap_path):
+    """Write <name>.fields.json for `pcap_path`; returns the backend that decoded it."""
+    from feature_extraction import iter_packets
+
+    if shutil.which("tshark") and importlib.util.find_spec("pyshark"):
+        backend = "pyshark"
+    else:
+        backend = "native"
+        print(f"[!] pyshark/tshark not available: {os.path.basename(pcap_path)} fields come from the native reader")
+    rows = [packet_fields(p) for p in iter_packets(pcap_path, backend)]
+    with open(fields_path(pcap_path), "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(json.dumps(r, ensure_ascii=False) for r in rows) + "\n]\n")
+    return backend
+
+
+def main():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    captures = [os.path.join(DATA_DIR, "iiot_mix.pcap"), os.path.join(DATA_DIR, "edge_cases.pcapng")]
+    write_synthetic_pcap(captures[0], packets=300, seed=1, mix=MIX)
+    write_pcapng(captures[1], edge_frames())
+    for path in captures:
+        write_fields(path)
+    print(f"[+] Sample captures and expected fields written to {DATA_DIR}")
+
+
+if __name__ == "__main__":
+    main()
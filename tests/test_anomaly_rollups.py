@@ -0,0 +1,52 @@
+"""
+Anomaly rollups must count each stored anomaly once, however often its
+batch is retried or replayed from the spill file, on a database the API
+has never touched (AnomalyWriter creates the unique index itself).
+"""
+from datetime import datetime
+
+from bson import ObjectId
+
+from anomaly_rollups import BATCH_FIELD, AnomalyWriter, summary
+
+
+def anomalies(n):
+    return [{"_id": ObjectId(), "timestamp": datetime(2026, 1, 1, 12, i % 3, 5),
+             "label": "Botnet", "anomaly_probs": {"Botnet": 0.9, "Worm": 0.4 + i / 100}}
+            for i in range(n)]
+
+
+def counts(rollups):
+    return {(d["minute"], d["family"]): d["count"] for d in rollups.find()}
+
+
+def test_replayed_batch_counts_once(mongo_db, tmp_path):
+    writer = AnomalyWriter(mongo_db["anomalies"], mongo_db["anomaly_rollups"],
+                           spill_path=str(tmp_path / "spill.jsonl"), flush_interval=0.05)
+    try:
+        batch = anomalies(10)
+        writer.write(batch)
+        first = counts(mongo_db["anomaly_rollups"])
+        assert all(BATCH_FIELD in doc for doc in batch)
+
+        writer.write(batch)     # a retry after a lost acknowledgement
+        writer.write([dict(doc) for doc in batch])    # the same batch replayed from disk
+        assert counts(mongo_db["anomaly_rollups"]) == first
+    finally:
+        writer.close()
+
+    assert mongo_db["anomalies"].count_documents({}) == 10
+    result = summary(mongo_db["anomaly_rollups"])
+    assert result["total"] == 10
+    assert result["counts"] == {"Botnet": 10, "Worm": 10}
+
+
+def test_new_batch_still_counts(mongo_db, tmp_path):
+    writer = AnomalyWriter(mongo_db["anomalies"], mongo_db["anomaly_rollups"],
+                           spill_path=str(tmp_path / "spill.jsonl"), flush_interval=0.05)
+    try:
+        writer.write(anomalies(4))
+        writer.write(anomalies(6))
+    finally:
+        writer.close()
+    assert summary(mongo_db["anomaly_rollups"])["total"] == 10
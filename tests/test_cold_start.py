@@ -0,0 +1,19 @@
+"""
+Starting the predictor must not import the training stack: pandas,
+sklearn and data_prep cost hundreds of milliseconds per (re)start and are
+only needed by the training entry points (see benchmarks/bench_cold_start.py).
+"""
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+TRAINING_MODULES = ("pandas", "sklearn", "data_prep")
+
+
+def test_live_predictor_import_skips_training_modules():
+    code = ("import sys, live_predictor\n"
+            f"print(' '.join(m for m in {TRAINING_MODULES!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True,
+                         text=True, check=True).stdout
+    assert out.strip() == ""
@@ -0,0 +1,91 @@
+"""
+Inter-arrival features of FlowFeatureAccumulator against the original
+batch computation, which took np.diff of the sorted packet timestamps.
+
+An in-order capture must give exactly the gaps of the sorted timestamps,
+and so must one whose packets arrive up to REORDER_DEPTH places late;
+a packet later than that counts as a zero gap, never a negative one.
+"""
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import feature_extraction  # noqa: E402
+from feature_extraction import REORDER_DEPTH, FlowFeatureAccumulator  # noqa: E402
+from pcap_reader import read_packets  # noqa: E402
+
+SAMPLE = os.path.join(HERE, "data", "iiot_mix.pcap")
+MEAN_IAT, DURATION, BASELINE_DEVIATION = 2, 3, 10
+
+
+@pytest.fixture(autouse=True)
+def no_categories(monkeypatch):
+    monkeypatch.setattr(feature_extraction, "protocol_categories", lambda: [])
+    monkeypatch.setattr(feature_extraction, "flags_categories", lambda: [])
+
+
+def timing(acc):
+    f = acc.features()
+    return f[MEAN_IAT], f[DURATION], f[BASELINE_DEVIATION]
+
+
+def sorted_timing(timestamps):
+    """Mean IAT, duration and CV of the gaps between sorted timestamps, gap by gap (Welford)."""
+    gaps = np.diff(np.sort(timestamps)).tolist()
+    mean = m2 = 0.0
+    for i, g in enumerate(gaps, 1):
+        delta = g - mean
+        mean += delta / i
+        m2 += delta * (g - mean)
+    duration = max(timestamps) - min(timestamps)
+    mean_iat = duration / len(gaps)
+    return mean_iat, duration, (m2 / len(gaps)) ** 0.5 / mean_iat
+
+
+def accumulate(packets):
+    acc = FlowFeatureAccumulator()
+    for pkt in packets:
+        acc.add(pkt)
+    return acc
+
+
+def test_in_order_capture_matches_sorted_gaps():
+    packets = list(read_packets(SAMPLE))
+    ts = [p.timestamp for p in packets]
+    assert ts == sorted(ts)
+    got = timing(accumulate(packets))
+    assert got == sorted_timing(ts)
+
+    # and the numpy form of the original code, up to summation order
+    gaps = np.diff(np.sort(ts))
+    reference = (float(np.mean(gaps)), ts[-1] - ts[0], float(np.std(gaps) / np.mean(gaps)))
+    for a, b in zip(got, reference):
+        assert math.isclose(a, b, rel_tol=1e-12)
+
+
+def test_late_packets_within_depth_are_reordered():
+    packets = list(read_packets(SAMPLE))
+    late = packets[:]
+    for i in range(0, len(late) - REORDER_DEPTH, 3 * REORDER_DEPTH):
+        late.insert(i + REORDER_DEPTH, late.pop(i))   # arrives REORDER_DEPTH places late
+    assert late != packets
+    assert timing(accumulate(late)) == timing(accumulate(packets))
+
+
+def test_later_packets_count_as_zero_gap():
+    ts = [float(i) for i in range(100)]
+    arrival = ts[:10] + ts[11:50] + [ts[10]] + ts[50:]
+    acc = FlowFeatureAccumulator()
+    for t in arrival:
+        acc.add_shed(t, 60)
+    mean_iat, duration, deviation = timing(acc)
+    assert (mean_iat, duration) == sorted_timing(ts)[:2]
+    # 9 -> 11 stays a two-second gap; the late packet adds a zero one
+    gaps = np.array([1.0] * 97 + [2.0, 0.0])
+    assert math.isclose(deviation, float(np.std(gaps)) / mean_iat, rel_tol=1e-12)
@@ -0,0 +1,66 @@
+"""
+Every supervisor worker publishes its latest prediction on its own
+channel, so one worker never replaces another's in /api/latest.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+import latest_channel
+from latest_channel import LatestChannels, channel_path
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    monkeypatch.setattr(latest_channel, "WORKER", None)
+    return str(tmp_path / "latest_prediction.json")
+
+
+def record(label):
+    return {"timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc), "label": label,
+            "probability": 0.9, "probabilities": {label: 0.9}, "interface": "eth1"}
+
+
+def publish_as(worker, label, base):
+    latest_channel.set_worker(worker)
+    latest_channel.publish(record(label), channel_path(worker, base))
+
+
+def test_workers_keep_separate_channels(base):
+    publish_as("line2", "Worm", base)
+    publish_as("line1", "Botnet", base)
+    channels = LatestChannels(base)
+    assert channels.workers() == ["line1", "line2"]
+
+    doc, _, etag1 = channels.get("line1").get()
+    assert doc["label"] == "Botnet" and doc["worker"] == "line1"
+    doc, _, etag2 = channels.get("line2").get()
+    assert doc["label"] == "Worm" and doc["worker"] == "line2"
+    assert etag1 != etag2
+
+    # line2 publishing again leaves line1's payload (and ETag) alone
+    publish_as("line2", "Benign", base)
+    channels.get("line2").refresh()
+    assert channels.get("line1").get()[2] == etag1
+    assert channels.get("line2").get()[0]["label"] == "Benign"
+
+
+def test_default_channel(base):
+    channels = LatestChannels(base)
+    assert channels.get().path == base         # nothing yet: the unnamed channel
+    publish_as("line2", "Worm", base)
+    publish_as("line1", "Botnet", base)
+    assert channels.get().get()[0]["worker"] == "line1"
+    publish_as(None, "Benign", base)
+    channels.get().refresh()                   # its watcher would within poll_interval
+    assert channels.get().get()[0]["label"] == "Benign"
+    assert "worker" not in channels.get().get()[0]
+
+
+def test_unknown_and_invalid_workers(base):
+    channels = LatestChannels(base)
+    assert channels.get("nobody") is None
+    with pytest.raises(ValueError):
+        channels.get("../etc/passwd")
+    with pytest.raises(ValueError):
+        latest_channel.set_worker("a/b")
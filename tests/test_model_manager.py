@@ -0,0 +1,132 @@
+"""
+ModelManager hot reload on small synthetic artifacts: --model versus
+what the model directory already holds, loading a new artifact, rejecting
+an invalid one, rollback, and the control.jsonl request queue.
+"""
+import os
+import time
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+import model_manager
+from family_model import load_detectors
+from model_manager import ModelManager, read_state, request
+
+PROTOCOLS, FLAGS = ["TCP", "UDP"], ["A", "S"]
+N_FEATURES = len(model_manager.NUMERICAL_FEATURES) + len(PROTOCOLS) + len(FLAGS)
+
+
+@pytest.fixture(autouse=True)
+def schema(monkeypatch):
+    monkeypatch.setattr(model_manager, "protocol_categories", lambda: PROTOCOLS)
+    monkeypatch.setattr(model_manager, "flags_categories", lambda: FLAGS)
+    monkeypatch.setattr(model_manager, "feature_columns", lambda: [f"f{i}" for i in range(N_FEATURES)])
+
+
+def write_model(path, families=("Benign", "Botnet"), n_features=N_FEATURES, seed=0):
+    """A {family: LogisticRegression} artifact, written under a temporary name and renamed."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(40, n_features))
+    models = {}
+    for j, family in enumerate(families):
+        y = (X[:, j] > 0).astype(int)
+        models[family] = LogisticRegression().fit(X, y)
+    tmp = f"{path}.tmp"
+    joblib.dump(models, tmp)
+    os.replace(tmp, path)
+    # distinct mtimes even on coarse filesystem clocks
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seed * 1_000_000_000))
+    return str(path)
+
+
+def settle(manager, timeout=10.0):
+    """poll() until no load is running or waiting; returns the active version."""
+    deadline = time.monotonic() + timeout
+    manager.poll(force=True)
+    while manager.loading is not None or manager.pending is not None:
+        assert time.monotonic() < deadline, "model load did not finish"
+        time.sleep(0.01)
+        manager.poll()
+    return manager.poll()
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    d = tmp_path / "models"
+    d.mkdir()
+    return d
+
+
+@pytest.fixture
+def started(tmp_path, model_dir):
+    """A manager started with --model outside the watched directory."""
+    path = write_model(tmp_path / "start.pkl")
+    return ModelManager(load_detectors(path), path, str(model_dir), name="w1")
+
+
+def test_startup_model_wins_over_existing_artifacts(tmp_path, model_dir):
+    write_model(model_dir / "older_but_newest.pkl", seed=5)
+    path = write_model(tmp_path / "start.pkl", seed=1)
+    manager = ModelManager(load_detectors(path), path, str(model_dir), name="w1")
+    start = manager.version
+    assert settle(manager) == start
+
+    # an explicit reload request does load it
+    request("reload", str(model_dir))
+    assert settle(manager).startswith("older_but_newest-")
+
+
+def test_new_artifact_is_hot_reloaded(started, model_dir):
+    start = started.version
+    write_model(model_dir / "v2.pkl", seed=2)
+    version = settle(started)
+    assert version.startswith("v2-") and version != start
+    state = read_state(str(model_dir), "w1")
+    assert state["version"] == version and state["previous"] == [start]
+
+
+def test_invalid_artifact_is_rejected(started, model_dir):
+    start = started.version
+    write_model(model_dir / "no_benign.pkl", families=("Botnet", "Worm"), seed=2)
+    assert settle(started) == start
+    assert "no_benign.pkl" in started.last_error
+    write_model(model_dir / "narrow.pkl", n_features=N_FEATURES - 3, seed=3)
+    assert settle(started) == start
+    assert "features" in read_state(str(model_dir), "w1")["last_error"]
+
+
+def test_rollback_request_is_not_undone_by_the_watch(started, model_dir):
+    start = started.version
+    write_model(model_dir / "v2.pkl", seed=2)
+    assert settle(started).startswith("v2-")
+    request("rollback", str(model_dir))
+    assert settle(started) == start
+    assert settle(started) == start      # v2.pkl unchanged, so it stays out
+
+
+def test_control_queue_in_order_and_by_worker(started, model_dir):
+    start = started.version
+    a = write_model(model_dir / "a.pkl", seed=2)
+    assert settle(started).startswith("a-")
+    request("rollback", str(model_dir), workers=["someone-else"])
+    request("rollback", str(model_dir))
+    request("reload", str(model_dir), workers=["w1"], path=os.path.basename(a))
+    # in order: back to the start model, then a again (the other way round ends on start)
+    assert settle(started).startswith("a-")
+    assert [m.version for m in started.history] == [start]
+    assert started.control_offset == os.path.getsize(model_dir / model_manager.CONTROL_FILE)
+
+
+def test_requests_queued_before_startup_are_not_replayed(tmp_path, model_dir):
+    request("rollback", str(model_dir))
+    request("reload", str(model_dir))
+    write_model(model_dir / "queued.pkl", seed=2)
+    path = write_model(tmp_path / "start.pkl")
+    manager = ModelManager(load_detectors(path), path, str(model_dir), name="w1")
+    start = manager.version
+    assert settle(manager) == start
+    assert not manager.history
@@ -0,0 +1,124 @@
+"""
+BatchedMongoWriter against an in-memory collection that can be taken
+down: flushes at the size and time thresholds, spills when inserts keep
+failing, replays after recovery, and after a crash in the middle of a replay.
+"""
+import os
+import time
+
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from mongo_writer import BatchedMongoWriter
+
+
+class FakeCollection:
+    """insert_many() into a dict by _id, failing with AutoReconnect while `down`."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.docs = {}
+        self.down = False
+        self.calls = 0
+
+    def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        if self.down:
+            raise AutoReconnect("connection refused")
+        dups = []
+        for i, doc in enumerate(docs):
+            if doc["_id"] in self.docs:
+                dups.append({"index": i, "code": 11000})
+            else:
+                self.docs[doc["_id"]] = dict(doc)
+        if dups:
+            raise BulkWriteError({"writeErrors": dups})
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def col():
+    return FakeCollection()
+
+
+@pytest.fixture
+def make_writer(tmp_path):
+    writers = []
+
+    def make(collection, **kwargs):
+        kwargs.setdefault("spill_path", str(tmp_path / "spill.jsonl"))
+        kwargs.setdefault("max_retries", 1)
+        kwargs.setdefault("backoff", 0.01)
+        w = BatchedMongoWriter(collection, **kwargs)
+        writers.append(w)
+        return w
+
+    yield make
+    for w in writers:
+        w.close(timeout=5)
+
+
+def test_flush_at_batch_size(col, make_writer):
+    w = make_writer(col, batch_size=5, flush_interval=30.0)
+    for i in range(5):
+        w.put({"i": i})
+    assert wait_for(lambda: len(col.docs) == 5, timeout=2.0)
+    assert col.calls == 1
+
+
+def test_flush_at_interval(col, make_writer):
+    w = make_writer(col, batch_size=100, flush_interval=0.2)
+    start = time.monotonic()
+    for i in range(3):
+        w.put({"i": i})
+    assert wait_for(lambda: len(col.docs) == 3)
+    assert time.monotonic() - start >= 0.15
+    assert w.stats()["inserted"] == 3
+
+
+def test_spill_then_replay_after_recovery(col, make_writer, tmp_path):
+    col.down = True
+    w = make_writer(col, batch_size=4, flush_interval=0.05)
+    for i in range(4):
+        w.put({"i": i})
+    assert wait_for(lambda: w.spill_backlog == 4)
+    assert os.path.exists(tmp_path / "spill.jsonl")
+    assert not col.docs
+
+    col.down = False
+    w.put({"i": 4})         # the next successful flush replays the spill
+    assert wait_for(lambda: len(col.docs) == 5)
+    assert wait_for(lambda: w.spill_backlog == 0)
+    assert not os.path.exists(tmp_path / "spill.jsonl")
+    assert sorted(d["i"] for d in col.docs.values()) == [0, 1, 2, 3, 4]
+
+
+def test_replay_interrupted_by_crash(col, make_writer, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    stored = {"_id": ObjectId(), "i": 0}
+    col.docs[stored["_id"]] = dict(stored)     # landed before the crash
+    # A crashed run left its replay file behind, and a newer spill next to it
+    with open(str(spill) + ".replay", "w", encoding="utf-8") as f:
+        for doc in (stored, {"_id": ObjectId(), "i": 1}):
+            f.write(json_util.dumps(doc) + "\n")
+    with open(spill, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps({"_id": ObjectId(), "i": 2}) + "\n")
+        f.write('{"_id": {"$oid": "')     # cut short mid-write
+
+    w = make_writer(col, batch_size=10, flush_interval=0.05)
+    assert not os.path.exists(str(spill) + ".replay")
+    w.put({"i": 3})
+    assert wait_for(lambda: len(col.docs) == 4)
+    assert wait_for(lambda: not os.path.exists(spill))
+    assert sorted(d["i"] for d in col.docs.values()) == [0, 1, 2, 3]
+    assert w.spill_backlog == 0
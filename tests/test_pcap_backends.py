@@ -0,0 +1,109 @@
+"""
+The native pcap reader against the tshark (pyshark) path it replaces.
+
+highest_layer comes from a port table in the native reader and from
+tshark's dissectors in pyshark, and it feeds Flow Entropy and the protocol
+one-hot, so both backends must agree packet by packet on the sample
+captures in tests/data (regenerate them with tests/make_samples.py).
+The native reader is held to the expected fields committed next to each
+capture (<name>.fields.json) everywhere; the live comparison with pyshark
+is skipped where pyshark or tshark is not installed.
+"""
+import glob
+import importlib.util
+import math
+import os
+import shutil
+import sys
+from collections import Counter
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import feature_extraction  # noqa: E402
+from feature_extraction import FlowFeatureAccumulator, iter_packets  # noqa: E402
+from make_samples import FIELDS, load_fields, packet_fields, write_pcapng  # noqa: E402
+from pcap_reader import read_packets  # noqa: E402
+
+SAMPLES = sorted(glob.glob(os.path.join(HERE, "data", "*.pcap*")))
+
+needs_tshark = pytest.mark.skipif(
+    shutil.which("tshark") is None or importlib.util.find_spec("pyshark") is None,
+    reason="pyshark and tshark are needed for the reference backend")
+
+
+def features(packets, monkeypatch, protocols, flags):
+    """Feature vector of `packets` with the one-hot categories fixed to `protocols` / `flags`."""
+    monkeypatch.setattr(feature_extraction, "protocol_categories", lambda: protocols)
+    monkeypatch.setattr(feature_extraction, "flags_categories", lambda: flags)
+    acc = FlowFeatureAccumulator()
+    for pkt in packets:
+        acc.add(pkt)
+    return acc.features()
+
+
+def assert_matches_fields(packets, expected, backend):
+    assert len(packets) == len(expected)
+    for i, (pkt, want) in enumerate(zip(packets, expected)):
+        got = packet_fields(pkt)
+        assert math.isclose(got.pop("timestamp"), want["timestamp"], abs_tol=1e-6), f"packet {i}: timestamp"
+        for field in FIELDS:
+            assert got[field] == want[field], \
+                f"packet {i}: {field} {backend}={got[field]!r} expected={want[field]!r}"
+
+
+def assert_vectors_close(a, b):
+    assert len(a) == len(b)
+    for i, (x, y) in enumerate(zip(a, b)):
+        assert math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9), f"feature [{i}]: {x!r} != {y!r}"
+
+
+def test_samples_present():
+    assert SAMPLES, "no sample captures in tests/data (run tests/make_samples.py)"
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_native_matches_expected_fields(path):
+    assert_matches_fields(list(read_packets(path)), load_fields(path), "native")
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_native_pcap_and_pcapng_agree(path, tmp_path):
+    packets = list(read_packets(path))
+    assert packets
+    if not path.endswith(".pcap"):
+        return
+    with open(path, "rb") as f:
+        raw = f.read()
+    # Re-encode the libpcap frames as pcapng; both readers must decode them alike
+    frames, off = [], 24
+    while off < len(raw):
+        incl = int.from_bytes(raw[off + 8:off + 12], "little")
+        frames.append(raw[off + 16:off + 16 + incl])
+        off += 16 + incl
+    gap = (packets[-1].timestamp - packets[0].timestamp) / max(len(packets) - 1, 1)
+    ng = tmp_path / "copy.pcapng"
+    write_pcapng(str(ng), frames, start=packets[0].timestamp, gap=gap)
+    for a, b in zip(packets, read_packets(str(ng))):
+        assert [getattr(a, f) for f in FIELDS] == [getattr(b, f) for f in FIELDS]
+
+
+@needs_tshark
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_native_matches_pyshark(path, monkeypatch):
+    native = list(iter_packets(path, "native"))
+    reference = list(iter_packets(path, "pyshark"))
+    assert_matches_fields(reference, load_fields(path), "pyshark")
+    assert len(native) == len(reference)
+    for i, (a, b) in enumerate(zip(native, reference)):
+        assert math.isclose(a.timestamp, b.timestamp, abs_tol=1e-6), f"packet {i}: timestamp"
+        for field in FIELDS:
+            assert getattr(a, field) == getattr(b, field), \
+                f"packet {i}: {field} native={getattr(a, field)!r} pyshark={getattr(b, field)!r}"
+
+    protocols = sorted(Counter(p.highest_layer for p in native + reference))
+    flags = sorted({p.tcp_flags.upper() for p in native + reference if p.tcp_flags})
+    assert_vectors_close(features(native, monkeypatch, protocols, flags),
+                         features(reference, monkeypatch, protocols, flags))
@@ -0,0 +1,115 @@
+"""
+Supervisor with trivial worker commands in place of live_predictor: a
+crashing worker is restarted with backoff, shutdown takes the children
+down (SIGKILL for one that ignores SIGTERM), and a bad config is rejected.
+"""
+import json
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+import supervisor
+from supervisor import Supervisor, load_config
+
+
+def crash(name, argv, model, cpus):
+    sys.exit(3)
+
+
+def idle(name, argv, model, cpus):
+    time.sleep(60)
+
+
+def stubborn(name, argv, model, cpus):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def make_supervisor(worker_main, names=("w1",)):
+    class Trivial(Supervisor):
+        def _preload(self, paths):
+            pass    # no model to share
+
+    Trivial.worker_main = staticmethod(worker_main)
+    return Trivial([{"name": name} for name in names])
+
+
+def wait_exited(w, timeout=5.0):
+    w.process.join(timeout)
+    assert not w.process.is_alive()
+
+
+def gone(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_DELAY", 0.2)
+    monkeypatch.setattr(supervisor, "STOP_TIMEOUT", 0.5)
+
+
+def test_crash_is_restarted_with_backoff(fast):
+    sup = make_supervisor(crash)
+    w = sup.workers["w1"]
+    try:
+        delays = []
+        for _ in range(3):
+            sup.reconcile()             # starts the worker
+            wait_exited(w)
+            before = time.time()
+            sup.reconcile()             # sees the crash, schedules the restart
+            assert w.process is None and w.last_exit == 3
+            assert sup.status("w1")[0]["state"] == "backoff"
+            delays.append(w.next_start - before)
+            sup.reconcile()             # still backing off: nothing started
+            assert w.process is None
+            time.sleep(max(0.0, w.next_start - time.time()))
+        assert w.restarts == 3
+        assert [round(d, 1) for d in delays] == [0.2, 0.4, 0.8]
+    finally:
+        sup.shutdown()
+
+
+def test_shutdown_kills_the_children(fast):
+    sup = make_supervisor(idle, names=("w1", "w2"))
+    sup.reconcile()
+    pids = [s["pid"] for s in sup.status()]
+    assert all(pids) and all(not gone(pid) for pid in pids)
+
+    sup.shutdown()
+    assert all(gone(pid) for pid in pids)
+    assert [s["state"] for s in sup.status()] == ["stopped", "stopped"]
+    assert [w.last_exit for w in sup.workers.values()] == [-signal.SIGTERM] * 2
+    sup.reconcile()                     # nothing comes back after shutdown
+    assert not any(w.alive() for w in sup.workers.values())
+
+
+def test_shutdown_kills_a_worker_ignoring_sigterm(fast):
+    sup = make_supervisor(stubborn)
+    sup.reconcile()
+    pid = sup.status("w1")[0]["pid"]
+    time.sleep(0.2)                     # let it install its SIG_IGN
+    sup.shutdown()
+    assert gone(pid)
+    assert sup.workers["w1"].last_exit == -signal.SIGKILL
+
+
+@pytest.mark.parametrize("config, error", [
+    ({"workers": [{"name": "a"}, {"name": "a"}]}, "duplicate worker name"),
+    ({"workers": [{"name": "a", "mode": "bogus"}]}, "invalid options"),
+    ({"workers": [{"name": "a", "no_such_option": 1}]}, "invalid options"),
+    ({"defaults": {"mode": "ring"}, "workers": []}, "no workers configured"),
+])
+def test_config_error_is_rejected(tmp_path, config, error):
+    path = tmp_path / "workers.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    with pytest.raises(ValueError, match=error):
+        load_config(str(path))
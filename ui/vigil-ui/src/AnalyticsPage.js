@@ -3,19 +3,34 @@ import './analytics.css'
 
 export default function AnalyticsPage() {
   const [anomalies, setAnomalies] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [summary, setSummary] = useState(null)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
 
   const [isExpandedCSS, setIsExpandedCSS] = useState(false)
   const [showAll, setShowAll] = useState(false)
 
+  // One page of anomalies (features included for the cards); `before` pages further back
+  async function loadPage(before) {
+    const params = new URLSearchParams({ limit: 50, fields: 'features' })
+    if (before) params.set('before', before)
+    const res = await fetch(`http://localhost:5000/api/anomalies?${params}`)
+    if (!res.ok) throw new Error(`HTTP ${res.status}`)
+    return res.json()
+  }
+
   useEffect(() => {
     async function load() {
       try {
-        const res = await fetch('http://localhost:5000/api/anomalies')
+        // Counts come pre-aggregated from the server's rollups
+        const res = await fetch('http://localhost:5000/api/anomalies/summary?unit=day')
         if (!res.ok) throw new Error(`HTTP ${res.status}`)
-        const data = await res.json()
-        setAnomalies(data)
+        setSummary(await res.json())
+
+        const data = await loadPage()
+        setAnomalies(data.items)
+        setNextCursor(data.next)
       } catch (e) {
         console.error('Fetch anomalies error:', e)
         setError(e.message)
@@ -26,6 +41,17 @@ export default function AnalyticsPage() {
     load()
   }, [])
 
+  async function loadMore() {
+    try {
+      const data = await loadPage(nextCursor)
+      setAnomalies(prev => prev.concat(data.items))
+      setNextCursor(data.next)
+    } catch (e) {
+      console.error('Fetch anomalies error:', e)
+      setError(e.message)
+    }
+  }
+
   function handleToggle() {
     if (!isExpandedCSS) {
       setShowAll(true)
@@ -44,13 +70,33 @@ export default function AnalyticsPage() {
   return (
     <div className="analytics-page">
       <h1 className="analytics-title">Anomaly Counter</h1>
+
+      {summary && (
+        <div className="anomaly-summary">
+          <p className="summary-total">
+            <strong>{summary.total}</strong> anomalies recorded
+          </p>
+          <ul className="summary-families">
+            {Object.entries(summary.counts).map(([family, count]) => (
+              <li key={family}>
+                {family}: <strong>{count}</strong>
+                {summary.percentiles[family] && (
+                  <span className="summary-p90">
+                    {' '}(p90 {(summary.percentiles[family].p90 * 100).toFixed(0)}%)
+                  </span>
+                )}
+              </li>
+            ))}
+          </ul>
+        </div>
+      )}
       <h2 className="analytics-subtitle">Past anomalies</h2>
 
       <div className={`anomaly-list ${isExpandedCSS ? 'expanded' : ''}`}>
         {shown.map((a, i) => (
           <div className="anomaly-card" key={i}>
             <div className="card-left">
-              <p><strong>Timestamp :</strong> {a.timestamp}</p>
+              <p><strong>Timestamp :</strong> {new Date(a.timestamp).toLocaleString()}</p>
               <p><strong>Label :</strong> {a.label}</p>
               <p>
                 <strong>Probability :</strong>{' '}
@@ -153,6 +199,12 @@ export default function AnalyticsPage() {
           </svg>
         </button>
       )}
+
+      {showAll && nextCursor && (
+        <button className="load-more-button" onClick={loadMore}>
+          Load older anomalies
+        </button>
+      )}
     </div>
   )
 }
@@ -5,20 +5,38 @@ import './home.css'
 export default function HomePage() {
   const [isRunning, setIsRunning] = useState(false)
   const [result, setResult]       = useState({ label: '', probability: '' })
-  const pollRef = useRef(null)
+  const streamRef = useRef(null)
 
   
+  function showPrediction(data) {
+    setResult({
+      label: data.label,
+      probability: (data.probability * 100).toFixed(1) + '%'
+    })
+  }
+
   async function fetchLatest() {
     try {
       const res = await fetch('http://localhost:5000/api/latest')
       if (!res.ok) throw new Error(`Status ${res.status}`)
-      const data = await res.json()
-      setResult({
-        label: data.label,
-        probability: (data.probability * 100).toFixed(1) + '%'
-      })
+      showPrediction(await res.json())
     } catch (err) {
-      console.error('Error polling /api/latest:', err)
+      console.error('Error fetching /api/latest:', err)
+    }
+  }
+
+  // Server pushes each new prediction; EventSource reconnects on its own
+  function openStream() {
+    const es = new EventSource('http://localhost:5000/api/stream')
+    es.onmessage = e => showPrediction(JSON.parse(e.data))
+    es.onerror = err => console.error('Error on /api/stream:', err)
+    streamRef.current = es
+  }
+
+  function closeStream() {
+    if (streamRef.current) {
+      streamRef.current.close()
+      streamRef.current = null
     }
   }
 
@@ -29,10 +47,10 @@ export default function HomePage() {
       await fetch('http://localhost:5000/api/start', { method: 'POST' })
       setIsRunning(true)
       fetchLatest()
-      pollRef.current = setInterval(fetchLatest, 1000)
+      openStream()
     } else {
       console.log('Stopping predictor...')
-      clearInterval(pollRef.current)
+      closeStream()
       await fetch('http://localhost:5000/api/stop', { method: 'POST' })
       setIsRunning(false)
     }
@@ -40,7 +58,7 @@ export default function HomePage() {
 
   
   useEffect(() => {
-    return () => clearInterval(pollRef.current)
+    return () => closeStream()
   }, [])
 
   return (